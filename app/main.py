@@ -1,28 +1,58 @@
 from typing import Annotated
+from contextlib import asynccontextmanager
+import asyncio
 import os
-from fastapi import Depends, FastAPI, File, UploadFile, Request
+from fastapi import Depends, FastAPI, File, HTTPException, UploadFile, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from dbConfig.database import SessionLocal as session
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from dbConfig.database import close_request_db, get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text
 
-import hashlib, uuid
+import hashlib, hmac, uuid
+from datetime import datetime
 from models.schema import FileInfoCreate ,UserBase ,FileInfo
 from database_model.database_model import file_info as file_data
+from app.services.metrics import HTTP_REQUEST_SECONDS, render_metrics
 
 import time
 
 
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+     from app.routes.auth import supabase, token_verifier
+     from app.services.org_stats import STATS_RECONCILE_INTERVAL, reconcile_forever
+     from app.services.upload_sessions import UPLOAD_GC_INTERVAL, collect_forever
+     from app.services.audit_log import audit_log
+     from app.services.file_analytics import analytics
+     from app.services.content_extraction import content_extractor
+     from app.services.preview_generation import preview_generator
+     from app.services.chunk_store import CHUNK_GC_INTERVAL, collect_chunks_forever
+     await token_verifier.start()
+     await audit_log.start()
+     await analytics.start()
+     await content_extractor.start()
+     await preview_generator.start()
+     reconcile_task = asyncio.create_task(reconcile_forever(STATS_RECONCILE_INTERVAL))
+     upload_gc_task = asyncio.create_task(collect_forever(UPLOAD_GC_INTERVAL))
+     chunk_gc_task = asyncio.create_task(collect_chunks_forever(CHUNK_GC_INTERVAL))
+     yield
+     reconcile_task.cancel()
+     upload_gc_task.cancel()
+     chunk_gc_task.cancel()
+     await audit_log.stop()
+     await analytics.stop()
+     await content_extractor.stop()
+     await preview_generator.stop()
+     await token_verifier.stop()
+     await supabase.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
-def get_db():
-     db = session()
-     try:
-          yield db
-     finally:
-          db.close()
 #adding  middleware for CORS
 frontend_origin = os.getenv("FRONTEND_ORIGIN", "http://localhost:5173")
 app.add_middleware(
@@ -31,31 +61,52 @@ app.add_middleware(
     allow_credentials=True,
      allow_methods=["*"],
     allow_headers=["*"],
+    # Resumable uploads report progress in these headers.
+    expose_headers=["Upload-Offset", "Upload-Length"],
 )
 
 #adding middleware for database session management
 @app.middleware("http")
 async def db_session_middleware(request, call_next):
-    request.state.db = session()
-    response = await call_next(request)
-    request.state.db.close()
-    return response
+    try:
+        return await call_next(request)
+    finally:
+        await close_request_db(request)
 #adding middleware for response time
 @app.middleware("http")
 async def compression_middleware(request : Request, call_next):
      start_time = time.perf_counter()
-     response = await call_next(request)
-     process_time = time.perf_counter() - start_time
+     status = 500
+     try:
+          response = await call_next(request)
+          status = response.status_code
+     finally:
+          process_time = time.perf_counter() - start_time
+          # Label by route template, not the raw path, so ids don't explode the series count.
+          route = request.scope.get("route")
+          HTTP_REQUEST_SECONDS.labels(
+               request.method, route.path if route else "unmatched", str(status)
+          ).observe(process_time)
      response.headers["X-Process-Time"] = str(process_time) 
     
      return response
 
+#prometheus metrics, optionally protected by METRICS_TOKEN
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+     if METRICS_TOKEN:
+          auth_header = request.headers.get("authorization", "")
+          if not hmac.compare_digest(auth_header, f"Bearer {METRICS_TOKEN}"):
+               raise HTTPException(status_code=401, detail="Invalid metrics token")
+     body, content_type = render_metrics()
+     return Response(content=body, media_type=content_type)
+
 #test database connection with the api route
 @app.get("/DBtest")
-async def init_api(db:Session=Depends(get_db)):
+async def init_api(db:AsyncSession=Depends(get_db)):
      
      try:
-          result = db.execute(text("SELECT current_database()"))
+          result = await db.execute(text("SELECT current_database()"))
           db_name = result.scalar()
           return{"Database connected successfully" : db_name}
      except Exception as e:
@@ -67,7 +118,7 @@ async def init_api(db:Session=Depends(get_db)):
 @app.post("/uploadfile/",response_model=FileInfoCreate)
 async def create_upload_file (
      file: UploadFile = File(...),
-     db:Session=Depends(get_db)
+     db:AsyncSession=Depends(get_db)
      
      ):
 
@@ -87,15 +138,15 @@ async def create_upload_file (
      )
 
      db.add(db_file)
-     db.commit()
-     db.refresh(db_file)
+     await db.commit()
+     await db.refresh(db_file)
      return db_file
 
 
 
 #routes for create a new user
 @app.post("/createuser/",response_model=UserBase)
-async def create_user(db:Session=Depends(get_db)):
+async def create_user(db:AsyncSession=Depends(get_db)):
      from database_model.database_model import user as user_data
      new_user = user_data(
           user_id=uuid.uuid4(),
@@ -103,46 +154,46 @@ async def create_user(db:Session=Depends(get_db)):
           user_name="Sudipta Sarkar",
           user_email="abc@zoho.in",
           u_role="admin",
-          joined_at="now()",
+          joined_at=datetime.utcnow(),
           is_active=True
      )
 
      db.add( new_user)
-     db.commit()
-     db.refresh(new_user)
+     await db.commit()
+     await db.refresh(new_user)
      return  new_user
      
    #routes for create a new organization
 @app.post("/createorg/")
-async def create_org(db:Session=Depends(get_db)):
+async def create_org(db:AsyncSession=Depends(get_db)):
      from database_model.database_model import organization as org_data
      new_org = org_data(
           org_id=uuid.uuid4(),
           org_name="InnovateX.com",
           domain_name="@innovatex.com",
           plan_id=uuid.uuid4(),
-          created_at="now()",
+          created_at=datetime.utcnow(),
           storage_limit="50 GB"
      )
 
      db.add( new_org)
-     db.commit()
+     await db.commit()
      print("Organization created successfully")
-     db.refresh(new_org)
+     await db.refresh(new_org)
      return  new_org
 #route to get all files data
 @app.get("/getfilesdata/",response_model=list[FileInfo])
-async def get_files_data(db:Session=Depends(get_db)):
-     files = db.query(file_data).all()
+async def get_files_data(db:AsyncSession=Depends(get_db)):
+     files = (await db.execute(select(file_data))).scalars().all()
      if not files:
           return "No files found"
      else:
           return files
 #route for fetch single user data 
 @app.get("/getUserData/{user_id}",response_model=list[UserBase])
-async def get_users_data (user_id:Annotated[uuid.UUID,None],db:Session=Depends(get_db)):
+async def get_users_data (user_id:Annotated[uuid.UUID,None],db:AsyncSession=Depends(get_db)):
      from database_model.database_model import user as user_data
-     userinfo = db.query(user_data).all()
+     userinfo = (await db.execute(select(user_data))).scalars().all()
      if not userinfo:
           return "no files found"
      else:
@@ -152,7 +203,7 @@ async def get_users_data (user_id:Annotated[uuid.UUID,None],db:Session=Depends(g
 #route for create a new plan
 from models.schema import Plan,PlanCreate
 @app.post("/createplan/",response_model=PlanCreate)
-async def create_plan(db:Session=Depends(get_db)):
+async def create_plan(db:AsyncSession=Depends(get_db)):
      from database_model.database_model import plan as plan_data
      new_plan = plan_data(
           plan_id=uuid.uuid4(),
@@ -163,16 +214,16 @@ async def create_plan(db:Session=Depends(get_db)):
           ai_feature=["Basic AI Integration"]
      )
      db.add( new_plan)
-     db.commit()
+     await db.commit()
      print("Plan created successfully")
-     db.refresh(new_plan)
+     await db.refresh(new_plan)
      return  new_plan
 
 #route for fetching all  plan data
 @app.get("/getplandata/",response_model=list[Plan])
-async def get_plans_data (db:Session=Depends(get_db)):
+async def get_plans_data (db:AsyncSession=Depends(get_db)):
      from database_model.database_model import plan as plan_data
-     planinfo = db.query(plan_data).all()
+     planinfo = (await db.execute(select(plan_data))).scalars().all()
      if not planinfo:
           return "no files found"
      else:
@@ -181,126 +232,127 @@ async def get_plans_data (db:Session=Depends(get_db)):
 #create subscription route
 from models.schema import SubscriptionBase ,SubscriptionCreate
 @app.post("/createsubscription/",response_model=SubscriptionCreate)
-async def create_subscription(db:Session=Depends(get_db)):
+async def create_subscription(db:AsyncSession=Depends(get_db)):
      from database_model.database_model import subscription as sub_data
      new_sub = sub_data(
           subscrip_id=uuid.uuid4(),
           org_id="3a833e58-514c-4643-bdff-1a3532e2f830",
           plan_id="8b7ef5d4-4182-4586-a819-596b217acf89",
-          start_date="2024-06-01 00:00:00",
-          end_date="2025-06-01 00:00:00",
+          start_date=datetime(2024, 6, 1),
+          end_date=datetime(2025, 6, 1),
           status="active"
      )
      db.add( new_sub)
-     db.commit()
+     await db.commit()
      print("Subscription created successfully")
-     db.refresh(new_sub)
+     await db.refresh(new_sub)
      return  new_sub
 
 #route for create activity log
 from models.schema import ActivityLogBase ,ActivityLogCreate
 @app.post("/createactivitylog/",response_model=ActivityLogCreate)
-async def create_activity_log(db:Session=Depends(get_db)):
+async def create_activity_log(db:AsyncSession=Depends(get_db)):
      from database_model.database_model import activity_log as log_data
      new_log = log_data(
           log_id=uuid.uuid4(),
           user_id="d05215f1-63be-49b9-8188-b6bf59e8b540",
           file_id="09c99e53-af45-4bdd-a90f-9150d9653fe9",
           action_log="File uploaded successfully",
-          log_time="2024-06-15 10:30:00",
+          log_time=datetime(2024, 6, 15, 10, 30),
           ip_add="192.168.1.1",
           descrp="File uploaded successfully"
      )
      db.add( new_log)
-     db.commit()
+     await db.commit()
      print("Activity log created successfully")
-     db.refresh(new_log)
+     await db.refresh(new_log)
      return  new_log
 
 #route for store or create file metadata
 from models.schema import FileMetadataBase ,FileMetadataCreate
 @app.post("/createfilemetadata/",response_model=FileMetadataCreate)
-async def create_file_metadata(db:Session=Depends(get_db)):
+async def create_file_metadata(db:AsyncSession=Depends(get_db)):
      from database_model.database_model import file_metadata as md_data
      new_md = md_data(
           version_id=uuid.uuid4(),
           file_id="09c99e53-af45-4bdd-a90f-9150d9653fe9",
           ver_no=1,
           storage_path="local/v1/file.txt",
-          created_at="2024-06-15 10:30:00",
+          created_at=datetime(2024, 6, 15, 10, 30),
           changelog="File uploaded successfully"
      )
      db.add( new_md)
-     db.commit()
+     await db.commit()
      print("File metadata created successfully")
-     db.refresh(new_md)
+     await db.refresh(new_md)
      return  new_md 
 
 #route for file analytics
 from models.schema import FileAnalyticsBase ,FileAnalyticsCreate
 @app.post("/createfileanalytics/",response_model=FileAnalyticsCreate)
-async def create_file_analytics(db:Session=Depends(get_db)):
+async def create_file_analytics(db:AsyncSession=Depends(get_db)):
      from database_model.database_model import file_analytics as anly_data
      new_anly = anly_data(
           anly_id=uuid.uuid4(),
           file_id="09c99e53-af45-4bdd-a90f-9150d9653fe9",
           view_count=150,
           download_count=100,
-          last_accesed="2024-06-15 10:30:00",
+          last_accesed=datetime(2024, 6, 15, 10, 30),
           unique_users=1000
      )
      db.add( new_anly)
-     db.commit()
+     await db.commit()
      print("File analytics created successfully")
-     db.refresh(new_anly)
+     await db.refresh(new_anly)
      return  new_anly
 
 #route for create file access
 from models.schema import FileAccessBase ,FileAccessCreate
 @app.post("/createfileaccess/",response_model=FileAccessCreate)
-async def create_file_access(db:Session=Depends(get_db)):   
+async def create_file_access(db:AsyncSession=Depends(get_db)):   
      from database_model.database_model import file_access as access_data
      new_access = access_data(
           acces_id=uuid.uuid4(),
           file_id="09c99e53-af45-4bdd-a90f-9150d9653fe9",
           access_type="private",
           shared_with="d05215f1-63be-49b9-8188-b6bf59e8b540",
-          expiry_date="2024-12-31 23:59:59",
+          expiry_date=datetime(2024, 12, 31, 23, 59, 59),
           max_download=5,
           pwd_protect=True,
           access_status="Active"
      )
      db.add( new_access)
-     db.commit()
+     await db.commit()
      print("File access created successfully")
-     db.refresh(new_access)
+     await db.refresh(new_access)
      return  new_access
 
 #route for create embedded data indexing
 from models.schema import EmbeddedDataBase ,EmbeddedDataCreate
 @app.post("/createembeddeddata/",response_model=EmbeddedDataCreate)
-async def create_embedded_data(db:Session=Depends(get_db)):
+async def create_embedded_data(db:AsyncSession=Depends(get_db)):
      from database_model.database_model import embedded_data as embed_data
      new_embed = embed_data(
           embed_id=uuid.uuid4(),
           file_id="09c99e53-af45-4bdd-a90f-9150d9653fe9",
           vector_data={"embedding": [0.1, 0.2, 0.3]},
           model_used="text-embedding-ada-002",
-          created_at="2024-06-15 10:30:00"
+          created_at=datetime(2024, 6, 15, 10, 30)
      )
      db.add( new_embed)
-     db.commit()
+     await db.commit()
      print("Embedded data created successfully")
-     db.refresh(new_embed)
+     await db.refresh(new_embed)
      return  new_embed
 
 
 # ============================================
 # Include API Routers
 # ============================================
-from app.routes import files, auth, user, system
+from app.routes import files, auth, user, system, search
 
 app.include_router(files.router)
 app.include_router(auth.router)
 app.include_router(user.router)
 app.include_router(system.router)
+app.include_router(search.router)
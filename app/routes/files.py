@@ -1,44 +1,209 @@
 import os
+import base64
+import binascii
 import hashlib
+import mimetypes
 import uuid
-import boto3
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
-from sqlalchemy.orm import Session
+from datetime import datetime
+from fastapi import APIRouter, Depends, File, Form, Header, UploadFile, HTTPException, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from typing import Annotated, Literal
+from sqlalchemy import and_, any_, case, delete, func, literal, or_, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from dbConfig.database import SessionLocal
+from dbConfig.database import get_db
 from database_model.database_model import file_info as file_data
 from database_model.database_model import user as user_data
+from database_model.database_model import upload_part, upload_session
+from database_model.database_model import file_analytics as analytics_data
+from database_model.database_model import content_metadata as meta_data
+from database_model.database_model import file_metadata as file_md
+from database_model.database_model import derived_asset
 from app.routes.auth import get_current_user
+from app.services.object_refs import (
+    content_key,
+    find_object,
+    lock_object,
+    lock_objects,
+    unreferenced,
+    uuid_array,
+)
+from app.services.org_stats import apply_file_delta
+from app.services.quota import add_usage, check_quota, release, reservation, reserve
+from app.services.audit_log import audit_log
+from app.services.chunking import CHUNK_MAX_SIZE, Chunker, chunk_hash
+from app.services.chunk_store import (
+    chunk_paths,
+    iter_version,
+    missing_chunks,
+    reference_chunks,
+    release_versions,
+    store_chunk,
+)
+from app.services.file_analytics import analytics
+from app.services.http_ranges import checksum_etag, content_disposition, is_active_type, object_response
+from app.services.content_extraction import content_extractor
+from app.services.preview_generation import drop_previews, preview_generator
+from app.services.previews import PREVIEW_SIZES
+from app.services.metrics import UPLOAD_BYTES
+from app.services.upload_sessions import discard_upload, forget_parts
+from app.services.url_cache import SignedUrlCache
+from app.services.vector_index import vector_index
+from app.services.zip_stream import zip_stream
+from app.services.storage import (
+    LocalStorage,
+    StorageBackend,
+    get_storage,
+    storage_for,
+    verify_object_signature,
+)
 
 router = APIRouter(prefix="/api/files", tags=["Files"])
 
-AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
-S3_BUCKET = os.getenv("AWS_S3_BUCKET")
 MAX_NORMAL_USER_UPLOAD_BYTES = 1 * 1024 * 1024 * 1024
+# S3 multipart parts must be at least 5 MB (except the last one).
+UPLOAD_PART_SIZE = max(int(os.getenv("UPLOAD_PART_SIZE", 8 * 1024 * 1024)), 5 * 1024 * 1024)
+# Signed URLs are reused while they have at least SIGNED_URL_MIN_TTL seconds
+# left; hot files get longer-lived URLs, up to SIGNED_URL_MAX_EXPIRES_IN.
+signed_urls = SignedUrlCache(
+    expires_in=int(os.getenv("SIGNED_URL_EXPIRES_IN", 300)),
+    max_expires_in=int(os.getenv("SIGNED_URL_MAX_EXPIRES_IN", 3600)),
+    min_remaining=int(os.getenv("SIGNED_URL_MIN_TTL", 60)),
+    hot_hits=int(os.getenv("SIGNED_URL_HOT_HITS", 5)),
+)
+# S3 caps a multipart upload at 10,000 parts.
+MAX_UPLOAD_PARTS = 10000
+# Lifetime of presigned upload URLs handed to the browser.
+UPLOAD_URL_EXPIRES_IN = int(os.getenv("UPLOAD_URL_EXPIRES_IN", 3600))
+MAX_BATCH_SIZE = 1000
+# Largest archive download, in files and in bytes; bigger ones return 413.
+ARCHIVE_MAX_FILES = int(os.getenv("ARCHIVE_MAX_FILES", 10000))
+ARCHIVE_MAX_BYTES = int(os.getenv("ARCHIVE_MAX_BYTES", 50 * 1024 ** 3))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# pg_trgm word_similarity needed for a typo-tolerant match (0..1).
+SEARCH_SIMILARITY_THRESHOLD = float(os.getenv("SEARCH_SIMILARITY_THRESHOLD", 0.4))
+# Chunks in one version manifest; at up to 4 MB each, well past the upload limit.
+MAX_VERSION_CHUNKS = 10000
 
-if not S3_BUCKET:
-    raise RuntimeError("AWS_S3_BUCKET must be set.")
+ChunkHash = Annotated[str, Field(pattern="^[0-9a-f]{64}$")]
 
 
-def get_db():
-    db = SessionLocal()
+class FileIdsPayload(BaseModel):
+    file_ids: list[uuid.UUID] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class BatchUrlsPayload(FileIdsPayload):
+    disposition: Literal["inline", "attachment"] = "attachment"
+
+
+class BatchPreviewsPayload(FileIdsPayload):
+    size: int = PREVIEW_SIZES[0]
+
+
+class UploadInitiatePayload(BaseModel):
+    filename: str = Field(..., min_length=1)
+    content_type: str = "application/octet-stream"
+    size: int = Field(..., ge=0)
+    sha256: str | None = Field(None, pattern="^[0-9a-f]{64}$")
+
+
+class UploadedPart(BaseModel):
+    part_number: int = Field(..., ge=1, le=MAX_UPLOAD_PARTS)
+    etag: str
+
+
+class UploadCompletePayload(BaseModel):
+    parts: list[UploadedPart] = []
+
+
+class ChunkHashesPayload(BaseModel):
+    chunks: list[ChunkHash] = Field(..., min_length=1, max_length=MAX_VERSION_CHUNKS)
+
+
+class VersionCommitPayload(BaseModel):
+    chunks: list[ChunkHash] = Field(..., max_length=MAX_VERSION_CHUNKS)
+    changelog: str = Field("", max_length=2000)
+
+
+# Only the columns _serialize_file needs, so listing skips full ORM objects.
+FILE_LIST_COLUMNS = (
+    file_data.file_id,
+    file_data.filename,
+    file_data.file_type,
+    file_data.file_size,
+    file_data.uploaded_at,
+    file_data.storage_path,
+    user_data.user_name.label("owner_name"),
+)
+
+
+def _encode_cursor(uploaded_at: datetime, file_id) -> str:
+    raw = f"{uploaded_at.isoformat()}|{file_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
     try:
-        yield db
-    finally:
-        db.close()
-
-
-def _s3_client():
-    if not AWS_ACCESS_KEY_ID or not AWS_SECRET_ACCESS_KEY:
-        raise HTTPException(status_code=500, detail="AWS credentials not configured")
-    return boto3.client(
-        "s3",
-        region_name=AWS_REGION,
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        uploaded_at, file_id = raw.split("|", 1)
+        return datetime.fromisoformat(uploaded_at), uuid.UUID(file_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# Filename search backed by the pg_trgm GIN index on file_data.filename.
+# Substring matches (ILIKE) and fuzzy word matches (<%) can both use the
+# index. Results rank exact > prefix > substring > fuzzy, then by similarity.
+async def _filename_search(stmt, db: AsyncSession, term: str):
+    pattern = _escape_like(term)
+    matches = [file_data.filename.ilike(f"%{pattern}%", escape="\\")]
+    tier = case(
+        (func.lower(file_data.filename) == term.lower(), 3),
+        (file_data.filename.ilike(f"{pattern}%", escape="\\"), 2),
+        (file_data.filename.ilike(f"%{pattern}%", escape="\\"), 1),
+        else_=0,
     )
+    ranking = [tier.desc()]
+    # Trigrams need at least three characters to say anything useful.
+    if len(term) >= 3:
+        await db.execute(
+            text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+            {"threshold": str(SEARCH_SIMILARITY_THRESHOLD)},
+        )
+        matches.append(literal(term).op("<%")(file_data.filename))
+        ranking.append(func.word_similarity(term, file_data.filename).desc())
+    return stmt.where(or_(*matches)).order_by(*ranking, file_data.uploaded_at.desc())
+
+
+# Names of files inside an archive: path separators and control characters
+# replaced, and repeats numbered ("a.txt", "a (2).txt") case-insensitively.
+def _archive_names(filenames: list[str]) -> list[str]:
+    taken = set()
+    names = []
+    for filename in filenames:
+        name = "".join("_" if ch in "/\\" or ord(ch) < 32 else ch for ch in filename or "").strip()
+        if name in ("", ".", ".."):
+            name = "file"
+        stem, dot, extension = name.rpartition(".")
+        if not stem:
+            stem, dot, extension = name, "", ""
+        candidate = name
+        n = 1
+        while candidate.lower() in taken:
+            n += 1
+            candidate = f"{stem} ({n}){dot}{extension}"
+        taken.add(candidate.lower())
+        names.append(candidate)
+    return names
 
 
 def _serialize_file(file: file_data, owner_name: str | None = None) -> dict:
@@ -53,38 +218,297 @@ def _serialize_file(file: file_data, owner_name: str | None = None) -> dict:
     }
 
 
-async def _upload_to_storage(storage_path: str, content: bytes, content_type: str):
-    client = _s3_client()
-    client.put_object(
-        Bucket=S3_BUCKET,
-        Key=storage_path,
-        Body=content,
-        ContentType=content_type or "application/octet-stream",
+def _upload_size_limit(current_user) -> int | None:
+    user_name = (current_user.get("user_name") or "").strip().lower()
+    return None if user_name.startswith("sudipta") else MAX_NORMAL_USER_UPLOAD_BYTES
+
+
+def _check_upload_size(current_user, size: int):
+    size_limit = _upload_size_limit(current_user)
+    if size_limit is not None and size > size_limit:
+        raise HTTPException(status_code=413, detail="Normal users can upload files up to 1 GB only.")
+
+
+# Part size for a multipart upload of `size` bytes, within S3's part limit.
+def _part_size_for(size: int) -> int:
+    return max(UPLOAD_PART_SIZE, -(-size // MAX_UPLOAD_PARTS))
+
+
+# Inserts the file_data row for an object and bumps the org counters. The
+# object lock keeps a concurrent delete of the last reference from removing
+# the object under us; callers check it still exists before committing.
+# `checksum` is the content's sha256, or None when no verified digest exists.
+async def _add_file_row(db: AsyncSession, current_user, filename: str, file_type: str | None, file_size: int, checksum: str | None, storage_path: str) -> file_data:
+    db_file = file_data(
+        owner_id=current_user["user_id"],
+        org_id=current_user["org_id"],
+        filename=filename,
+        storage_path=storage_path,
+        file_type=file_type,
+        file_size=file_size,
+        checksum=checksum,
+        is_deleted=False
     )
+    await lock_object(db, storage_path)
+    db.add(db_file)
+    await apply_file_delta(db, current_user["org_id"], file_type, 1, file_size)
+    await db.flush()
+    return db_file
 
 
-async def _delete_from_storage(storage_path: str):
-    client = _s3_client()
-    client.delete_object(Bucket=S3_BUCKET, Key=storage_path)
+async def _get_pending_upload(db: AsyncSession, session_id: uuid.UUID, current_user) -> upload_session:
+    session = (await db.execute(select(upload_session).where(
+        upload_session.session_id == session_id,
+        upload_session.owner_id == current_user["user_id"],
+        upload_session.org_id == current_user["org_id"],
+    ).with_for_update())).scalar()
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if session.status != "pending":
+        raise HTTPException(status_code=409, detail=f"Upload is already {session.status}")
+    return session
 
 
-async def _create_signed_url(
+# Records a new file for content the org already stores, given the sha256 a
+# client computed. Returns None when there is nothing to reuse.
+async def _record_duplicate(db: AsyncSession, current_user, payload) -> dict | None:
+    storage_path = await find_object(db, current_user["org_id"], payload.sha256) if payload.sha256 else None
+    if storage_path is None:
+        return None
+    content_type = payload.content_type or "application/octet-stream"
+    db_file = await _add_file_row(db, current_user, payload.filename, content_type, payload.size, payload.sha256, storage_path)
+    # Nothing was reserved for it: reused content still counts against the quota.
+    await check_quota(db, current_user["org_id"])
+    head = await storage_for(storage_path).head(storage_path)
+    if head is None or head["size"] != payload.size:
+        await db.rollback()
+        return None
+    await db.commit()
+    await db.refresh(db_file)
+    return _serialize_file(db_file, current_user.get("user_name"))
+
+
+# Bytes of a resumable upload stored so far: the contiguous run of parts
+# from part 1. Resuming always restarts at a part boundary.
+async def _resumable_offset(db: AsyncSession, session_id) -> tuple[int, list]:
+    parts = (await db.execute(
+        select(upload_part.part_number, upload_part.etag, upload_part.part_size).where(
+            upload_part.session_id == session_id
+        ).order_by(upload_part.part_number)
+    )).all()
+    offset = 0
+    stored = []
+    for part in parts:
+        if part.part_number != len(stored) + 1:
+            break
+        offset += part.part_size
+        stored.append(part)
+    return offset, stored
+
+
+def _offset_headers(session: upload_session, offset: int) -> dict:
+    return {"Upload-Offset": str(offset), "Upload-Length": str(session.file_size), "Cache-Control": "no-store"}
+
+
+# First pass over the spooled upload: size check and sha256, before any byte
+# leaves the worker, so a duplicate never reaches storage.
+async def _hash_upload(upload_file: UploadFile, size_limit: int | None) -> tuple[int, str]:
+    checksum = hashlib.sha256()
+    size = 0
+    while chunk := await upload_file.read(UPLOAD_PART_SIZE):
+        size += len(chunk)
+        if size_limit is not None and size > size_limit:
+            raise HTTPException(status_code=413, detail="Normal users can upload files up to 1 GB only.")
+        checksum.update(chunk)
+    await upload_file.seek(0)
+    return size, checksum.hexdigest()
+
+
+async def _stream_to_storage(
+    upload_file: UploadFile,
+    storage: StorageBackend,
     storage_path: str,
-    expires_in: int = 60,
-    filename: str | None = None,
-    disposition: str | None = None,
-) -> str:
-    client = _s3_client()
-    params = {"Bucket": S3_BUCKET, "Key": storage_path}
-    if filename and disposition:
-        params["ResponseContentDisposition"] = f'{disposition}; filename="{filename}"'
-    return client.generate_presigned_url(
-        "get_object",
-        Params=params,
-        ExpiresIn=expires_in,
+    content_type: str,
+):
+    await upload_file.seek(0)
+    chunk = await upload_file.read(UPLOAD_PART_SIZE)
+
+    # Small files fit in a single part, so skip the multipart round trips.
+    if len(chunk) < UPLOAD_PART_SIZE:
+        await storage.put(storage_path, chunk, content_type)
+        return
+
+    upload_id = await storage.create_multipart(storage_path, content_type)
+    parts = []
+    try:
+        while chunk:
+            part_number = len(parts) + 1
+            etag = await storage.upload_part(storage_path, upload_id, part_number, chunk)
+            parts.append({"PartNumber": part_number, "ETag": etag})
+            chunk = await upload_file.read(UPLOAD_PART_SIZE)
+        await storage.complete_multipart(storage_path, upload_id, parts)
+    except BaseException:
+        await storage.abort_multipart(storage_path, upload_id)
+        raise
+
+
+# Rows created by the legacy /uploadfile/ route are marked "local" but never had
+# their bytes stored anywhere.
+def _stored_object(file: file_data) -> str | None:
+    storage_path = (file.storage_path or "").strip()
+    if not storage_path or storage_path == "local":
+        return None
+    return storage_path
+
+
+# Queues an actv_log event; written in batches by the audit log writer.
+async def _audit(request: Request, current_user, action: str, file_id, description: str | None = None):
+    ip_address = request.client.host if request.client else None
+    await audit_log.record(current_user["user_id"], action, file_id, ip_address, description)
+
+
+async def _signed_url(storage_path: str, filename: str, disposition: str) -> str:
+    async def sign(expires_in: int) -> str:
+        return await storage_for(storage_path).signed_url(storage_path, expires_in, filename, disposition)
+    return await signed_urls.get_or_sign(storage_path, disposition, filename, sign)
+
+
+# Streams a stored object with Range/ETag support. Content-addressed objects
+# never change, so their checksum makes a stable ETag; objects reached by key
+# use the backend's own. Types that would run script on the API origin are
+# always downloaded, whatever disposition was asked for.
+async def _object_response(request: Request, storage_path: str, checksum: str | None = None, head_etag: bool = False,
+                           filename: str = "", disposition: str = "attachment", media_type: str | None = None):
+    storage = storage_for(storage_path)
+    head = await storage.head(storage_path)
+    if head is None:
+        raise HTTPException(status_code=404, detail="File is not available in storage")
+    media_type = media_type or head["content_type"] or mimetypes.guess_type(filename or storage_path)[0] or "application/octet-stream"
+    if is_active_type(media_type):
+        disposition = "attachment"
+    headers = {"Cache-Control": "private, no-cache"}
+    if filename:
+        headers["Content-Disposition"] = content_disposition(disposition, filename)
+    elif disposition == "attachment":
+        headers["Content-Disposition"] = "attachment"
+
+    def read(start: int, length: int):
+        return storage.iter_range(storage_path, start, length)
+
+    return object_response(
+        request,
+        head["size"],
+        head["etag"] if head_etag else checksum_etag(checksum),
+        media_type,
+        read,
+        headers,
+        local_path=storage.path_for(storage_path) if isinstance(storage, LocalStorage) else None,
     )
 
 
+# Soft-deletes the given files in one UPDATE, keeps the org counters in step
+# and removes objects whose last live reference went away.
+async def _delete_files(db: AsyncSession, org_id, file_ids: list[uuid.UUID]) -> list:
+    live = (
+        file_data.file_id == any_(uuid_array("file_ids", file_ids)),
+        file_data.org_id == org_id,
+        file_data.is_deleted == False,
+    )
+    storage_paths = [_stored_object(row) for row in await db.execute(select(file_data.storage_path).where(*live))]
+    await lock_objects(db, filter(None, storage_paths))
+    deleted = (await db.execute(
+        update(file_data).where(*live).values(is_deleted=True).returning(
+            file_data.file_id, file_data.storage_path, file_data.file_type, file_data.file_size, file_data.checksum
+        )
+    )).all()
+
+    deltas = {}
+    for row in deleted:
+        count, size = deltas.get(row.file_type, (0, 0))
+        deltas[row.file_type] = (count - 1, size - row.file_size)
+    # Their chunks are collected once no other version uses them. Released
+    # before the counters so chunk rows are locked ahead of the quota row, as
+    # when a version is added.
+    await release_versions(db, org_id, [row.file_id for row in deleted])
+    for file_type, (count, size) in deltas.items():
+        await apply_file_delta(db, org_id, file_type, count, size)
+    # Drop extracted content so deleted files leave the content search index.
+    await db.execute(delete(meta_data).where(
+        meta_data.file_id == any_(uuid_array("deleted_ids", [row.file_id for row in deleted]))
+    ))
+    await drop_previews(db, org_id, [row.checksum for row in deleted])
+    await db.flush()
+
+    orphaned = await unreferenced(db, filter(None, (_stored_object(row) for row in deleted)))
+    by_backend = {}
+    for storage_path in orphaned:
+        by_backend.setdefault(storage_for(storage_path), []).append(storage_path)
+    for storage, keys in by_backend.items():
+        await storage.delete_many(keys)
+    await db.commit()
+    for row in deleted:
+        if row.storage_path:
+            signed_urls.invalidate(row.storage_path)
+    vector_index.remove_files(org_id, [row.file_id for row in deleted])
+    return deleted
+
+
+def _serialize_version(ver_no: int, file_size: int | None, created_at: datetime | None, changelog: str | None) -> dict:
+    return {"ver_no": ver_no, "file_size": file_size, "created_at": created_at, "changelog": changelog}
+
+
+async def _require_file(db: AsyncSession, file_id: uuid.UUID, current_user, for_update: bool = False):
+    stmt = select(
+        file_data.file_id,
+        file_data.filename,
+        file_data.file_type,
+        file_data.file_size,
+        file_data.storage_path,
+        file_data.checksum,
+        file_data.uploaded_at,
+    ).where(
+        file_data.file_id == file_id,
+        file_data.org_id == current_user["org_id"],
+        file_data.is_deleted == False,
+    )
+    file = (await db.execute(stmt.with_for_update() if for_update else stmt)).first()
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+    return file
+
+
+# Records a version made of already stored chunks. The original upload is
+# version 1; the file row lock gives concurrent versions distinct numbers.
+async def _add_version(db: AsyncSession, request: Request, current_user, file_id: uuid.UUID, hashes: list[str], changelog: str) -> dict:
+    file = await _require_file(db, file_id, current_user, for_update=True)
+    try:
+        manifest = await reference_chunks(db, current_user["org_id"], hashes)
+    except LookupError as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail={"message": "Some chunks are not stored", "missing": e.args[0]})
+    file_size = sum(size for _, size in manifest)
+    _check_upload_size(current_user, file_size)
+    await add_usage(db, current_user["org_id"], file_size)
+    await check_quota(db, current_user["org_id"])
+    ver_no = (await db.execute(
+        select(func.coalesce(func.max(file_md.ver_no), 1) + 1).where(file_md.file_id == file_id)
+    )).scalar()
+    version = file_md(
+        file_id=file_id,
+        ver_no=ver_no,
+        # The bytes live in the chunk store; the manifest says where.
+        storage_path="chunks",
+        created_at=datetime.utcnow(),
+        changelog=changelog,
+        chunks=manifest,
+        file_size=file_size,
+    )
+    db.add(version)
+    await db.commit()
+    await _audit(request, current_user, "version", file_id, f"{file.filename} v{ver_no}")
+    return _serialize_version(ver_no, file_size, version.created_at, changelog)
+
+
 def _try_get_upload_size_bytes(upload_file: UploadFile) -> int | None:
     try:
         upload_file.file.seek(0, os.SEEK_END)
@@ -95,139 +519,784 @@ def _try_get_upload_size_bytes(upload_file: UploadFile) -> int | None:
         return None
 
 
-# 1. GET /api/files - Fetch all uploaded files
+# GET /api/files/objects/{key} - Serve objects from backends without native
+# presigned URLs (local disk, in-memory). Authorised by the URL signature.
+@router.get("/objects/{key:path}")
+async def get_signed_object(key: str, expires: int, signature: str, request: Request, disposition: str = "", filename: str = ""):
+    if not verify_object_signature(key, expires, disposition, filename, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired link")
+    return await _object_response(request, key, head_etag=True, filename=filename, disposition=disposition or "inline")
+
+
+# 26. GET /api/files/archive - Download many files as one streamed ZIP
+# Takes file_ids (repeated, up to 1000) or a filename search; with neither,
+# exports every file in the org. Declared before /{file_id} so "archive" is
+# not read as an id.
+@router.get("/archive")
+async def download_archive(
+    request: Request,
+    file_ids: list[uuid.UUID] | None = Query(None, max_length=MAX_BATCH_SIZE),
+    search: str | None = None,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    stmt = select(
+        file_data.file_id, file_data.filename, file_data.storage_path, file_data.file_size, file_data.uploaded_at
+    ).where(
+        file_data.org_id == current_user["org_id"],
+        file_data.is_deleted == False,
+    )
+    if file_ids:
+        stmt = stmt.where(file_data.file_id == any_(uuid_array("file_ids", file_ids))).order_by(file_data.filename, file_data.file_id)
+    elif (search or "").strip():
+        stmt = await _filename_search(stmt, db, search.strip())
+    else:
+        stmt = stmt.order_by(file_data.uploaded_at, file_data.file_id)
+    # Resolved before streaming: the request's session closes with the response.
+    # One row past the cap is enough to know the archive is too large.
+    rows = [row for row in await db.execute(stmt.limit(ARCHIVE_MAX_FILES + 1)) if _stored_object(row)]
+    if not rows:
+        raise HTTPException(status_code=404, detail="No files to download")
+    if len(rows) > ARCHIVE_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Archives are limited to {ARCHIVE_MAX_FILES} files")
+    if sum(row.file_size or 0 for row in rows) > ARCHIVE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Archives are limited to {ARCHIVE_MAX_BYTES} bytes")
+
+    # Recorded once the archive has been sent, in batches.
+    async def record_downloads():
+        for row in rows:
+            analytics.record(row.file_id, current_user["user_id"], download=True)
+        ip_address = request.client.host if request.client else None
+        await audit_log.record_many(current_user["user_id"], "download", [(row.file_id, row.filename) for row in rows], ip_address)
+
+    names = _archive_names([row.filename for row in rows])
+    entries = [(name, _stored_object(row), row.uploaded_at) for name, row in zip(names, rows)]
+    return StreamingResponse(zip_stream(entries), media_type="application/zip", headers={
+        "Content-Disposition": content_disposition("attachment", f"files-{datetime.utcnow():%Y%m%d-%H%M%S}.zip"),
+    }, background=BackgroundTask(record_downloads))
+
+
+# 1. GET /api/files - Fetch uploaded files, newest first, one page at a time
 @router.get("")
-async def get_all_files(search: str = None, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    query = db.query(file_data, user_data.user_name.label("owner_name")).join(
-        user_data, user_data.user_id == file_data.owner_id, isouter=True
-    ).filter(
+async def get_all_files(
+    search: str = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    stmt = select(*FILE_LIST_COLUMNS).outerjoin(
+        user_data, user_data.user_id == file_data.owner_id
+    ).where(
         file_data.is_deleted == False,
         file_data.org_id == current_user["org_id"]
     )
+    search = (search or "").strip()
     if search:
-        query = query.filter(file_data.filename.ilike(f"%{search}%"))
-    rows = query.all()
-    return [_serialize_file(f, owner_name) for f, owner_name in rows]
+        # Ranked search returns the best `limit` matches as a single page.
+        stmt = (await _filename_search(stmt, db, search)).limit(limit)
+        return {"files": [_serialize_file(row, row.owner_name) for row in await db.execute(stmt)], "next_cursor": None}
+
+    stmt = stmt.order_by(
+        file_data.uploaded_at.desc(), file_data.file_id.desc()
+    ).limit(limit + 1)
+    if cursor:
+        stmt = stmt.where(tuple_(file_data.uploaded_at, file_data.file_id) < tuple_(*_decode_cursor(cursor)))
+
+    files = []
+    last = None
+    for row in await db.execute(stmt):
+        if len(files) == limit:
+            return {"files": files, "next_cursor": _encode_cursor(last.uploaded_at, last.file_id)}
+        files.append(_serialize_file(row, row.owner_name))
+        last = row
+    return {"files": files, "next_cursor": None}
 
 
 # 2. GET /api/files/:id - Get single file metadata
 @router.get("/{file_id}")
-async def get_file_by_id(file_id: uuid.UUID, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    row = db.query(file_data, user_data.user_name.label("owner_name")).join(
-        user_data, user_data.user_id == file_data.owner_id, isouter=True
-    ).filter(
+async def get_file_by_id(file_id: uuid.UUID, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    row = (await db.execute(select(*FILE_LIST_COLUMNS).outerjoin(
+        user_data, user_data.user_id == file_data.owner_id
+    ).where(
         file_data.file_id == file_id,
         file_data.is_deleted == False,
         file_data.org_id == current_user["org_id"]
-    ).first()
+    ))).first()
     if not row:
         return {"error": "File not found"}
-    file, owner_name = row
-    return _serialize_file(file, owner_name)
+    return _serialize_file(row, row.owner_name)
 
 
 # 3. POST /api/files/upload - Upload new file
 @router.post("/upload")
 async def upload_file_api(
+    request: Request,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
-    user_name = (current_user.get("user_name") or "").strip().lower()
-    is_unlimited_user = user_name.startswith("sudipta")
-    size_limit = None if is_unlimited_user else MAX_NORMAL_USER_UPLOAD_BYTES
+    size_limit = _upload_size_limit(current_user)
     detected_size = _try_get_upload_size_bytes(file)
 
     if size_limit is not None and detected_size is not None and detected_size > size_limit:
         raise HTTPException(status_code=413, detail="Normal users can upload files up to 1 GB only.")
 
-    if size_limit is not None and detected_size is None:
-        content = await file.read(size_limit + 1)
-        if len(content) > size_limit:
-            raise HTTPException(status_code=413, detail="Normal users can upload files up to 1 GB only.")
-    else:
-        content = await file.read()
-
-    checksum = hashlib.md5(content).hexdigest()
-    storage_path = f"{current_user['org_id']}/{uuid.uuid4()}_{file.filename}"
+    content_type = file.content_type or "application/octet-stream"
+    file_size, checksum = await _hash_upload(file, size_limit)
 
-    await _upload_to_storage(storage_path, content, file.content_type or "application/octet-stream")
+    # Held until the file row commits, so parallel uploads cannot overshoot
+    # the quota between our check and our write.
+    async with reservation(db, current_user["org_id"], file_size):
+        # Same content already stored in this org: the upload is metadata only.
+        storage_path = await find_object(db, current_user["org_id"], checksum)
+        if storage_path is None:
+            storage_path = content_key(get_storage(), current_user["org_id"], checksum)
+            await _stream_to_storage(file, get_storage(), storage_path, content_type)
 
-    db_file = file_data(
-        owner_id=current_user["user_id"],
-        org_id=current_user["org_id"],
-        filename=file.filename,
-        storage_path=storage_path,
-        file_type=file.content_type,
-        file_size=len(content),
-        checksum=checksum,
-        is_deleted=False
-    )
-    db.add(db_file)
-    db.commit()
-    db.refresh(db_file)
+        db_file = await _add_file_row(db, current_user, file.filename, file.content_type, file_size, checksum, storage_path)
+        # A delete of the last reference may have removed the object between our
+        # lookup/write and taking the lock; our row now pins it, so put it back.
+        storage = storage_for(storage_path)
+        if await storage.head(storage_path) is None:
+            await _stream_to_storage(file, storage, storage_path, content_type)
+        await db.commit()
+    await db.refresh(db_file)
+    UPLOAD_BYTES.labels("proxy").inc(file_size)
+    content_extractor.notify()
+    preview_generator.notify()
+    await _audit(request, current_user, "upload", db_file.file_id, db_file.filename)
     return _serialize_file(db_file, current_user.get("user_name"))
 
 
 # 4. GET /api/files/:id/open - Open a file in browser
 @router.get("/{file_id}/open")
-async def open_file(file_id: uuid.UUID, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    file = db.query(file_data).filter(
+async def open_file(file_id: uuid.UUID, request: Request, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    file = (await db.execute(select(file_data.filename, file_data.storage_path).where(
         file_data.file_id == file_id,
-        file_data.org_id == current_user["org_id"]
-    ).first()
+        file_data.org_id == current_user["org_id"],
+        file_data.is_deleted == False
+    ))).first()
     if not file:
         return {"error": "File not found"}
-    storage_path = (file.storage_path or "").strip()
-    if not storage_path or storage_path == "local":
+    storage_path = _stored_object(file)
+    if not storage_path:
         raise HTTPException(status_code=404, detail="File is not available in storage")
-    signed_url = await _create_signed_url(storage_path, 60, file.filename, "inline")
+    signed_url = await _signed_url(storage_path, file.filename, "inline")
+    await _audit(request, current_user, "open", file_id, file.filename)
+    analytics.record(file_id, current_user["user_id"])
     return {"filename": file.filename, "signed_url": signed_url}
 
 
 # 5. GET /api/files/:id/download - Download a file
 @router.get("/{file_id}/download")
-async def download_file(file_id: uuid.UUID, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    file = db.query(file_data).filter(
+async def download_file(file_id: uuid.UUID, request: Request, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    file = (await db.execute(select(file_data.filename, file_data.storage_path).where(
         file_data.file_id == file_id,
-        file_data.org_id == current_user["org_id"]
-    ).first()
+        file_data.org_id == current_user["org_id"],
+        file_data.is_deleted == False
+    ))).first()
     if not file:
         return {"error": "File not found"}
-    storage_path = (file.storage_path or "").strip()
-    if not storage_path or storage_path == "local":
+    storage_path = _stored_object(file)
+    if not storage_path:
         raise HTTPException(status_code=404, detail="File is not available in storage")
-    signed_url = await _create_signed_url(storage_path, 60, file.filename, "attachment")
+    signed_url = await _signed_url(storage_path, file.filename, "attachment")
+    await _audit(request, current_user, "download", file_id, file.filename)
+    analytics.record(file_id, current_user["user_id"], download=True)
     return {"filename": file.filename, "signed_url": signed_url}
 
 
 # 6. DELETE /api/files/:id - Delete a file
 @router.delete("/{file_id}")
-async def delete_file(file_id: uuid.UUID, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    file = db.query(file_data).filter(
-        file_data.file_id == file_id,
-        file_data.org_id == current_user["org_id"]
-    ).first()
-    if not file:
+async def delete_file(file_id: uuid.UUID, request: Request, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    if not await _delete_files(db, current_user["org_id"], [file_id]):
         return {"error": "File not found"}
-    storage_path = (file.storage_path or "").strip()
-    if storage_path and storage_path != "local":
-        await _delete_from_storage(storage_path)
-    file.is_deleted = True
-    db.commit()
+    await _audit(request, current_user, "delete", file_id)
     return {"message": "File deleted successfully"}
 
 
 # 7. PATCH /api/files/:id/tags - Update file tags/metadata
 @router.patch("/{file_id}/tags")
-async def update_file_tags(file_id: uuid.UUID, filename: str = None, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    file = db.query(file_data).filter(
+async def update_file_tags(file_id: uuid.UUID, request: Request, filename: str = None, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    file = (await db.execute(select(file_data).where(
         file_data.file_id == file_id,
         file_data.org_id == current_user["org_id"]
-    ).first()
+    ))).scalar()
     if not file:
         return {"error": "File not found"}
+    old_filename = file.filename
     if filename:
         file.filename = filename
-    db.commit()
+    storage_path = file.storage_path
+    await db.commit()
+    if storage_path:
+        signed_urls.invalidate(storage_path)
+    if filename and filename != old_filename:
+        await _audit(request, current_user, "rename", file_id, f"{old_filename} -> {filename}")
     return {"message": "File updated successfully", "file": file}
+
+
+# 8. POST /api/files/batch/delete - Delete many files in one request
+@router.post("/batch/delete")
+async def batch_delete_files(payload: FileIdsPayload, request: Request, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    deleted = await _delete_files(db, current_user["org_id"], payload.file_ids)
+    deleted_ids = {row.file_id for row in deleted}
+    for file_id in deleted_ids:
+        await _audit(request, current_user, "delete", file_id)
+    return {
+        "deleted": [str(file_id) for file_id in deleted_ids],
+        "not_found": [str(file_id) for file_id in set(payload.file_ids) - deleted_ids],
+    }
+
+
+# 9. POST /api/files/batch/metadata - Fetch metadata for many files
+@router.post("/batch/metadata")
+async def batch_file_metadata(payload: FileIdsPayload, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    stmt = select(*FILE_LIST_COLUMNS).outerjoin(
+        user_data, user_data.user_id == file_data.owner_id
+    ).where(
+        file_data.file_id == any_(uuid_array("file_ids", payload.file_ids)),
+        file_data.org_id == current_user["org_id"],
+        file_data.is_deleted == False
+    )
+    files = [_serialize_file(row, row.owner_name) for row in await db.execute(stmt)]
+    found = {f["file_id"] for f in files}
+    return {"files": files, "not_found": [str(i) for i in set(payload.file_ids) if str(i) not in found]}
+
+
+# 10. POST /api/files/batch/urls - Signed open/download URLs for many files
+@router.post("/batch/urls")
+async def batch_signed_urls(payload: BatchUrlsPayload, request: Request, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    rows = await db.execute(select(file_data.file_id, file_data.filename, file_data.storage_path).where(
+        file_data.file_id == any_(uuid_array("file_ids", payload.file_ids)),
+        file_data.org_id == current_user["org_id"],
+        file_data.is_deleted == False
+    ))
+    urls = {}
+    for row in rows:
+        storage_path = _stored_object(row)
+        if storage_path:
+            urls[str(row.file_id)] = {
+                "filename": row.filename,
+                "signed_url": await _signed_url(storage_path, row.filename, payload.disposition),
+            }
+            await _audit(request, current_user, "open" if payload.disposition == "inline" else "download", row.file_id, row.filename)
+            analytics.record(row.file_id, current_user["user_id"], download=payload.disposition == "attachment")
+    return {"urls": urls, "not_found": [str(i) for i in set(payload.file_ids) if str(i) not in urls]}
+
+
+# 11. POST /api/files/uploads/initiate - Start a direct browser-to-storage upload
+@router.post("/uploads/initiate")
+async def initiate_upload(payload: UploadInitiatePayload, request: Request, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    _check_upload_size(current_user, payload.size)
+    org_id = current_user["org_id"]
+    content_type = payload.content_type or "application/octet-stream"
+
+    # Same content already stored in this org: nothing to transfer.
+    duplicate = await _record_duplicate(db, current_user, payload)
+    if duplicate is not None:
+        await _audit(request, current_user, "upload", duplicate["file_id"], duplicate["filename"])
+        return {"status": "completed", "file": duplicate}
+
+    storage = get_storage()
+    if not storage.supports_presigned_upload:
+        return {"status": "proxy", "upload_url": "/api/files/upload", "resumable_url": "/api/files/uploads"}
+
+    # Reserved with the session row; released when the upload completes,
+    # is aborted or expires.
+    await reserve(db, org_id, payload.size)
+    session = upload_session(
+        session_id=uuid.uuid4(),
+        org_id=org_id,
+        owner_id=current_user["user_id"],
+        filename=payload.filename,
+        file_type=content_type,
+        file_size=payload.size,
+    )
+    session.storage_path = f"{storage.path_prefix}{org_id}/uploads/{session.session_id}"
+    if payload.size <= UPLOAD_PART_SIZE:
+        checksum = None
+        if payload.sha256:
+            # S3 verifies the body against the signed checksum, so the object
+            # can be stored content-addressed like proxied uploads.
+            session.checksum = payload.sha256
+            session.storage_path = content_key(storage, org_id, payload.sha256)
+            checksum = base64.b64encode(bytes.fromhex(payload.sha256)).decode()
+        url, headers = storage.presigned_put(session.storage_path, content_type, UPLOAD_URL_EXPIRES_IN, checksum)
+        transfer = {"mode": "single", "url": url, "headers": headers}
+    else:
+        session.part_size = _part_size_for(payload.size)
+        session.upload_id = await storage.create_multipart(session.storage_path, content_type)
+        part_count = -(-payload.size // session.part_size)
+        transfer = {
+            "mode": "multipart",
+            "part_size": session.part_size,
+            "parts": [
+                {
+                    "part_number": part_number,
+                    "url": storage.presigned_part(session.storage_path, session.upload_id, part_number, UPLOAD_URL_EXPIRES_IN),
+                }
+                for part_number in range(1, part_count + 1)
+            ],
+        }
+    db.add(session)
+    await db.commit()
+    return {"status": "pending", "session_id": str(session.session_id), **transfer}
+
+
+# 12. POST /api/files/uploads/:id/complete - Register a finished direct upload
+@router.post("/uploads/{session_id}/complete")
+async def complete_upload(
+    session_id: uuid.UUID,
+    request: Request,
+    payload: UploadCompletePayload | None = None,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    session = await _get_pending_upload(db, session_id, current_user)
+    storage = storage_for(session.storage_path)
+    if session.upload_id:
+        parts = sorted((payload.parts if payload else []), key=lambda part: part.part_number)
+        part_count = -(-session.file_size // session.part_size)
+        if [part.part_number for part in parts] != list(range(1, part_count + 1)):
+            raise HTTPException(status_code=400, detail="Missing upload parts")
+        await storage.complete_multipart(
+            session.storage_path,
+            session.upload_id,
+            [{"PartNumber": part.part_number, "ETag": part.etag} for part in parts],
+        )
+
+    head = await storage.head(session.storage_path)
+    if head is None:
+        raise HTTPException(status_code=409, detail="Upload has not reached storage")
+    if head["size"] != session.file_size:
+        # Content-addressed objects may be shared, only drop our own key.
+        if not session.checksum:
+            await storage.delete(session.storage_path)
+        session.status = "failed"
+        session.updated_at = datetime.utcnow()
+        await release(db, session.org_id, session.file_size)
+        await db.commit()
+        raise HTTPException(status_code=400, detail="Uploaded size does not match")
+
+    # Only a sha256 that storage verified is recorded; without one the file
+    # is neither deduplicated nor shares derived content.
+    db_file = await _add_file_row(db, current_user, session.filename, session.file_type, session.file_size, session.checksum, session.storage_path)
+    if session.checksum and await storage.head(session.storage_path) is None:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Upload has not reached storage")
+    # The file row now counts as usage in place of the reservation.
+    await release(db, session.org_id, session.file_size)
+    session.status = "completed"
+    session.updated_at = datetime.utcnow()
+    await db.commit()
+    UPLOAD_BYTES.labels("direct").inc(session.file_size)
+    content_extractor.notify()
+    preview_generator.notify()
+    await db.refresh(db_file)
+    await _audit(request, current_user, "upload", db_file.file_id, db_file.filename)
+    return _serialize_file(db_file, current_user.get("user_name"))
+
+
+# 13. DELETE /api/files/uploads/:id - Abandon a direct or resumable upload
+@router.delete("/uploads/{session_id}")
+async def abort_upload(session_id: uuid.UUID, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    session = await _get_pending_upload(db, session_id, current_user)
+    await discard_upload(session)
+    await forget_parts(db, [session.session_id])
+    await release(db, session.org_id, session.file_size)
+    session.status = "aborted"
+    session.updated_at = datetime.utcnow()
+    await db.commit()
+    return {"message": "Upload aborted"}
+
+
+# 14. POST /api/files/uploads - Create a resumable upload (tus-style)
+@router.post("/uploads", status_code=201)
+async def create_resumable_upload(
+    payload: UploadInitiatePayload,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    _check_upload_size(current_user, payload.size)
+    if payload.size == 0:
+        raise HTTPException(status_code=400, detail="Empty files cannot be uploaded in parts")
+    duplicate = await _record_duplicate(db, current_user, payload)
+    if duplicate is not None:
+        response.status_code = 200
+        await _audit(request, current_user, "upload", duplicate["file_id"], duplicate["filename"])
+        return {"status": "completed", "file": duplicate}
+
+    storage = get_storage()
+    content_type = payload.content_type or "application/octet-stream"
+    await reserve(db, current_user["org_id"], payload.size)
+    session = upload_session(
+        session_id=uuid.uuid4(),
+        org_id=current_user["org_id"],
+        owner_id=current_user["user_id"],
+        filename=payload.filename,
+        file_type=content_type,
+        file_size=payload.size,
+        part_size=_part_size_for(payload.size),
+    )
+    session.storage_path = f"{storage.path_prefix}{current_user['org_id']}/uploads/{session.session_id}"
+    session.upload_id = await storage.create_multipart(session.storage_path, content_type)
+    db.add(session)
+    await db.commit()
+    upload_url = f"/api/files/uploads/{session.session_id}"
+    response.headers["Location"] = upload_url
+    response.headers.update(_offset_headers(session, 0))
+    return {
+        "status": "pending",
+        "session_id": str(session.session_id),
+        "upload_url": upload_url,
+        "part_size": session.part_size,
+        "offset": 0,
+    }
+
+
+# 15. HEAD /api/files/uploads/:id - Bytes of a resumable upload stored so far
+@router.head("/uploads/{session_id}")
+async def get_upload_offset(session_id: uuid.UUID, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    session = await _get_pending_upload(db, session_id, current_user)
+    offset, _ = await _resumable_offset(db, session.session_id)
+    headers = _offset_headers(session, offset)
+    await db.rollback()
+    return Response(status_code=200, headers=headers)
+
+
+# 16. PATCH /api/files/uploads/:id - Append bytes at Upload-Offset
+# Every full part is stored and recorded before the next one is read, so a
+# dropped connection loses at most one part. The response's Upload-Offset is
+# where the client resumes; the last request completes the file.
+@router.patch("/uploads/{session_id}")
+async def append_upload(
+    session_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    session = await _get_pending_upload(db, session_id, current_user)
+    if not session.part_size or not session.upload_id:
+        raise HTTPException(status_code=400, detail="Not a resumable upload")
+    offset, _ = await _resumable_offset(db, session.session_id)
+    # Release the session row lock while the body streams in.
+    await db.commit()
+    if upload_offset != offset:
+        raise HTTPException(status_code=409, detail="Upload-Offset does not match", headers=_offset_headers(session, offset))
+
+    storage = storage_for(session.storage_path)
+    part_size = session.part_size
+    buffer = bytearray()
+
+    async def store_part(data: bytes):
+        nonlocal offset
+        part_number = offset // part_size + 1
+        etag = await storage.upload_part(session.storage_path, session.upload_id, part_number, data)
+        stmt = pg_insert(upload_part).values(
+            session_id=session.session_id, part_number=part_number, etag=etag, part_size=len(data)
+        )
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[upload_part.session_id, upload_part.part_number],
+            set_={"etag": stmt.excluded.etag, "part_size": stmt.excluded.part_size},
+        ))
+        await db.execute(update(upload_session).where(
+            upload_session.session_id == session.session_id
+        ).values(updated_at=datetime.utcnow()))
+        await db.commit()
+        offset += len(data)
+
+    async for chunk in request.stream():
+        if offset + len(buffer) + len(chunk) > session.file_size:
+            raise HTTPException(status_code=413, detail="Upload exceeds its declared length")
+        buffer += chunk
+        UPLOAD_BYTES.labels("resumable").inc(len(chunk))
+        while len(buffer) >= part_size:
+            await store_part(bytes(buffer[:part_size]))
+            del buffer[:part_size]
+    if buffer and offset + len(buffer) == session.file_size:
+        await store_part(bytes(buffer))
+
+    if offset < session.file_size:
+        return Response(status_code=204, headers=_offset_headers(session, offset))
+
+    # Last part stored: assemble the object and record the file.
+    session = await _get_pending_upload(db, session_id, current_user)
+    _, stored = await _resumable_offset(db, session.session_id)
+    await storage.complete_multipart(
+        session.storage_path,
+        session.upload_id,
+        [{"PartNumber": part.part_number, "ETag": part.etag} for part in stored],
+    )
+    head = await storage.head(session.storage_path)
+    if head is None or head["size"] != session.file_size:
+        raise HTTPException(status_code=409, detail="Upload has not reached storage")
+    # The parts arrive over many requests, so no sha256 of the whole file exists.
+    db_file = await _add_file_row(db, current_user, session.filename, session.file_type, session.file_size, None, session.storage_path)
+    await forget_parts(db, [session.session_id])
+    await release(db, session.org_id, session.file_size)
+    session.status = "completed"
+    session.updated_at = datetime.utcnow()
+    await db.commit()
+    await db.refresh(db_file)
+    content_extractor.notify()
+    preview_generator.notify()
+    await _audit(request, current_user, "upload", db_file.file_id, db_file.filename)
+    response.headers.update(_offset_headers(session, offset))
+    return _serialize_file(db_file, current_user.get("user_name"))
+
+
+# 17. GET /api/files/:id/analytics - View/download counts and unique users
+# Counts are merged from every worker every ANALYTICS_FLUSH_INTERVAL seconds.
+@router.get("/{file_id}/analytics")
+async def get_file_analytics(file_id: uuid.UUID, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    row = (await db.execute(
+        select(
+            file_data.file_id,
+            analytics_data.view_count,
+            analytics_data.download_count,
+            analytics_data.last_accesed,
+            analytics_data.unique_users,
+        ).outerjoin(analytics_data, analytics_data.file_id == file_data.file_id).where(
+            file_data.file_id == file_id,
+            file_data.org_id == current_user["org_id"],
+            file_data.is_deleted == False
+        )
+    )).first()
+    if not row:
+        return {"error": "File not found"}
+    return {
+        "file_id": str(row.file_id),
+        "view_count": row.view_count or 0,
+        "download_count": row.download_count or 0,
+        "unique_users": row.unique_users or 0,
+        "last_accessed": row.last_accesed,
+    }
+
+
+# 18. GET /api/files/:id/versions - List a file's versions, oldest first
+@router.get("/{file_id}/versions")
+async def list_versions(file_id: uuid.UUID, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    file = await _require_file(db, file_id, current_user)
+    rows = (await db.execute(
+        select(file_md.ver_no, file_md.file_size, file_md.created_at, file_md.changelog).where(
+            file_md.file_id == file_id,
+            file_md.chunks.is_not(None),
+        ).order_by(file_md.ver_no)
+    )).all()
+    return {"versions": [_serialize_version(1, file.file_size, file.uploaded_at, None)] + [
+        _serialize_version(row.ver_no, row.file_size, row.created_at, row.changelog) for row in rows
+    ]}
+
+
+# 19. POST /api/files/:id/versions/chunks/missing - Which chunks of a new version must be uploaded
+# Clients chunk the file the same way the server does (filestack/src/api/client.ts),
+# so an edit to a large file only uploads the chunks around the change.
+@router.post("/{file_id}/versions/chunks/missing")
+async def find_missing_chunks(file_id: uuid.UUID, payload: ChunkHashesPayload, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    await _require_file(db, file_id, current_user)
+    missing = await missing_chunks(db, current_user["org_id"], payload.chunks)
+    await db.commit()
+    return {"missing": missing}
+
+
+# 20. PUT /api/files/:id/versions/chunks/:sha256 - Upload one chunk (raw body)
+@router.put("/{file_id}/versions/chunks/{sha256}")
+async def put_version_chunk(
+    file_id: uuid.UUID,
+    request: Request,
+    sha256: str = Path(..., pattern="^[0-9a-f]{64}$"),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    data = bytearray()
+    async for piece in request.stream():
+        data += piece
+        if len(data) > CHUNK_MAX_SIZE:
+            raise HTTPException(status_code=413, detail="Chunk is larger than the maximum chunk size")
+    if chunk_hash(data) != sha256:
+        raise HTTPException(status_code=400, detail="Chunk does not match its sha256")
+    await _require_file(db, file_id, current_user)
+    await db.commit()
+    # The version that uses the chunk is charged when it commits; until then
+    # the chunk's bytes must still fit.
+    async with reservation(db, current_user["org_id"], len(data)):
+        stored = await store_chunk(current_user["org_id"], sha256, bytes(data))
+    UPLOAD_BYTES.labels("version").inc(len(data))
+    return {"sha256": sha256, "size": len(data), "stored": stored}
+
+
+# 21. POST /api/files/:id/versions - Commit a new version from uploaded chunks
+@router.post("/{file_id}/versions", status_code=201)
+async def create_version(file_id: uuid.UUID, payload: VersionCommitPayload, request: Request, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    return await _add_version(db, request, current_user, file_id, payload.chunks, payload.changelog)
+
+
+# 22. POST /api/files/:id/versions/upload - Upload a whole new version; the server chunks it
+# Only chunks the org does not already store reach storage.
+@router.post("/{file_id}/versions/upload", status_code=201)
+async def upload_version(
+    file_id: uuid.UUID,
+    request: Request,
+    file: UploadFile = File(...),
+    changelog: str = Form("", max_length=2000),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    size_limit = _upload_size_limit(current_user)
+    await _require_file(db, file_id, current_user)
+    # Chunks commit one by one as they are stored; no transaction stays open
+    # while the upload is read.
+    await db.commit()
+    chunker = Chunker()
+    hashes = []
+    size = 0
+    stored_bytes = 0
+
+    async def store(chunks: list[bytes]):
+        nonlocal stored_bytes
+        for data in chunks:
+            sha256 = chunk_hash(data)
+            hashes.append(sha256)
+            if len(hashes) > MAX_VERSION_CHUNKS:
+                raise HTTPException(status_code=413, detail="File has too many chunks for one version")
+            if await store_chunk(current_user["org_id"], sha256, data):
+                stored_bytes += len(data)
+
+    expected = _try_get_upload_size_bytes(file)
+    if expected is not None:
+        _check_upload_size(current_user, expected)
+    else:
+        # The request body is a little larger than the file: good enough to
+        # reserve, not to reject on.
+        content_length = request.headers.get("content-length", "")
+        expected = int(content_length) if content_length.isdigit() else 0
+        if size_limit is not None:
+            expected = min(expected, size_limit)
+
+    # Released before the version commits and is charged in full.
+    async with reservation(db, current_user["org_id"], expected) as grow:
+        while piece := await file.read(UPLOAD_PART_SIZE):
+            size += len(piece)
+            if size_limit is not None and size > size_limit:
+                raise HTTPException(status_code=413, detail="Normal users can upload files up to 1 GB only.")
+            await grow(size)
+            await store(await run_in_threadpool(chunker.feed, piece))
+        await store(await run_in_threadpool(chunker.finish))
+
+    version = await _add_version(db, request, current_user, file_id, hashes, changelog)
+    UPLOAD_BYTES.labels("version").inc(size)
+    return {**version, "stored_bytes": stored_bytes}
+
+
+# 23. GET /api/files/:id/versions/:ver_no/download - Stream one version
+@router.get("/{file_id}/versions/{ver_no}/download")
+async def download_version(file_id: uuid.UUID, ver_no: int, request: Request, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    file = await _require_file(db, file_id, current_user)
+    if ver_no == 1:
+        storage_path = _stored_object(file)
+        head = await storage_for(storage_path).head(storage_path) if storage_path else None
+        if head is None:
+            raise HTTPException(status_code=404, detail="File is not available in storage")
+        body = storage_for(storage_path).iter_chunks(storage_path)
+        size = head["size"]
+    else:
+        version = (await db.execute(select(file_md.chunks, file_md.file_size).where(
+            file_md.file_id == file_id,
+            file_md.ver_no == ver_no,
+            file_md.chunks.is_not(None),
+        ))).first()
+        if not version:
+            raise HTTPException(status_code=404, detail="Version not found")
+        # Resolved before streaming: the request's session closes with the response.
+        body = iter_version(await chunk_paths(db, current_user["org_id"], version.chunks))
+        size = version.file_size
+    await _audit(request, current_user, "download", file_id, f"{file.filename} v{ver_no}")
+    analytics.record(file_id, current_user["user_id"], download=True)
+    return StreamingResponse(body, media_type=file.file_type or "application/octet-stream", headers={
+        "Content-Disposition": content_disposition("attachment", file.filename),
+        "Content-Length": str(size),
+    })
+
+
+# 24. POST /api/files/batch/previews - Thumbnail/preview URLs for a page of files
+# Files whose preview is still being made are listed in "pending"; those that
+# get none (unsupported type, too large, failed) in "unavailable".
+@router.post("/batch/previews")
+async def batch_preview_urls(payload: BatchPreviewsPayload, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    if payload.size not in PREVIEW_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(PREVIEW_SIZES)}")
+    rows = (await db.execute(select(
+        file_data.file_id,
+        file_data.checksum,
+        derived_asset.status,
+        derived_asset.storage_path,
+        derived_asset.content_type,
+        derived_asset.width,
+        derived_asset.height,
+    ).outerjoin(derived_asset, and_(
+        derived_asset.org_id == file_data.org_id,
+        derived_asset.checksum == file_data.checksum,
+        derived_asset.size == payload.size,
+    )).where(
+        file_data.file_id == any_(uuid_array("file_ids", payload.file_ids)),
+        file_data.org_id == current_user["org_id"],
+        file_data.is_deleted == False
+    ))).all()
+
+    previews = {}
+    pending = []
+    unavailable = []
+    for row in rows:
+        if row.status == "done":
+            previews[str(row.file_id)] = {
+                "url": await _signed_url(row.storage_path, "", ""),
+                "content_type": row.content_type,
+                "width": row.width,
+                "height": row.height,
+            }
+        elif row.checksum is not None and row.status in (None, "processing", "retry"):
+            pending.append(str(row.file_id))
+        else:
+            unavailable.append(str(row.file_id))
+    if pending:
+        preview_generator.notify()
+    found = {str(row.file_id) for row in rows}
+    return {
+        "previews": previews,
+        "pending": pending,
+        "unavailable": unavailable,
+        "not_found": [str(i) for i in set(payload.file_ids) if str(i) not in found],
+    }
+
+
+# 25. GET /api/files/:id/content - Stream a file through the API
+# Supports Range (including multipart/byteranges) for seeking and resumed
+# downloads, and If-None-Match/If-Range against an ETag from the checksum
+# (the backend's own for files stored without one).
+@router.get("/{file_id}/content")
+async def stream_file(
+    file_id: uuid.UUID,
+    request: Request,
+    disposition: Literal["inline", "attachment"] = "attachment",
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    file = await _require_file(db, file_id, current_user)
+    storage_path = _stored_object(file)
+    if not storage_path:
+        raise HTTPException(status_code=404, detail="File is not available in storage")
+    response = await _object_response(
+        request, storage_path, file.checksum, head_etag=file.checksum is None,
+        filename=file.filename, disposition=disposition, media_type=file.file_type,
+    )
+    # Seeks and resumes fetch the file in pieces; only count a read from the start.
+    if response.status_code == 200 or response.headers.get("content-range", "").startswith("bytes 0-"):
+        await _audit(request, current_user, "download" if disposition == "attachment" else "open", file_id, file.filename)
+        analytics.record(file_id, current_user["user_id"], download=disposition == "attachment")
+    return response
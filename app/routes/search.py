@@ -0,0 +1,124 @@
+import uuid
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from sqlalchemy import any_, delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dbConfig.database import get_db
+from database_model.database_model import embedded_data as embed_data
+from database_model.database_model import file_info as file_data
+from app.routes.auth import get_current_user
+from app.services.object_refs import uuid_array
+from app.services.content_search import search_content
+from app.services.vector_index import encode_vector, vector_index
+
+router = APIRouter(prefix="/api/search", tags=["Search"])
+
+MAX_EMBEDDING_DIMS = 4096
+MAX_SEARCH_RESULTS = 100
+# Deep pages of a ranked search are rarely useful and rank every match.
+MAX_CONTENT_SEARCH_OFFSET = 1000
+
+
+class EmbeddingPayload(BaseModel):
+    file_id: uuid.UUID
+    embedding: list[float] = Field(..., min_length=1, max_length=MAX_EMBEDDING_DIMS)
+    model_used: str = Field(..., min_length=1)
+
+
+class SemanticSearchPayload(BaseModel):
+    embedding: list[float] = Field(..., min_length=1, max_length=MAX_EMBEDDING_DIMS)
+    model_used: str = Field(..., min_length=1)
+    limit: int = Field(10, ge=1, le=MAX_SEARCH_RESULTS)
+
+
+# 1. PUT /api/search/embeddings - Store (or replace) a file's embedding
+@router.put("/embeddings")
+async def put_embedding(payload: EmbeddingPayload, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    exists = (await db.execute(select(file_data.file_id).where(
+        file_data.file_id == payload.file_id,
+        file_data.org_id == current_user["org_id"],
+        file_data.is_deleted == False,
+    ))).first()
+    if not exists:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # One embedding per file and model.
+    await db.execute(delete(embed_data).where(
+        embed_data.file_id == payload.file_id,
+        embed_data.model_used == payload.model_used,
+    ))
+    db.add(embed_data(
+        file_id=payload.file_id,
+        vector_data={"embedding": payload.embedding},
+        vector_f32=encode_vector(payload.embedding),
+        model_used=payload.model_used,
+        created_at=datetime.utcnow(),
+    ))
+    await db.commit()
+    vector_index.add(current_user["org_id"], payload.model_used, payload.file_id, payload.embedding)
+    return {"file_id": str(payload.file_id), "model_used": payload.model_used, "dimensions": len(payload.embedding)}
+
+
+# 2. POST /api/search/semantic - Files whose embeddings are closest to a query embedding
+@router.post("/semantic")
+async def semantic_search(payload: SemanticSearchPayload, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    try:
+        matches = await vector_index.search(
+            db, current_user["org_id"], payload.model_used, payload.embedding, payload.limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not matches:
+        return {"results": []}
+
+    # Files deleted by another worker may still be in this worker's index.
+    files = {
+        str(row.file_id): row
+        for row in await db.execute(select(
+            file_data.file_id, file_data.filename, file_data.file_type, file_data.file_size, file_data.uploaded_at
+        ).where(
+            file_data.file_id == any_(uuid_array("file_ids", [uuid.UUID(file_id) for file_id, _ in matches])),
+            file_data.org_id == current_user["org_id"],
+            file_data.is_deleted == False,
+        ))
+    }
+    return {"results": [
+        {
+            "file_id": file_id,
+            "filename": files[file_id].filename,
+            "file_type": files[file_id].file_type,
+            "file_size": files[file_id].file_size,
+            "uploaded_at": files[file_id].uploaded_at.isoformat() if files[file_id].uploaded_at else None,
+            "score": round(score, 6),
+        }
+        for file_id, score in matches if file_id in files
+    ]}
+
+
+# 3. GET /api/search/content - Ranked full-text search over extracted file content
+@router.get("/content")
+async def content_search(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+    offset: int = Query(0, ge=0, le=MAX_CONTENT_SEARCH_OFFSET),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    rows = await search_content(db, current_user["org_id"], q, limit, offset)
+    return {"results": [
+        {
+            "file_id": str(row.file_id),
+            "filename": row.filename,
+            "file_type": row.file_type,
+            "file_size": row.file_size,
+            "uploaded_at": row.uploaded_at.isoformat() if row.uploaded_at else None,
+            "summary": row.summary,
+            "keywords": row.keywords or [],
+            "lang": row.lang,
+            "snippet": row.snippet,
+            "rank": round(row.rank, 6),
+        }
+        for row in rows
+    ]}
@@ -1,29 +1,24 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
-from sqlalchemy import text
-from dbConfig.database import SessionLocal
-from database_model.database_model import file_info as file_data
+from dbConfig.database import get_db
+from app.routes.auth import get_current_user
+from app.services.org_stats import get_org_stats
+from app.services.quota import get_quota
 
 router = APIRouter(prefix="/api", tags=["System & Analytics"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# 11. GET /api/stats - Dashboard statistics
+# 11. GET /api/stats - Dashboard statistics for the current org
 @router.get("/stats")
-async def get_dashboard_stats(db: Session = Depends(get_db)):
-    total_files = db.query(file_data).filter(file_data.is_deleted == False).count()
-    total_storage = db.query(file_data).filter(file_data.is_deleted == False).with_entities(text("SUM(file_size)")).scalar() or 0
-    
+async def get_dashboard_stats(db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    stats = await get_org_stats(db, current_user["org_id"])
+    quota = await get_quota(db, current_user["org_id"])
     return {
-        "total_files": total_files,
-        "storage_used": total_storage,
-        "storage_unit": "KB"
+        "total_files": stats["total_files"],
+        "storage_used": stats["storage_used"],
+        "storage_unit": "bytes",
+        "by_type": stats["by_type"],
+        "quota": quota,
     }
 
 # 12. GET /api/settings - Get user settings
@@ -1,21 +1,15 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
-from dbConfig.database import SessionLocal
+from dbConfig.database import get_db
 from database_model.database_model import user as user_data
 
 router = APIRouter(prefix="/api/user", tags=["User"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/me")
-async def get_user_profile(user_id: uuid.UUID, db: Session = Depends(get_db)):
-    user = db.query(user_data).filter(user_data.user_id == user_id).first()
+async def get_user_profile(user_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    user = (await db.execute(select(user_data).where(user_data.user_id == user_id))).scalar()
     if not user:
         return {"error": "User not found"}
     return user
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from dbConfig.database import SessionLocal
+from database_model.database_model import activity_log as log_data
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 10000))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 1.0))
+# How long a request may wait for room in a full buffer before its event is
+# dropped, so a stalled database slows requests down without hanging them.
+AUDIT_ENQUEUE_TIMEOUT = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT", 1.0))
+AUDIT_WRITE_RETRIES = 3
+
+_STOP = object()
+
+
+# Write-behind writer for actv_log. Requests only append to a bounded
+# in-memory buffer; one background task drains it and writes each batch with
+# a single multi-row INSERT, when the batch is full or flush_interval passed.
+class AuditLog:
+    def __init__(
+        self,
+        queue_size: int = AUDIT_QUEUE_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        enqueue_timeout: float = AUDIT_ENQUEUE_TIMEOUT,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: asyncio.Task | None = None
+
+    async def record(
+        self,
+        user_id,
+        action: str,
+        file_id,
+        ip_address: str | None = None,
+        description: str | None = None,
+    ):
+        event = {
+            "user_id": user_id,
+            "file_id": file_id,
+            "action_log": action,
+            "log_time": datetime.utcnow(),
+            "ip_add": ip_address,
+            "descrp": description,
+        }
+        try:
+            self._queue.put_nowait(event)
+            return
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(self._queue.put(event), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            logger.warning("Audit buffer full, dropped %s event for file %s", action, file_id)
+
+    # Events for many files at once (an archive download), written straight
+    # to actv_log in batches instead of through the buffer. Run after the
+    # response has been sent, so a full buffer never holds one up.
+    async def record_many(self, user_id, action: str, files, ip_address: str | None = None):
+        log_time = datetime.utcnow()
+        events = [
+            {
+                "user_id": user_id,
+                "file_id": file_id,
+                "action_log": action,
+                "log_time": log_time,
+                "ip_add": ip_address,
+                "descrp": description,
+            }
+            for file_id, description in files
+        ]
+        for i in range(0, len(events), self.batch_size):
+            await self._write(events[i:i + self.batch_size])
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    # Flushes everything recorded before the call, then stops the writer.
+    async def stop(self):
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await self._queue.get()
+            if event is _STOP:
+                return
+            batch = [event]
+            deadline = loop.time() + self.flush_interval
+            stopping = False
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    event = self._queue.get_nowait()
+                else:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        event = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if event is _STOP:
+                    stopping = True
+                    break
+                batch.append(event)
+            await self._write(batch)
+            if stopping:
+                return
+
+    async def _write(self, batch: list[dict]):
+        for attempt in range(AUDIT_WRITE_RETRIES):
+            try:
+                async with SessionLocal() as db:
+                    await db.execute(insert(log_data), batch)
+                    await db.commit()
+                return
+            except Exception:
+                logger.exception("Writing %s audit events failed (attempt %s)", len(batch), attempt + 1)
+                await asyncio.sleep(2 ** attempt)
+        self.dropped += len(batch)
+
+
+audit_log = AuditLog()
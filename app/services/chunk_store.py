@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+from sqlalchemy import Text, any_, bindparam, delete, select, tuple_, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dbConfig.database import SessionLocal
+from database_model.database_model import file_chunk
+from database_model.database_model import file_metadata as file_md
+from app.services.object_refs import lock_objects, uuid_array
+from app.services.quota import add_usage
+from app.services.storage import StorageBackend, get_storage, storage_for
+
+logger = logging.getLogger(__name__)
+
+# File versions are stored as manifests of content-defined chunks (see
+# chunking.py). Chunks are content-addressed per org and reference counted by
+# the manifests that use them. Unreferenced chunks are kept for
+# CHUNK_GC_GRACE seconds so a version whose chunks are still being uploaded
+# can commit, then collected. Writers, committers and the collector of a
+# chunk serialise on an advisory lock keyed by org and hash.
+CHUNK_GC_GRACE = int(os.getenv("CHUNK_GC_GRACE", 24 * 3600))
+CHUNK_GC_INTERVAL = int(os.getenv("CHUNK_GC_INTERVAL", 3600))
+CHUNK_GC_BATCH = 1000
+
+
+def chunk_key(storage: StorageBackend, org_id, sha256: str) -> str:
+    return f"{storage.path_prefix}{org_id}/chunks/{sha256}"
+
+
+def _lock_names(org_id, hashes) -> list[str]:
+    return [f"chunk:{org_id}:{sha256}" for sha256 in hashes]
+
+
+def _hash_array(name: str, hashes) -> bindparam:
+    return bindparam(name, list(hashes), type_=ARRAY(Text))
+
+
+# Which of `hashes` the org does not store yet. The ones it does are touched
+# so they survive collection until the version that needs them commits.
+async def missing_chunks(db: AsyncSession, org_id, hashes) -> list[str]:
+    hashes = list(dict.fromkeys(hashes))
+    present = set((await db.execute(
+        update(file_chunk).where(
+            file_chunk.org_id == org_id,
+            file_chunk.chunk_hash == any_(_hash_array("hashes", hashes)),
+        ).values(updated_at=datetime.utcnow()).returning(file_chunk.chunk_hash)
+    )).scalars())
+    return [sha256 for sha256 in hashes if sha256 not in present]
+
+
+# Stores one chunk unless the org already has it, in a transaction of its
+# own. The row commits together with the object, unreferenced until a version
+# uses it, so chunks of a version that never commits are still collected.
+# The caller has verified that `data` hashes to `sha256`.
+async def store_chunk(org_id, sha256: str, data: bytes) -> bool:
+    async with SessionLocal() as db:
+        await lock_objects(db, _lock_names(org_id, [sha256]))
+        exists = (await db.execute(
+            update(file_chunk).where(
+                file_chunk.org_id == org_id,
+                file_chunk.chunk_hash == sha256,
+            ).values(updated_at=datetime.utcnow()).returning(file_chunk.chunk_hash)
+        )).first()
+        if exists:
+            await db.commit()
+            return False
+        storage = get_storage()
+        storage_path = chunk_key(storage, org_id, sha256)
+        db.add(file_chunk(
+            org_id=org_id,
+            chunk_hash=sha256,
+            storage_path=storage_path,
+            chunk_size=len(data),
+            ref_count=0,
+            updated_at=datetime.utcnow(),
+        ))
+        await db.flush()
+        try:
+            await storage.put(storage_path, data, "application/octet-stream")
+            await db.commit()
+        except BaseException:
+            # No row points at the object; the chunk lock is still ours.
+            await storage.delete(storage_path)
+            raise
+        return True
+
+
+async def _adjust_refs(db: AsyncSession, org_id, counts: Counter, sign: int):
+    if not counts:
+        return
+    # Sorted, so concurrent commits and releases lock rows in the same order.
+    chunks = file_chunk.__table__
+    await db.execute(
+        chunks.update().where(
+            chunks.c.org_id == bindparam("b_org_id"),
+            chunks.c.chunk_hash == bindparam("b_hash"),
+        ).values(
+            ref_count=chunks.c.ref_count + bindparam("b_delta"),
+            updated_at=datetime.utcnow(),
+        ),
+        [{"b_org_id": org_id, "b_hash": sha256, "b_delta": sign * count} for sha256, count in sorted(counts.items())],
+    )
+
+
+# References every chunk of a new version. Returns the manifest
+# ([[sha256, size], ...]) or, when some chunks are not stored, raises
+# LookupError with their hashes and takes no references.
+async def reference_chunks(db: AsyncSession, org_id, hashes: list[str]) -> list[list]:
+    counts = Counter(hashes)
+    await lock_objects(db, _lock_names(org_id, counts))
+    sizes = dict((await db.execute(
+        select(file_chunk.chunk_hash, file_chunk.chunk_size).where(
+            file_chunk.org_id == org_id,
+            file_chunk.chunk_hash == any_(_hash_array("hashes", counts)),
+        )
+    )).all())
+    missing = [sha256 for sha256 in counts if sha256 not in sizes]
+    if missing:
+        raise LookupError(missing)
+    await _adjust_refs(db, org_id, counts, 1)
+    return [[sha256, sizes[sha256]] for sha256 in hashes]
+
+
+# Deletes the versions of deleted files, drops their chunk references and
+# gives their bytes back to the org's quota.
+async def release_versions(db: AsyncSession, org_id, file_ids):
+    versions = (await db.execute(
+        delete(file_md).where(
+            file_md.file_id == any_(uuid_array("version_file_ids", file_ids))
+        ).returning(file_md.chunks, file_md.file_size)
+    )).all()
+    counts = Counter(sha256 for version in versions for sha256, _ in version.chunks or [])
+    await _adjust_refs(db, org_id, counts, -1)
+    await add_usage(db, org_id, -sum(version.file_size or 0 for version in versions if version.chunks))
+
+
+async def chunk_paths(db: AsyncSession, org_id, manifest) -> list[str]:
+    paths = dict((await db.execute(
+        select(file_chunk.chunk_hash, file_chunk.storage_path).where(
+            file_chunk.org_id == org_id,
+            file_chunk.chunk_hash == any_(_hash_array("hashes", {sha256 for sha256, _ in manifest})),
+        )
+    )).all())
+    return [paths[sha256] for sha256, _ in manifest]
+
+
+async def _read_chunk(storage_path: str) -> bytes:
+    return b"".join([piece async for piece in storage_for(storage_path).iter_chunks(storage_path)])
+
+
+# Reassembles a version in order. The next chunk is fetched while the current
+# one is sent, so at most two chunks are held in memory.
+async def iter_version(storage_paths: list[str]) -> AsyncIterator[bytes]:
+    pending = asyncio.create_task(_read_chunk(storage_paths[0])) if storage_paths else None
+    try:
+        for i in range(len(storage_paths)):
+            data = await pending
+            pending = asyncio.create_task(_read_chunk(storage_paths[i + 1])) if i + 1 < len(storage_paths) else None
+            yield data
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+async def collect_chunks() -> int:
+    async with SessionLocal() as db:
+        cutoff = datetime.utcnow() - timedelta(seconds=CHUNK_GC_GRACE)
+        unreferenced = (file_chunk.ref_count <= 0, file_chunk.updated_at < cutoff)
+        candidates = (await db.execute(
+            select(file_chunk.org_id, file_chunk.chunk_hash).where(*unreferenced).limit(CHUNK_GC_BATCH)
+        )).all()
+        if not candidates:
+            return 0
+        keys = [(row.org_id, row.chunk_hash) for row in candidates]
+        await lock_objects(db, [name for org_id, sha256 in keys for name in _lock_names(org_id, [sha256])])
+        # Re-checked under the locks: a commit may have referenced them since.
+        deleted = (await db.execute(
+            delete(file_chunk).where(
+                *unreferenced,
+                tuple_(file_chunk.org_id, file_chunk.chunk_hash).in_(keys),
+            ).returning(file_chunk.storage_path)
+        )).scalars().all()
+        by_backend = {}
+        for storage_path in deleted:
+            by_backend.setdefault(storage_for(storage_path), []).append(storage_path)
+        for storage, storage_paths in by_backend.items():
+            await storage.delete_many(storage_paths)
+        await db.commit()
+        return len(deleted)
+
+
+async def collect_chunks_forever(interval: int):
+    while True:
+        try:
+            while await collect_chunks() >= CHUNK_GC_BATCH:
+                pass
+        except Exception:
+            logger.exception("Chunk collection failed")
+        await asyncio.sleep(interval)
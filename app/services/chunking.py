@@ -0,0 +1,90 @@
+# Content-defined chunking for versioned uploads. A chunk ends after byte i
+# when the gear rolling hash h = (h << 1) + GEAR[byte] (mod 2**32) has its top
+# CHUNK_MASK_BITS bits clear, so boundaries follow the content and an edit
+# only changes the chunks around it. chunkBoundaries in
+# filestack/src/api/client.ts does the same byte by byte; both must cut at
+# the same offsets.
+import hashlib
+
+import numpy as np
+
+CHUNK_MIN_SIZE = 256 * 1024
+CHUNK_MAX_SIZE = 4 * 1024 * 1024
+# A cut point every 2**20 bytes on average after the minimum size.
+CHUNK_MASK_BITS = 20
+_MASK = np.uint32(((1 << CHUNK_MASK_BITS) - 1) << (32 - CHUNK_MASK_BITS))
+# h depends only on the last 32 bytes: older bytes are shifted out.
+_WINDOW = 32
+# Bytes hashed per pass when chunking a stream.
+_SEGMENT_SIZE = 16 * 1024 * 1024
+
+
+def _mix32(value: int) -> int:
+    value ^= value >> 16
+    value = (value * 0x85EBCA6B) & 0xFFFFFFFF
+    value ^= value >> 13
+    value = (value * 0xC2B2AE35) & 0xFFFFFFFF
+    return value ^ (value >> 16)
+
+
+GEAR = np.array([_mix32(i + 1) for i in range(256)], dtype=np.uint32)
+
+
+# End offsets (exclusive) of every byte in `data` whose hash is a cut point.
+# `context` is up to _WINDOW bytes preceding `data` in the stream.
+def _cut_points(data: bytes, context: bytes = b"") -> np.ndarray:
+    hashes = GEAR[np.frombuffer(context + data, dtype=np.uint8)]
+    # h_i = sum(GEAR[byte_{i-j}] << j for j < 32), built by doubling the
+    # window: after the pass for `span`, hashes cover 2 * span bytes.
+    span = 1
+    while span < _WINDOW:
+        hashes[span:] += hashes[:-span] << np.uint32(span)
+        span *= 2
+    return np.flatnonzero((hashes[len(context):] & _MASK) == 0) + 1
+
+
+# Cuts `data` into chunks, keeping back the tail that may still grow unless
+# `final`. Returns the chunk lengths and the number of bytes consumed.
+def _split(data: bytes, context: bytes, final: bool) -> tuple[list[int], int]:
+    points = _cut_points(data, context)
+    lengths = []
+    start = 0
+    while len(data) - start >= (1 if final else CHUNK_MAX_SIZE):
+        i = np.searchsorted(points, start + CHUNK_MIN_SIZE)
+        end = int(points[i]) if i < len(points) and points[i] <= start + CHUNK_MAX_SIZE else start + CHUNK_MAX_SIZE
+        end = min(end, len(data))
+        lengths.append(end - start)
+        start = end
+    return lengths, start
+
+
+# Splits a byte stream into chunks as it arrives: feed() returns the chunks
+# completed so far, finish() the rest.
+class Chunker:
+    def __init__(self):
+        self._buffer = bytearray()
+        self._context = b""
+
+    def _take(self, final: bool) -> list[bytes]:
+        data = bytes(self._buffer)
+        lengths, consumed = _split(data, self._context, final)
+        chunks = []
+        start = 0
+        for length in lengths:
+            chunks.append(data[start:start + length])
+            start += length
+        if consumed:
+            self._context = (self._context + data[:consumed])[-_WINDOW:]
+            del self._buffer[:consumed]
+        return chunks
+
+    def feed(self, data: bytes) -> list[bytes]:
+        self._buffer += data
+        return self._take(False) if len(self._buffer) >= _SEGMENT_SIZE else []
+
+    def finish(self) -> list[bytes]:
+        return self._take(True)
+
+
+def chunk_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
@@ -0,0 +1,296 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from starlette.concurrency import run_in_threadpool
+
+from dbConfig.database import SessionLocal
+from database_model.database_model import content_metadata as meta_data
+from database_model.database_model import file_info as file_data
+from app.services import extractors
+from app.services.content_search import metadata_update
+from app.services.storage import storage_for
+
+logger = logging.getLogger(__name__)
+
+# Extraction processes; 0 turns the pipeline off.
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+EXTRACT_BATCH_SIZE = int(os.getenv("EXTRACT_BATCH_SIZE", 16))
+EXTRACT_POLL_INTERVAL = float(os.getenv("EXTRACT_POLL_INTERVAL", 30))
+# PDFs and DOCX larger than this are skipped; text and CSV only read this much.
+EXTRACT_MAX_BYTES = int(os.getenv("EXTRACT_MAX_BYTES", 50 * 1024 * 1024))
+EXTRACT_TEXT_BYTES = int(os.getenv("EXTRACT_TEXT_BYTES", 2 * 1024 * 1024))
+EXTRACT_RANGE_SIZE = 1024 * 1024
+# A claim older than this belongs to a worker that died and is taken over.
+EXTRACT_STALE_AFTER = int(os.getenv("EXTRACT_STALE_AFTER", 600))
+# Storage errors and crashed worker processes leave the row in "retry" for
+# this long; after EXTRACT_MAX_ATTEMPTS of them it is marked failed.
+EXTRACT_RETRY_AFTER = int(os.getenv("EXTRACT_RETRY_AFTER", 300))
+EXTRACT_MAX_ATTEMPTS = int(os.getenv("EXTRACT_MAX_ATTEMPTS", 3))
+
+
+# Streams the first `limit` bytes of an object into a temp file in ranges and
+# returns its path; the caller unlinks it.
+async def fetch_to_temp(storage_path: str, limit: int, prefix: str) -> str:
+    storage = storage_for(storage_path)
+    out = tempfile.NamedTemporaryFile(prefix=prefix, delete=False)
+    try:
+        offset = 0
+        while offset < limit:
+            chunk = await storage.read_range(storage_path, offset, min(EXTRACT_RANGE_SIZE, limit - offset))
+            if not chunk:
+                break
+            await run_in_threadpool(out.write, chunk)
+            offset += len(chunk)
+    except BaseException:
+        out.close()
+        os.unlink(out.name)
+        raise
+    out.close()
+    return out.name
+
+
+# Fills the metadata table from uploaded content, off the request path.
+# Each round claims a batch of files whose metadata is missing or was made
+# from other content (checksum), by upserting "processing" rows, so several
+# API workers can run this side by side. Objects are read from storage in
+# ranges into temp files and parsed in a process pool; results, including
+# the content search vector, are written with one UPDATE per batch.
+class ContentExtractor:
+    def __init__(self, workers: int = EXTRACT_WORKERS, batch_size: int = EXTRACT_BATCH_SIZE, poll_interval: float = EXTRACT_POLL_INTERVAL):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._pool: ProcessPoolExecutor | None = None
+
+    # Called after an upload commits; extraction starts without waiting for the poll.
+    def notify(self):
+        self._wake.set()
+
+    async def start(self):
+        if self._task is None and self.workers > 0:
+            self._pool = self._new_pool()
+            self._task = asyncio.create_task(self._run())
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    # A worker process that dies (segfault, OOM kill) breaks the whole pool.
+    # Every task that was using it ends up here; only the first replaces it.
+    def _restart_pool(self, broken: ProcessPoolExecutor):
+        if self._pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._new_pool()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self):
+        # The first pass after startup backfills every file; later passes
+        # only look at recent uploads.
+        since = None
+        while True:
+            started = datetime.utcnow()
+            try:
+                while await self.process_batch(since) == self.batch_size:
+                    pass
+                since = started - timedelta(seconds=EXTRACT_STALE_AFTER)
+            except Exception:
+                logger.exception("Content extraction failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _claim(self, since: datetime | None) -> list:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=EXTRACT_STALE_AFTER)
+        retry_before = now - timedelta(seconds=EXTRACT_RETRY_AFTER)
+        reclaim = or_(
+            and_(meta_data.status == "processing", meta_data.indexed_at < stale),
+            and_(meta_data.status == "retry", meta_data.indexed_at < retry_before),
+        )
+        candidates = select(
+            func.gen_random_uuid(),
+            file_data.file_id,
+            file_data.org_id,
+            file_data.checksum,
+            file_data.file_type,
+            literal("processing"),
+            func.now(),
+        ).outerjoin(meta_data, meta_data.file_id == file_data.file_id).where(
+            file_data.is_deleted == False,
+            or_(
+                meta_data.file_id.is_(None),
+                meta_data.checksum.is_distinct_from(file_data.checksum),
+                reclaim,
+            ),
+        ).order_by(file_data.uploaded_at).limit(self.batch_size)
+        if since is not None:
+            # Retries that are due are picked up however old the file is.
+            candidates = candidates.where(file_data.file_id.in_(
+                select(file_data.file_id).where(file_data.uploaded_at >= since).union(
+                    select(meta_data.file_id).where(meta_data.status == "retry", meta_data.indexed_at < retry_before)
+                )
+            ))
+
+        stmt = pg_insert(meta_data).from_select(
+            ["meta_id", "file_id", "org_id", "checksum", "content_type", "status", "indexed_at"], candidates
+        )
+        # A row another worker claimed (or finished) in the meantime is left alone.
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[meta_data.file_id],
+            set_={
+                "org_id": stmt.excluded.org_id,
+                "checksum": stmt.excluded.checksum,
+                "content_type": stmt.excluded.content_type,
+                "status": "processing",
+                "indexed_at": func.now(),
+                # New content starts over.
+                "attempts": case(
+                    (meta_data.checksum.is_distinct_from(stmt.excluded.checksum), 0),
+                    else_=meta_data.attempts,
+                ),
+            },
+            where=or_(
+                meta_data.checksum.is_distinct_from(stmt.excluded.checksum),
+                reclaim,
+            ),
+        ).returning(meta_data.meta_id, meta_data.file_id, meta_data.checksum, meta_data.attempts)
+
+        async with SessionLocal() as db:
+            claimed = (await db.execute(stmt)).all()
+            await db.commit()
+            if not claimed:
+                return []
+            files = {
+                row.file_id: row
+                for row in await db.execute(select(
+                    file_data.file_id, file_data.filename, file_data.file_type, file_data.storage_path
+                ).where(file_data.file_id.in_([row.file_id for row in claimed])))
+            }
+            # Content already extracted for another file is reused.
+            done = {
+                row.checksum: row
+                for row in await db.execute(select(
+                    meta_data.checksum, meta_data.summary, meta_data.keywords, meta_data.lang, meta_data.content
+                ).where(
+                    meta_data.checksum.in_({row.checksum for row in claimed}),
+                    meta_data.status == "done",
+                ).distinct(meta_data.checksum))
+            }
+        return [(row, files[row.file_id], done.get(row.checksum)) for row in claimed]
+
+    async def process_batch(self, since: datetime | None = None) -> int:
+        claimed = await self._claim(since)
+        if not claimed:
+            return 0
+
+        by_checksum: dict[str, asyncio.Task] = {}
+        jobs = []
+        for claim, file, known in claimed:
+            if known is not None:
+                jobs.append((claim, None, {
+                    "status": "done",
+                    "summary": known.summary,
+                    "keywords": known.keywords,
+                    "lang": known.lang,
+                    "content": known.content,
+                }))
+                continue
+            # Files without a checksum share nothing.
+            key = claim.checksum or claim.file_id
+            task = by_checksum.get(key)
+            if task is None:
+                task = by_checksum[key] = asyncio.ensure_future(self._extract(file))
+            jobs.append((claim, task, None))
+
+        rows = []
+        for claim, task, result in jobs:
+            if task is not None:
+                result = await task
+            status, attempts = result["status"], claim.attempts
+            if status == "retry":
+                attempts += 1
+                if attempts >= EXTRACT_MAX_ATTEMPTS:
+                    status = "failed"
+            rows.append({
+                "b_meta_id": claim.meta_id,
+                "b_status": status,
+                "b_attempts": attempts,
+                "b_summary": result.get("summary"),
+                "b_keywords": result.get("keywords"),
+                "b_lang": result.get("lang"),
+                "b_content": result.get("content"),
+                "b_indexed_at": datetime.utcnow(),
+            })
+        async with SessionLocal() as db:
+            await db.execute(metadata_update(), rows)
+            await db.commit()
+        return len(claimed)
+
+    async def _extract(self, file) -> dict:
+        kind = extractors.kind_for(file.file_type, file.filename)
+        if kind is None:
+            return {"status": "skipped"}
+        storage_path = (file.storage_path or "").strip()
+        if not storage_path or storage_path == "local":
+            return {"status": "skipped"}
+        path = None
+        pool = self._pool
+        try:
+            try:
+                path = await self._fetch(storage_path, kind)
+            except Exception:
+                logger.exception("Fetching %s for extraction failed", file.file_id)
+                return {"status": "retry"}
+            if path is None:
+                return {"status": "skipped"}
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(pool, extractors.extract, path, kind)
+            return {"status": "done", **result}
+        except BrokenProcessPool:
+            # Not necessarily this file's fault; the attempt count stops a
+            # file that keeps killing its worker.
+            logger.error("Extraction worker died while extracting %s (%s)", file.file_id, kind)
+            self._restart_pool(pool)
+            return {"status": "retry"}
+        except Exception:
+            logger.exception("Extracting %s (%s) failed", file.file_id, kind)
+            return {"status": "failed"}
+        finally:
+            if path is not None:
+                os.unlink(path)
+
+    # The object (or, for text, its first EXTRACT_TEXT_BYTES) in a temp file.
+    # None when the object is too large to parse.
+    async def _fetch(self, storage_path: str, kind: str) -> str | None:
+        head = await storage_for(storage_path).head(storage_path)
+        if head is None:
+            raise FileNotFoundError(storage_path)
+        if extractors.needs_whole_file(kind):
+            if head["size"] > EXTRACT_MAX_BYTES:
+                return None
+            limit = head["size"]
+        else:
+            limit = min(head["size"], EXTRACT_TEXT_BYTES)
+        return await fetch_to_temp(storage_path, limit, "extract-")
+
+
+content_extractor = ContentExtractor()
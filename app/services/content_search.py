@@ -0,0 +1,82 @@
+import os
+import re
+
+from sqlalchemy import Text, bindparam, func, literal_column, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database_model.database_model import content_metadata as meta_data
+from database_model.database_model import file_info as file_data
+
+# Text search configuration used both to index content and to parse queries.
+CONTENT_SEARCH_CONFIG = os.getenv("CONTENT_SEARCH_CONFIG", "english")
+if not re.fullmatch(r"[a-z_]+", CONTENT_SEARCH_CONFIG):
+    raise RuntimeError(f"Invalid CONTENT_SEARCH_CONFIG: {CONTENT_SEARCH_CONFIG}")
+_config = literal_column(f"'{CONTENT_SEARCH_CONFIG}'::regconfig")
+
+HEADLINE_OPTIONS = "MaxFragments=2, MinWords=5, MaxWords=20, FragmentDelimiter= … , StartSel=<mark>, StopSel=</mark>"
+
+
+def _weighted(text_value, weight: str):
+    return func.setweight(func.to_tsvector(_config, func.coalesce(text_value, "")), literal_column(f"'{weight}'"))
+
+
+# tsvector for a metadata row: keywords rank above the summary (the opening
+# sentences), which ranks above the rest of the text.
+def search_vector(keywords, summary, content):
+    return _weighted(func.array_to_string(keywords, " "), "A").op("||")(
+        _weighted(summary, "B")
+    ).op("||")(_weighted(content, "C"))
+
+
+# Executemany UPDATE used by the extraction workers to store their results;
+# the search vector is computed by Postgres from the same parameters.
+def metadata_update():
+    keywords = bindparam("b_keywords", type_=ARRAY(Text))
+    summary = bindparam("b_summary", type_=Text)
+    content = bindparam("b_content", type_=Text)
+    return meta_data.__table__.update().where(meta_data.meta_id == bindparam("b_meta_id")).values(
+        status=bindparam("b_status"),
+        attempts=bindparam("b_attempts"),
+        summary=summary,
+        keywords=keywords,
+        lang=bindparam("b_lang"),
+        content=content,
+        indexed_at=bindparam("b_indexed_at"),
+        search_vector=search_vector(keywords, summary, content),
+    )
+
+
+def _escape_html(value):
+    return func.replace(func.replace(func.replace(value, "&", "&amp;"), "<", "&lt;"), ">", "&gt;")
+
+
+# Ranked matches for a web-search style query ("quoted phrases", or, -not)
+# within one org. Snippets are HTML-escaped with matches wrapped in <mark>.
+async def search_content(db: AsyncSession, org_id, q: str, limit: int, offset: int) -> list:
+    query = func.websearch_to_tsquery(_config, q)
+    rank = func.ts_rank_cd(meta_data.search_vector, query, 32).label("rank")
+    # Rank from the index alone, and only build snippets for the page.
+    page = select(meta_data.meta_id, rank).where(
+        meta_data.org_id == org_id,
+        meta_data.search_vector.op("@@")(query),
+    ).order_by(rank.desc(), meta_data.meta_id).limit(limit).offset(offset).subquery()
+
+    return (await db.execute(select(
+        file_data.file_id,
+        file_data.filename,
+        file_data.file_type,
+        file_data.file_size,
+        file_data.uploaded_at,
+        meta_data.summary,
+        meta_data.keywords,
+        meta_data.lang,
+        page.c.rank,
+        func.ts_headline(_config, _escape_html(meta_data.content), query, HEADLINE_OPTIONS).label("snippet"),
+    ).select_from(page).join(
+        meta_data, meta_data.meta_id == page.c.meta_id
+    ).join(
+        file_data, file_data.file_id == meta_data.file_id
+    ).where(
+        file_data.is_deleted == False,
+    ).order_by(page.c.rank.desc(), page.c.meta_id))).all()
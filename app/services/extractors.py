@@ -0,0 +1,156 @@
+# Text, keyword and language extraction for the content extraction workers.
+# Runs inside worker processes, so it imports nothing from the app.
+import csv
+import io
+import re
+import zipfile
+from collections import Counter
+from xml.etree import ElementTree
+
+SUMMARY_CHARS = 300
+MAX_KEYWORDS = 10
+# Extracted text kept per file (and searched by content search).
+MAX_CONTENT_CHARS = 100_000
+# Uncompressed size of a DOCX's document.xml that is parsed at all; zip
+# entries can expand a thousandfold, so this is checked before reading.
+MAX_DOCX_XML_BYTES = 64 * 1024 * 1024
+
+TEXT_TYPES = {"application/json", "application/xml", "application/x-yaml", "application/javascript"}
+TEXT_EXTENSIONS = {".txt", ".md", ".log", ".json", ".xml", ".yaml", ".yml", ".html", ".htm", ".rst", ".ini", ".py", ".js", ".ts"}
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+STOPWORDS = {
+    "en": "the and of to in is that for it with as was on are be this by or at from an not have has but which were their they you we all can will been more one its".split(),
+    "es": "de la que el en los del las por con una para como pero sus más este esta ser son también fue han entre".split(),
+    "fr": "le la les de des du et en un une est pour que qui dans sur pas par plus avec sont ce cette mais ont aux".split(),
+    "de": "der die das und ist nicht mit den dem des sich auf für ein eine auch als von werden wird sind bei aus oder".split(),
+    "pt": "de que não uma para com os das dos por mais como mas foi são pelo pela também seu sua".split(),
+    "it": "di che il la per non una sono con del della gli le anche come più nel alla questo questa".split(),
+    "nl": "de het een van en dat niet zijn op voor met ook aan als maar bij door wordt worden deze".split(),
+}
+_STOPWORDS = {lang: set(words) for lang, words in STOPWORDS.items()}
+_ALL_STOPWORDS = set().union(*_STOPWORDS.values())
+_WORD = re.compile(r"[^\W\d_]{2,}", re.UNICODE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+# Which extractor handles a file, or None when the type is not supported.
+def kind_for(content_type: str | None, filename: str | None) -> str | None:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    extension = "." + (filename or "").rsplit(".", 1)[-1].lower() if "." in (filename or "") else ""
+    if content_type == "application/pdf" or extension == ".pdf":
+        return "pdf"
+    if content_type == DOCX_TYPE or extension == ".docx":
+        return "docx"
+    if content_type in ("text/csv", "application/csv") or extension == ".csv":
+        return "csv"
+    if content_type.startswith("text/") or content_type in TEXT_TYPES or extension in TEXT_EXTENSIONS:
+        return "text"
+    return None
+
+
+# Text and CSV only need their beginning; PDF and DOCX keep their index at
+# the end, so the whole object is needed.
+def needs_whole_file(kind: str) -> bool:
+    return kind in ("pdf", "docx")
+
+
+def _decode(data: bytes) -> str:
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return data.decode("utf-16", errors="ignore")
+    return data.decode("utf-8", errors="ignore")
+
+
+def _csv_text(data: bytes) -> str:
+    lines = []
+    for row in csv.reader(io.StringIO(_decode(data), newline="")):
+        lines.append(" ".join(cell.strip() for cell in row if cell.strip()))
+    return "\n".join(lines)
+
+
+# document.xml is parsed as a stream, paragraph by paragraph, and reading
+# stops once MAX_CONTENT_CHARS of text is in.
+def _docx_text(path: str) -> str:
+    namespace = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+    paragraphs = []
+    size = 0
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo("word/document.xml")
+        if info.file_size > MAX_DOCX_XML_BYTES:
+            raise ValueError(f"word/document.xml is {info.file_size} bytes uncompressed")
+        with archive.open(info) as document:
+            for _, element in ElementTree.iterparse(document):
+                if element.tag != f"{namespace}p":
+                    continue
+                text = "".join(node.text or "" for node in element.iter(f"{namespace}t"))
+                element.clear()
+                if text:
+                    paragraphs.append(text)
+                    size += len(text)
+                    if size >= MAX_CONTENT_CHARS:
+                        break
+    return "\n".join(paragraphs)
+
+
+def _pdf_text(path: str) -> str:
+    from pypdf import PdfReader
+
+    pages = []
+    size = 0
+    for page in PdfReader(path).pages:
+        text = page.extract_text() or ""
+        pages.append(text)
+        size += len(text)
+        if size >= MAX_CONTENT_CHARS:
+            break
+    return "\n".join(pages)
+
+
+def detect_language(words: list[str]) -> str | None:
+    hits = Counter()
+    for word in words[:5000]:
+        for lang, stopwords in _STOPWORDS.items():
+            if word in stopwords:
+                hits[lang] += 1
+    if not hits:
+        return None
+    lang, count = hits.most_common(1)[0]
+    return lang if count >= 3 else None
+
+
+def keywords(words: list[str], limit: int = MAX_KEYWORDS) -> list[str]:
+    counts = Counter(word for word in words if len(word) > 3 and word not in _ALL_STOPWORDS)
+    return [word for word, _ in counts.most_common(limit)]
+
+
+def summarize(text: str) -> str | None:
+    text = " ".join(text.split())
+    if not text:
+        return None
+    summary = ""
+    for sentence in _SENTENCE_END.split(text):
+        if summary and len(summary) + len(sentence) + 1 > SUMMARY_CHARS:
+            break
+        summary = f"{summary} {sentence}".strip()
+    return summary[:SUMMARY_CHARS]
+
+
+# Entry point for the process pool: the object (or its first bytes) has been
+# written to `path`.
+def extract(path: str, kind: str) -> dict:
+    if kind == "pdf":
+        text = _pdf_text(path)
+    elif kind == "docx":
+        text = _docx_text(path)
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+        text = _csv_text(data) if kind == "csv" else _decode(data)
+    text = text[:MAX_CONTENT_CHARS].replace("\x00", "")
+    words = [word.lower() for word in _WORD.findall(text)]
+    return {
+        "summary": summarize(text),
+        "keywords": keywords(words),
+        "lang": detect_language(words),
+        "content": text,
+    }
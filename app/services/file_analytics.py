@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dbConfig.database import SessionLocal
+from database_model.database_model import file_analytics as analytics_data
+from app.services.hyperloglog import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", 10))
+# Flush early once this many files have unflushed activity.
+ANALYTICS_MAX_PENDING = int(os.getenv("ANALYTICS_MAX_PENDING", 10000))
+# Files merged per transaction; keeps each statement under asyncpg's
+# 32767 bind parameter limit.
+ANALYTICS_BATCH_SIZE = 1000
+
+
+class _Pending:
+    __slots__ = ("views", "downloads", "last_accessed", "users")
+
+    def __init__(self):
+        self.views = 0
+        self.downloads = 0
+        self.last_accessed = None
+        self.users = set()
+
+
+# Counts views/downloads per file in memory and merges them into
+# file_analytics every flush_interval, so a popular file costs one row update
+# per worker per interval instead of one per request. Distinct users are
+# kept as a HyperLogLog sketch next to the counters.
+class AnalyticsAggregator:
+    def __init__(self, flush_interval: float = ANALYTICS_FLUSH_INTERVAL, max_pending: int = ANALYTICS_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: dict[str, _Pending] = {}
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def record(self, file_id, user_id, download: bool = False):
+        pending = self._pending.get(str(file_id))
+        if pending is None:
+            pending = self._pending[str(file_id)] = _Pending()
+            if len(self._pending) >= self.max_pending:
+                self._wake.set()
+        if download:
+            pending.downloads += 1
+        else:
+            pending.views += 1
+        pending.last_accessed = datetime.utcnow()
+        pending.users.add(str(user_id))
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Flushing file analytics failed")
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        file_ids = sorted(pending)
+        for start in range(0, len(file_ids), ANALYTICS_BATCH_SIZE):
+            batch = {file_id: pending[file_id] for file_id in file_ids[start:start + ANALYTICS_BATCH_SIZE]}
+            try:
+                async with SessionLocal() as db:
+                    await merge_into(db, batch)
+                    await db.commit()
+            except BaseException:
+                # Keep the unwritten counts for the next attempt.
+                for file_id in file_ids[start:]:
+                    self._requeue(file_id, pending[file_id])
+                raise
+
+    def _requeue(self, file_id: str, counts: _Pending):
+        current = self._pending.setdefault(file_id, _Pending())
+        current.views += counts.views
+        current.downloads += counts.downloads
+        current.last_accessed = max(filter(None, (current.last_accessed, counts.last_accessed)))
+        current.users |= counts.users
+
+
+async def merge_into(db: AsyncSession, pending: dict[str, _Pending]):
+    file_ids = sorted(pending)
+    # Make sure every row exists, then lock them in a fixed order: the
+    # sketches are merged here, so concurrent flushes must not interleave.
+    await db.execute(
+        pg_insert(analytics_data).values([
+            {"file_id": file_id, "view_count": 0, "download_count": 0, "unique_users": 0}
+            for file_id in file_ids
+        ]).on_conflict_do_nothing(index_elements=[analytics_data.file_id])
+    )
+    sketches = {
+        str(row.file_id): row.hll_sketch
+        for row in await db.execute(
+            select(analytics_data.file_id, analytics_data.hll_sketch).where(
+                analytics_data.file_id.in_(file_ids)
+            ).order_by(analytics_data.file_id).with_for_update()
+        )
+    }
+
+    rows = []
+    for file_id in file_ids:
+        counts = pending[file_id]
+        stored = sketches.get(file_id)
+        sketch = HyperLogLog.from_bytes(stored) if stored else HyperLogLog()
+        for user_id in counts.users:
+            sketch.add(user_id)
+        rows.append({
+            "file_id": file_id,
+            "view_count": counts.views,
+            "download_count": counts.downloads,
+            "last_accesed": counts.last_accessed,
+            "unique_users": sketch.count(),
+            "hll_sketch": sketch.to_bytes(),
+        })
+    stmt = pg_insert(analytics_data).values(rows)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[analytics_data.file_id],
+        set_={
+            "view_count": analytics_data.view_count + stmt.excluded.view_count,
+            "download_count": analytics_data.download_count + stmt.excluded.download_count,
+            "last_accesed": func.greatest(analytics_data.last_accesed, stmt.excluded.last_accesed),
+            "unique_users": stmt.excluded.unique_users,
+            "hll_sketch": stmt.excluded.hll_sketch,
+        },
+    ))
+
+
+analytics = AnalyticsAggregator()
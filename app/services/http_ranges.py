@@ -0,0 +1,150 @@
+import re
+from secrets import token_hex
+from typing import AsyncIterator, Callable
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+# Requests for more ranges than this get the whole object, as RFC 9110
+# allows: many tiny ranges cost far more to serve than they save.
+MAX_RANGES = 16
+_RANGE_SPEC = re.compile(r"(\d*)-(\d*)")
+# Media types a browser runs script in (HTML, SVG and other XML, JavaScript).
+_ACTIVE_TYPE = re.compile(r"html|xml|svg|javascript|ecmascript")
+
+
+def checksum_etag(checksum: str | None) -> str | None:
+    return f'"{checksum}"' if checksum else None
+
+
+def content_disposition(disposition: str, filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+def is_active_type(media_type: str) -> bool:
+    return bool(_ACTIVE_TYPE.search(media_type.split(";")[0].strip().lower()))
+
+
+# If-None-Match uses the weak comparison: W/"x" matches "x".
+def etag_matches(header: str | None, etag: str | None) -> bool:
+    if not header or not etag:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+# Byte ranges [start, end) asked for by a Range header, sorted with
+# overlapping and adjacent ones merged. None means the header is ignored and
+# the whole object is sent: it is malformed, not in bytes, or asks for too
+# many ranges. Raises 416 when no range overlaps the object.
+def parse_ranges(header: str, size: int) -> list[tuple[int, int]] | None:
+    units, _, specs = header.partition("=")
+    if units.strip().lower() != "bytes" or size == 0:
+        return None
+    ranges = []
+    for spec in specs.split(","):
+        match = _RANGE_SPEC.fullmatch(spec.strip())
+        if not match or match.groups() == ("", ""):
+            return None
+        first, last = match.groups()
+        if not first:
+            # Suffix range: the last N bytes.
+            if int(last) > 0:
+                ranges.append((max(size - int(last), 0), size))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, min(int(last) + 1, size) if last else size))
+    if not ranges:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged if len(merged) <= MAX_RANGES else None
+
+
+# FileResponse would apply the Range header again; by the time it is used the
+# request has been resolved to the whole file.
+class _WholeFileResponse(FileResponse):
+    async def __call__(self, scope, receive, send):
+        headers = [(name, value) for name, value in scope["headers"] if name not in (b"range", b"if-range")]
+        await super().__call__({**scope, "headers": headers}, receive, send)
+
+
+# Response for a stored object honouring If-None-Match, If-Range and Range
+# (one range, or several as multipart/byteranges). `read(start, length)`
+# streams bytes from the backend; a local file is sent by path instead, which
+# servers supporting the ASGI pathsend extension hand to sendfile.
+def object_response(
+    request: Request,
+    size: int,
+    etag: str | None,
+    media_type: str,
+    read: Callable[[int, int], AsyncIterator[bytes]],
+    headers: dict,
+    local_path=None,
+) -> Response:
+    # Stored bytes come from uploaders and are served from the API origin:
+    # the browser must not sniff them into something else, and whatever it
+    # renders runs without scripts, forms or the origin's cookies.
+    headers = {
+        **headers,
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff",
+        "Content-Security-Policy": "sandbox",
+    }
+    if etag:
+        headers["ETag"] = etag
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    ranges = None
+    if_range = request.headers.get("if-range")
+    # If-Range only keeps the range while the client's copy is current.
+    if "range" in request.headers and (if_range is None or (etag is not None and if_range == etag)):
+        ranges = parse_ranges(request.headers["range"], size)
+
+    if ranges is None:
+        if local_path is not None:
+            return _WholeFileResponse(local_path, media_type=media_type, headers=headers)
+        return StreamingResponse(read(0, size), media_type=media_type, headers={**headers, "Content-Length": str(size)})
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        return StreamingResponse(read(start, end - start), status_code=206, media_type=media_type, headers={
+            **headers,
+            "Content-Range": f"bytes {start}-{end - 1}/{size}",
+            "Content-Length": str(end - start),
+        })
+
+    boundary = token_hex(13)
+    parts = []
+    for start, end in ranges:
+        # Parts after the first are separated from the previous one by CRLF.
+        delimiter = f"\r\n--{boundary}\r\n" if parts else f"--{boundary}\r\n"
+        part_header = f"{delimiter}Content-Type: {media_type}\r\nContent-Range: bytes {start}-{end - 1}/{size}\r\n\r\n"
+        parts.append((part_header.encode("latin-1"), start, end))
+    closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+
+    async def body():
+        for part_header, start, end in parts:
+            yield part_header
+            async for chunk in read(start, end - start):
+                yield chunk
+        yield closing
+
+    length = sum(len(part_header) + end - start for part_header, start, end in parts) + len(closing)
+    return StreamingResponse(body(), status_code=206, media_type=f"multipart/byteranges; boundary={boundary}", headers={
+        **headers,
+        "Content-Length": str(length),
+    })
@@ -0,0 +1,102 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Prometheus metrics for the API. With several worker processes, set
+# PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers so
+# /metrics reports all of them, not just the one that answers the scrape.
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "filetracker_http_request_duration_seconds",
+    "HTTP request latency by route template and status.",
+    ["method", "route", "status"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "filetracker_db_query_duration_seconds",
+    "SQL statement execution time by statement type.",
+    ["statement"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "filetracker_db_pool_checkout_seconds",
+    "Time spent waiting for a database connection from the pool.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+S3_CALL_SECONDS = Histogram(
+    "filetracker_s3_call_duration_seconds",
+    "S3 API call latency by operation.",
+    ["operation"],
+)
+S3_CALL_ERRORS = Counter(
+    "filetracker_s3_call_errors_total",
+    "Failed S3 API calls by operation and error code.",
+    ["operation", "code"],
+)
+SUPABASE_CALL_SECONDS = Histogram(
+    "filetracker_supabase_call_duration_seconds",
+    "Supabase Auth request latency by endpoint (one sample per attempt).",
+    ["method", "path"],
+)
+SUPABASE_CALL_ERRORS = Counter(
+    "filetracker_supabase_call_errors_total",
+    "Supabase Auth attempts that failed in transport or returned 5xx.",
+    ["method", "path", "reason"],
+)
+UPLOAD_BYTES = Counter(
+    "filetracker_upload_bytes_total",
+    "Bytes uploaded by upload flow; use rate() for bytes/sec.",
+    ["flow"],
+)
+
+
+def _statement_type(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "LOCK") else "OTHER"
+
+
+def instrument_engine(engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_SECONDS.labels(_statement_type(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+
+# SQLAlchemy has no "before checkout" event, so the wait for a pooled
+# connection is timed around the pool's own get.
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
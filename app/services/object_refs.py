@@ -0,0 +1,68 @@
+from sqlalchemy import Text, any_, bindparam, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database_model.database_model import file_info as file_data
+from app.services.storage import StorageBackend
+
+# Uploads are stored content-addressed: every live file_data row with the same
+# sha256 in an org points at one object, and that object is deleted only when
+# its last live row goes. Writers and deleters of a given object serialise on
+# a transaction-scoped advisory lock keyed by its storage path.
+
+
+def content_key(storage: StorageBackend, org_id, sha256: str) -> str:
+    return f"{storage.path_prefix}{org_id}/objects/{sha256}"
+
+
+async def lock_object(db: AsyncSession, storage_path: str):
+    await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(storage_path))))
+
+
+# Locks several objects in one round trip, in sorted order so concurrent
+# batches cannot deadlock (unnest returns elements in array order).
+async def lock_objects(db: AsyncSession, storage_paths):
+    storage_paths = sorted(set(storage_paths))
+    if storage_paths:
+        await db.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(p)) FROM unnest(:storage_paths) AS p").bindparams(
+                bindparam("storage_paths", type_=ARRAY(Text))
+            ),
+            {"storage_paths": storage_paths},
+        )
+
+
+async def find_object(db: AsyncSession, org_id, sha256: str) -> str | None:
+    return (await db.execute(
+        select(file_data.storage_path).where(
+            file_data.org_id == org_id,
+            file_data.checksum == sha256,
+            file_data.is_deleted == False,
+        ).limit(1)
+    )).scalar()
+
+
+async def has_references(db: AsyncSession, storage_path: str) -> bool:
+    return (await db.execute(
+        select(file_data.file_id).where(
+            file_data.storage_path == storage_path,
+            file_data.is_deleted == False,
+        ).limit(1)
+    )).first() is not None
+
+
+async def unreferenced(db: AsyncSession, storage_paths) -> set[str]:
+    storage_paths = set(storage_paths)
+    if not storage_paths:
+        return set()
+    live = (await db.execute(
+        select(file_data.storage_path).where(
+            file_data.storage_path == any_(bindparam("storage_paths", list(storage_paths), type_=ARRAY(Text))),
+            file_data.is_deleted == False,
+        ).distinct()
+    )).scalars()
+    return storage_paths - set(live)
+
+
+def uuid_array(name: str, values) -> bindparam:
+    return bindparam(name, list(values), type_=ARRAY(UUID(as_uuid=True)))
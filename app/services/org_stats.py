@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, literal_column, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dbConfig.database import SessionLocal, engine
+from database_model.database_model import file_info as file_data
+from database_model.database_model import organization as org_data
+from database_model.database_model import org_storage_stats as stats_data
+from app.services.quota import add_usage, lock_quota, rebuild_quotas
+
+logger = logging.getLogger(__name__)
+
+STATS_RECONCILE_INTERVAL = int(os.getenv("STATS_RECONCILE_INTERVAL", 3600))
+_RECONCILE_LOCK = "org_stats:reconcile"
+
+
+# Adds to the org's counters inside the caller's transaction, so the counters
+# commit (or roll back) together with the file_data change they describe.
+# The quota row is updated first: every writer locks it before the stats rows.
+async def apply_file_delta(db: AsyncSession, org_id, file_type: str | None, count_delta: int, bytes_delta: int):
+    await add_usage(db, org_id, bytes_delta)
+    stmt = pg_insert(stats_data).values(
+        org_id=org_id,
+        file_type=file_type or "",
+        file_count=count_delta,
+        total_bytes=bytes_delta,
+        updated_at=datetime.utcnow(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[stats_data.org_id, stats_data.file_type],
+        set_={
+            "file_count": stats_data.file_count + stmt.excluded.file_count,
+            "total_bytes": stats_data.total_bytes + stmt.excluded.total_bytes,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    await db.execute(stmt)
+
+
+async def get_org_stats(db: AsyncSession, org_id) -> dict:
+    rows = await db.execute(
+        select(stats_data.file_type, stats_data.file_count, stats_data.total_bytes).where(
+            stats_data.org_id == org_id,
+            stats_data.file_count > 0,
+        )
+    )
+    by_type = {row.file_type: {"files": row.file_count, "bytes": row.total_bytes} for row in rows}
+    return {
+        "total_files": sum(t["files"] for t in by_type.values()),
+        "storage_used": sum(t["bytes"] for t in by_type.values()),
+        "by_type": by_type,
+    }
+
+
+# Rebuilds one org's counters from file_data to repair any drift, in a
+# transaction of its own. Holding the org's quota row makes its uploads and
+# deletes wait for their counter update until the rebuild commits, so their
+# deltas land on top of the fresh totals; other orgs are not held up. The
+# quota is rebuilt from the fresh stats in the same transaction.
+async def reconcile_org(db: AsyncSession, org_id):
+    await lock_quota(db, org_id)
+    # Rendered inline: bound parameters would make the SELECT and GROUP BY
+    # expressions differ as far as Postgres can tell.
+    file_type = func.coalesce(file_data.file_type, literal_column("''"))
+    totals = select(
+        file_data.org_id,
+        file_type,
+        func.count(),
+        func.coalesce(func.sum(file_data.file_size), 0),
+        func.now(),
+    ).where(
+        file_data.org_id == org_id,
+        file_data.is_deleted == False,
+    ).group_by(file_data.org_id, file_type)
+    await db.execute(delete(stats_data).where(stats_data.org_id == org_id))
+    await db.execute(
+        insert(stats_data).from_select(
+            ["org_id", "file_type", "file_count", "total_bytes", "updated_at"],
+            totals,
+        )
+    )
+    await rebuild_quotas(db, org_id)
+    await db.commit()
+
+
+# Reconciles every org (or one), one org per transaction.
+async def reconcile(db: AsyncSession, org_id=None):
+    if org_id is not None:
+        org_ids = [org_id]
+    else:
+        org_ids = (await db.execute(select(org_data.org_id))).scalars().all()
+        await db.rollback()
+    for org_id in org_ids:
+        await reconcile_org(db, org_id)
+
+
+# Runs a pass every `interval` seconds, first one interval after startup so
+# workers booting together do not all rebuild at once. A session advisory
+# lock lets one worker reconcile at a time; the others skip that pass.
+async def reconcile_forever(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with engine.connect() as conn:
+                locked = (await conn.execute(select(func.pg_try_advisory_lock(func.hashtext(_RECONCILE_LOCK))))).scalar()
+                await conn.commit()
+                if not locked:
+                    continue
+                try:
+                    async with SessionLocal() as db:
+                        await reconcile(db)
+                finally:
+                    await conn.execute(select(func.pg_advisory_unlock(func.hashtext(_RECONCILE_LOCK))))
+                    await conn.commit()
+        except Exception:
+            logger.exception("Storage stats reconciliation failed")
@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, Text, and_, any_, bindparam, column, delete, func, literal, or_, select, true, tuple_, update, values
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dbConfig.database import SessionLocal
+from database_model.database_model import derived_asset
+from database_model.database_model import file_info as file_data
+from app.services import previews
+from app.services.content_extraction import fetch_to_temp
+from app.services.storage import StorageBackend, get_storage, storage_for
+
+logger = logging.getLogger(__name__)
+
+# Preview processes; 0 turns the pipeline off.
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", 1))
+PREVIEW_BATCH_SIZE = int(os.getenv("PREVIEW_BATCH_SIZE", 16))
+PREVIEW_POLL_INTERVAL = float(os.getenv("PREVIEW_POLL_INTERVAL", 30))
+# Images and PDFs larger than this get no preview; text only reads this much.
+PREVIEW_MAX_BYTES = int(os.getenv("PREVIEW_MAX_BYTES", 50 * 1024 * 1024))
+PREVIEW_TEXT_BYTES = 64 * 1024
+# A claim older than this belongs to a worker that died and is taken over.
+PREVIEW_STALE_AFTER = int(os.getenv("PREVIEW_STALE_AFTER", 600))
+# Storage errors and crashed worker processes leave rows in "retry" for this
+# long; after PREVIEW_MAX_ATTEMPTS of them they are marked failed.
+PREVIEW_RETRY_AFTER = int(os.getenv("PREVIEW_RETRY_AFTER", 300))
+PREVIEW_MAX_ATTEMPTS = int(os.getenv("PREVIEW_MAX_ATTEMPTS", 3))
+
+_EXTENSIONS = {"image/webp": "webp", "image/svg+xml": "svg"}
+
+
+def preview_key(storage: StorageBackend, org_id, checksum: str, size: int, content_type: str) -> str:
+    return f"{storage.path_prefix}{org_id}/previews/{checksum}/{size}.{_EXTENSIONS[content_type]}"
+
+
+# Fills derived_asset with thumbnails and previews of uploaded content, off
+# the request path. Assets are keyed by org, checksum and size, so files with
+# the same content share them. Claiming works like the content extractor's:
+# "processing" rows are upserted for (checksum, size) pairs that have none,
+# each object is read once for all of its sizes and rendered in a process
+# pool, and rows are filled in as the assets reach storage.
+class PreviewGenerator:
+    def __init__(self, workers: int = PREVIEW_WORKERS, batch_size: int = PREVIEW_BATCH_SIZE, poll_interval: float = PREVIEW_POLL_INTERVAL):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._pool: ProcessPoolExecutor | None = None
+
+    # Called after an upload commits; generation starts without waiting for the poll.
+    def notify(self):
+        self._wake.set()
+
+    async def start(self):
+        if self._task is None and self.workers > 0:
+            self._pool = self._new_pool()
+            self._task = asyncio.create_task(self._run())
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    # A worker process that dies (segfault, OOM kill) breaks the whole pool.
+    # Every task that was using it ends up here; only the first replaces it.
+    def _restart_pool(self, broken: ProcessPoolExecutor):
+        if self._pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._new_pool()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self):
+        # The first pass after startup backfills every file; later passes
+        # only look at recent uploads.
+        since = None
+        while True:
+            started = datetime.utcnow()
+            try:
+                while await self.process_batch(since) == self.batch_size:
+                    pass
+                since = started - timedelta(seconds=PREVIEW_STALE_AFTER)
+            except Exception:
+                logger.exception("Preview generation failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _claim(self, since: datetime | None) -> list:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=PREVIEW_STALE_AFTER)
+        retry_before = now - timedelta(seconds=PREVIEW_RETRY_AFTER)
+        reclaim = or_(
+            and_(derived_asset.status == "processing", derived_asset.updated_at < stale),
+            and_(derived_asset.status == "retry", derived_asset.updated_at < retry_before),
+        )
+        sizes = values(column("size", Integer), name="sizes").data([(size,) for size in previews.PREVIEW_SIZES])
+        # One row per asset, even when several files share the content.
+        candidates = select(
+            file_data.org_id,
+            file_data.checksum,
+            sizes.c.size,
+            literal("processing"),
+            func.now(),
+        ).select_from(file_data).join(sizes, true()).outerjoin(derived_asset, and_(
+            derived_asset.org_id == file_data.org_id,
+            derived_asset.checksum == file_data.checksum,
+            derived_asset.size == sizes.c.size,
+        )).where(
+            file_data.is_deleted == False,
+            file_data.checksum.is_not(None),
+            or_(
+                derived_asset.checksum.is_(None),
+                reclaim,
+            ),
+        ).distinct(file_data.org_id, file_data.checksum, sizes.c.size).order_by(
+            file_data.org_id, file_data.checksum, sizes.c.size
+        ).limit(self.batch_size)
+        if since is not None:
+            # Retries that are due are picked up however old the file is.
+            candidates = candidates.where(tuple_(file_data.org_id, file_data.checksum).in_(
+                select(file_data.org_id, file_data.checksum).where(file_data.uploaded_at >= since).union(
+                    select(derived_asset.org_id, derived_asset.checksum).where(
+                        derived_asset.status == "retry", derived_asset.updated_at < retry_before
+                    )
+                )
+            ))
+
+        stmt = pg_insert(derived_asset).from_select(["org_id", "checksum", "size", "status", "updated_at"], candidates)
+        # A row another worker claimed (or finished) in the meantime is left alone.
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[derived_asset.org_id, derived_asset.checksum, derived_asset.size],
+            set_={"status": "processing", "updated_at": func.now()},
+            where=reclaim,
+        ).returning(derived_asset.org_id, derived_asset.checksum, derived_asset.size, derived_asset.attempts)
+
+        async with SessionLocal() as db:
+            claimed = (await db.execute(stmt)).all()
+            await db.commit()
+            if not claimed:
+                return []
+            groups = defaultdict(dict)
+            for row in claimed:
+                groups[(row.org_id, row.checksum)][row.size] = row.attempts
+            files = {
+                (row.org_id, row.checksum): row
+                for row in await db.execute(select(
+                    file_data.org_id, file_data.checksum, file_data.filename, file_data.file_type, file_data.storage_path
+                ).where(
+                    file_data.is_deleted == False,
+                    tuple_(file_data.org_id, file_data.checksum).in_(list(groups)),
+                ).distinct(file_data.org_id, file_data.checksum).order_by(
+                    file_data.org_id, file_data.checksum, file_data.uploaded_at
+                ))
+            }
+        return [(key, attempts, files.get(key)) for key, attempts in groups.items()]
+
+    async def process_batch(self, since: datetime | None = None) -> int:
+        claimed = await self._claim(since)
+        results = await asyncio.gather(*(self._generate(key, attempts, file) for key, attempts, file in claimed))
+        return sum(results)
+
+    # Renders and stores the assets of one content checksum; `attempts` maps
+    # each claimed size to its retry count. Returns the number of claimed
+    # rows it handled.
+    async def _generate(self, key: tuple, attempts: dict[int, int], file) -> int:
+        org_id, checksum = key
+        sizes = list(attempts)
+        status, assets = await self._render(file, sizes)
+        storage = get_storage()
+        written = {}
+        try:
+            for size, asset in assets.items():
+                storage_path = preview_key(storage, org_id, checksum, size, asset["content_type"])
+                await storage.put(storage_path, asset["data"], asset["content_type"])
+                written[size] = storage_path
+        except Exception:
+            logger.exception("Storing previews of %s failed", checksum)
+            status, assets = "retry", {}
+
+        async with SessionLocal() as db:
+            settled = set()
+            for size in sizes:
+                asset = assets.get(size)
+                row_status, row_attempts = status, attempts[size]
+                if status == "retry":
+                    row_attempts += 1
+                    if row_attempts >= PREVIEW_MAX_ATTEMPTS:
+                        row_status = "failed"
+                row = (await db.execute(
+                    update(derived_asset).where(
+                        derived_asset.org_id == org_id,
+                        derived_asset.checksum == checksum,
+                        derived_asset.size == size,
+                    ).values(
+                        status=row_status,
+                        attempts=row_attempts,
+                        storage_path=written.get(size),
+                        content_type=asset["content_type"] if asset else None,
+                        width=asset["width"] if asset else None,
+                        height=asset["height"] if asset else None,
+                        updated_at=datetime.utcnow(),
+                    ).returning(derived_asset.size)
+                )).first()
+                if row:
+                    settled.add(size)
+            await db.commit()
+        # The file was deleted while we worked and its rows went with it.
+        orphaned = [path for size, path in written.items() if size not in settled]
+        if orphaned:
+            await storage.delete_many(orphaned)
+        return len(sizes)
+
+    async def _render(self, file, sizes: list[int]) -> tuple[str, dict]:
+        kind = previews.kind_for(file.file_type, file.filename) if file is not None else None
+        storage_path = (file.storage_path or "").strip() if file is not None else ""
+        if kind is None or not storage_path or storage_path == "local":
+            return "skipped", {}
+        path = None
+        pool = self._pool
+        try:
+            try:
+                head = await storage_for(storage_path).head(storage_path)
+                if head is None:
+                    raise FileNotFoundError(storage_path)
+                if previews.needs_whole_file(kind):
+                    if head["size"] > PREVIEW_MAX_BYTES:
+                        return "skipped", {}
+                    limit = head["size"]
+                else:
+                    limit = min(head["size"], PREVIEW_TEXT_BYTES)
+                path = await fetch_to_temp(storage_path, limit, "preview-")
+            except Exception:
+                logger.exception("Fetching %s for previews failed", file.checksum)
+                return "retry", {}
+            loop = asyncio.get_running_loop()
+            assets = await loop.run_in_executor(pool, previews.render, path, kind, sizes)
+            return ("done" if assets else "skipped"), assets
+        except BrokenProcessPool:
+            # Not necessarily this file's fault; the attempt count stops a
+            # file that keeps killing its worker.
+            logger.error("Preview worker died while rendering %s (%s)", file.checksum, kind)
+            self._restart_pool(pool)
+            return "retry", {}
+        except Exception:
+            logger.exception("Rendering previews of %s (%s) failed", file.checksum, kind)
+            return "failed", {}
+        finally:
+            if path is not None:
+                os.unlink(path)
+
+
+# Drops the assets of checksums no live file in the org has any more.
+async def drop_previews(db: AsyncSession, org_id, checksums):
+    checksums = set(filter(None, checksums))
+    if not checksums:
+        return
+    live = set((await db.execute(
+        select(file_data.checksum).where(
+            file_data.org_id == org_id,
+            file_data.checksum == any_(bindparam("checksums", list(checksums), type_=ARRAY(Text))),
+            file_data.is_deleted == False,
+        ).distinct()
+    )).scalars())
+    gone = checksums - live
+    if not gone:
+        return
+    storage_paths = (await db.execute(
+        delete(derived_asset).where(
+            derived_asset.org_id == org_id,
+            derived_asset.checksum == any_(bindparam("gone_checksums", list(gone), type_=ARRAY(Text))),
+        ).returning(derived_asset.storage_path)
+    )).scalars().all()
+    by_backend = {}
+    for storage_path in filter(None, storage_paths):
+        by_backend.setdefault(storage_for(storage_path), []).append(storage_path)
+    for storage, keys in by_backend.items():
+        await storage.delete_many(keys)
+
+
+preview_generator = PreviewGenerator()
@@ -0,0 +1,145 @@
+# Thumbnails and previews for the preview generator. Runs inside worker
+# processes, so it imports nothing from the app but the extractors. Pillow is
+# optional: without it images are skipped and only text previews are made.
+import io
+import re
+import warnings
+from xml.sax.saxutils import escape
+
+from app.services import extractors
+
+# Longest side, in pixels, of each derived asset: grid thumbnails and the
+# preview in the file details view.
+PREVIEW_SIZES = (256, 1024)
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+WEBP_QUALITY = 80
+# Images with more pixels than this get no preview: decoding them (a
+# decompression bomb, or just a huge scan) costs too much memory.
+MAX_IMAGE_PIXELS = 40_000_000
+# Text previews show the start of the text on a letter-sized page.
+TEXT_LINES = 40
+TEXT_COLUMNS = 72
+_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+
+
+# Which renderer handles a file: "image", or an extractor kind whose text is
+# previewed; None when the type is not supported.
+def kind_for(content_type: str | None, filename: str | None) -> str | None:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    extension = "." + (filename or "").rsplit(".", 1)[-1].lower() if "." in (filename or "") else ""
+    # SVG is left out: it is a document, not a raster image.
+    if (content_type.startswith("image/") and content_type != "image/svg+xml") or extension in IMAGE_EXTENSIONS:
+        return "image"
+    return extractors.kind_for(content_type, filename)
+
+
+def needs_whole_file(kind: str) -> bool:
+    return kind == "image" or extractors.needs_whole_file(kind)
+
+
+def _pillow():
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    # Between one and two times the limit Pillow only warns; _render_image skips those.
+    warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+    return Image, ImageOps
+
+
+# WebP renditions of an image, largest first so each is scaled down from the
+# previous one. Images smaller than a size are not enlarged.
+def _image_assets(image, sizes) -> dict:
+    _, ImageOps = _pillow()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    assets = {}
+    for size in sorted(sizes, reverse=True):
+        image.thumbnail((size, size))
+        out = io.BytesIO()
+        image.save(out, "WEBP", quality=WEBP_QUALITY)
+        assets[size] = {"data": out.getvalue(), "content_type": "image/webp", "width": image.width, "height": image.height}
+    return assets
+
+
+def _render_image(path: str, sizes) -> dict:
+    Image, _ = _pillow()
+    try:
+        image = Image.open(path)
+    except Image.DecompressionBombError:
+        return {}
+    with image:
+        # Opening only reads the header; refuse before anything is decoded.
+        if image.width * image.height > MAX_IMAGE_PIXELS:
+            return {}
+        # JPEGs decode straight at a reduced scale, so a large photo is cheap.
+        image.draft("RGB", (max(sizes), max(sizes)))
+        return _image_assets(image, sizes)
+
+
+def text_svg(text: str) -> bytes:
+    lines = []
+    for line in _CONTROL.sub("", text).splitlines():
+        line = line.expandtabs(4).rstrip()
+        while len(line) > TEXT_COLUMNS:
+            lines.append(line[:TEXT_COLUMNS])
+            line = line[TEXT_COLUMNS:]
+        lines.append(line)
+        if len(lines) >= TEXT_LINES:
+            break
+    rows = "".join(f'<text x="24" y="{40 + i * 18}">{escape(line)}</text>' for i, line in enumerate(lines[:TEXT_LINES]))
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="612" height="792" viewBox="0 0 612 792">'
+        '<rect width="612" height="792" fill="#ffffff"/>'
+        '<g font-family="ui-monospace, Menlo, Consolas, monospace" font-size="13" fill="#334155" xml:space="preserve">'
+        f"{rows}</g></svg>"
+    ).encode()
+
+
+def _text_assets(text: str, sizes) -> dict:
+    if not text.strip():
+        return {}
+    svg = text_svg(text)
+    return {
+        size: {"data": svg, "content_type": "image/svg+xml", "width": round(size * 612 / 792), "height": size}
+        for size in sizes
+    }
+
+
+# Scanned PDFs have no text on their first page, just the page image.
+def _render_pdf(path: str, sizes) -> dict:
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    if not reader.pages:
+        return {}
+    page = reader.pages[0]
+    text = page.extract_text() or ""
+    if not text.strip() and _pillow() is not None:
+        # Sized from the XObject dictionaries, so only the chosen image is decoded.
+        xobjects = page.get("/Resources", {}).get("/XObject", {})
+        candidates = []
+        for name, ref in xobjects.items():
+            xobject = ref.get_object()
+            pixels = int(xobject.get("/Width", 0)) * int(xobject.get("/Height", 0))
+            if xobject.get("/Subtype") == "/Image" and 0 < pixels <= MAX_IMAGE_PIXELS:
+                candidates.append((pixels, name))
+        if candidates:
+            image = page.images[max(candidates)[1]].image
+            if image is not None:
+                return _image_assets(image, sizes)
+    return _text_assets(text, sizes)
+
+
+# Entry point for the process pool: the object (or, for text, its first
+# bytes) has been written to `path`. Returns {size: asset}, empty when
+# nothing can be shown.
+def render(path: str, kind: str, sizes=PREVIEW_SIZES) -> dict:
+    if kind == "image":
+        return _render_image(path, sizes) if _pillow() is not None else {}
+    if kind == "pdf":
+        return _render_pdf(path, sizes)
+    return _text_assets(extractors.extract(path, kind)["content"], sizes)
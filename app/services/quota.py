@@ -0,0 +1,279 @@
+import logging
+import os
+import re
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dbConfig.database import SessionLocal
+from database_model.database_model import file_info as file_data
+from database_model.database_model import file_metadata as file_md
+from database_model.database_model import org_quota
+from database_model.database_model import org_storage_stats as stats_data
+from database_model.database_model import organization as org_data
+from database_model.database_model import plan as plan_data
+from database_model.database_model import quota_reservation
+from database_model.database_model import subscription as subscription_data
+from database_model.database_model import upload_session
+
+logger = logging.getLogger(__name__)
+
+# Limit for orgs whose storage_limit cannot be read.
+DEFAULT_STORAGE_LIMIT = os.getenv("DEFAULT_STORAGE_LIMIT", "10GB")
+# A proxied upload's reservation outlives its request by no more than this:
+# one whose worker died is dropped by the next reconciliation after it.
+QUOTA_RESERVATION_TTL = int(os.getenv("QUOTA_RESERVATION_TTL", 6 * 3600))
+
+_UNITS = {"": 1024 ** 3, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4, "p": 1024 ** 5}
+_SIZE = re.compile(r"(\d+(?:\.\d+)?)\s*([kmgtp]?)(?:i?b)?", re.IGNORECASE)
+
+
+# Bytes for a storage limit: "10GB", "50 GB", "1.5 TiB", "500mb", or a bare
+# number of GB (plan.storage_limit). None means unlimited.
+def parse_size(value) -> int | None:
+    if isinstance(value, (int, float)):
+        return int(value * _UNITS["g"])
+    text = str(value or "").strip()
+    if text.lower() in ("unlimited", "none", "-1"):
+        return None
+    match = _SIZE.fullmatch(text)
+    if match is None:
+        raise ValueError(f"Invalid storage size: {value!r}")
+    number, unit = match.groups()
+    if unit == "" and text[-1:].lower() == "b":
+        unit = "b"
+    return int(float(number) * _UNITS[unit.lower()])
+
+
+def _limit_bytes(org_id, value) -> int | None:
+    try:
+        return parse_size(value)
+    except ValueError:
+        logger.warning("Org %s has an unreadable storage limit %r; using %s", org_id, value, DEFAULT_STORAGE_LIMIT)
+        return parse_size(DEFAULT_STORAGE_LIMIT)
+
+
+# Each org's quota row as it should be: the limit of its active plan (or the
+# org's own storage_limit), bytes of live files and versions, and bytes
+# reserved by pending direct and resumable uploads and by proxied uploads
+# still in flight. Only reconciliation and
+# the first use of an org's quota come here; it sums whole tables.
+async def _quota_values(db: AsyncSession, org_id=None) -> list[dict]:
+    orgs = select(org_data.org_id, org_data.storage_limit)
+    plans = select(subscription_data.org_id, plan_data.storage_limit).join(
+        plan_data, plan_data.plan_id == subscription_data.plan_id
+    ).where(
+        func.lower(subscription_data.status) == "active",
+        subscription_data.end_date > func.now(),
+    ).distinct(subscription_data.org_id).order_by(subscription_data.org_id, subscription_data.start_date.desc())
+    used = select(stats_data.org_id, func.sum(stats_data.total_bytes)).group_by(stats_data.org_id)
+    versions = select(file_data.org_id, func.sum(file_md.file_size)).join(
+        file_md, file_md.file_id == file_data.file_id
+    ).where(file_md.chunks.is_not(None)).group_by(file_data.org_id)
+    reserved = select(upload_session.org_id, func.sum(upload_session.file_size)).where(
+        upload_session.status == "pending"
+    ).group_by(upload_session.org_id)
+    in_flight = select(quota_reservation.org_id, func.sum(quota_reservation.size)).where(
+        quota_reservation.expires_at > func.now()
+    ).group_by(quota_reservation.org_id)
+    if org_id is not None:
+        orgs = orgs.where(org_data.org_id == org_id)
+        plans = plans.where(subscription_data.org_id == org_id)
+        used = used.where(stats_data.org_id == org_id)
+        versions = versions.where(file_data.org_id == org_id)
+        reserved = reserved.where(upload_session.org_id == org_id)
+        in_flight = in_flight.where(quota_reservation.org_id == org_id)
+
+    plan_limits = dict((await db.execute(plans)).all())
+    used = dict((await db.execute(used)).all())
+    versions = dict((await db.execute(versions)).all())
+    reserved = dict((await db.execute(reserved)).all())
+    in_flight = dict((await db.execute(in_flight)).all())
+    return [
+        {
+            "org_id": org.org_id,
+            "limit_bytes": _limit_bytes(org.org_id, plan_limits.get(org.org_id, org.storage_limit)),
+            "used_bytes": (used.get(org.org_id) or 0) + (versions.get(org.org_id) or 0),
+            "reserved_bytes": (reserved.get(org.org_id) or 0) + (in_flight.get(org.org_id) or 0),
+            "updated_at": datetime.utcnow(),
+        }
+        for org in await db.execute(orgs)
+    ]
+
+
+async def _create_quota(db: AsyncSession, org_id):
+    values = await _quota_values(db, org_id)
+    if values:
+        await db.execute(pg_insert(org_quota).values(values).on_conflict_do_nothing())
+
+
+# Rewrites every quota row (or one org's) from the tables; run by the stats
+# reconciler while it holds the org_quota lock. Reservations of proxied
+# uploads past their expiry belong to workers that died and are dropped.
+async def rebuild_quotas(db: AsyncSession, org_id=None):
+    expired = delete(quota_reservation).where(quota_reservation.expires_at <= func.now())
+    if org_id is not None:
+        expired = expired.where(quota_reservation.org_id == org_id)
+    await db.execute(expired)
+    values = await _quota_values(db, org_id)
+    if not values:
+        return
+    stmt = pg_insert(org_quota).values(values)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[org_quota.org_id],
+        set_={
+            "limit_bytes": stmt.excluded.limit_bytes,
+            "used_bytes": stmt.excluded.used_bytes,
+            "reserved_bytes": stmt.excluded.reserved_bytes,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    ))
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def _exceeded(row) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Storage quota exceeded: {_format_size(row.used_bytes + row.reserved_bytes)} of {_format_size(row.limit_bytes)} used",
+    )
+
+
+async def _quota_row(db: AsyncSession, org_id, for_update: bool = False):
+    stmt = select(org_quota.limit_bytes, org_quota.used_bytes, org_quota.reserved_bytes).where(org_quota.org_id == org_id)
+    row = (await db.execute(stmt.with_for_update() if for_update else stmt)).first()
+    if row is None:
+        await _create_quota(db, org_id)
+        row = (await db.execute(stmt.with_for_update() if for_update else stmt)).first()
+    return row
+
+
+# Holds the org's quota row, creating it first, until the transaction ends.
+# Every change to the org's counters updates this row first, so holding it
+# keeps them all waiting.
+async def lock_quota(db: AsyncSession, org_id):
+    await _quota_row(db, org_id, for_update=True)
+
+
+# Sets `size` bytes aside for an upload, or raises 413 when they do not fit.
+# One conditional UPDATE, so concurrent uploads cannot overshoot the limit.
+async def reserve(db: AsyncSession, org_id, size: int):
+    stmt = update(org_quota).where(
+        org_quota.org_id == org_id,
+        or_(
+            org_quota.limit_bytes.is_(None),
+            org_quota.used_bytes + org_quota.reserved_bytes + size <= org_quota.limit_bytes,
+        ),
+    ).values(
+        reserved_bytes=org_quota.reserved_bytes + size,
+        updated_at=datetime.utcnow(),
+    ).returning(org_quota.org_id)
+    if (await db.execute(stmt)).first():
+        return
+    row = await _quota_row(db, org_id)
+    if row is None:
+        # No such org; nothing to enforce against.
+        return
+    if (await db.execute(stmt)).first() is None:
+        raise _exceeded(row)
+
+
+async def release(db: AsyncSession, org_id, size: int):
+    await db.execute(update(org_quota).where(org_quota.org_id == org_id).values(
+        reserved_bytes=func.greatest(org_quota.reserved_bytes - size, 0),
+        updated_at=datetime.utcnow(),
+    ))
+
+
+# Keeps used_bytes in step with the files and versions the caller's
+# transaction adds or removes.
+async def add_usage(db: AsyncSession, org_id, delta: int):
+    if delta:
+        await db.execute(update(org_quota).where(org_quota.org_id == org_id).values(
+            used_bytes=org_quota.used_bytes + delta,
+            updated_at=datetime.utcnow(),
+        ))
+
+
+# For bytes added without a reservation (deduplicated uploads, versions):
+# called after add_usage, raises 413 if the org is now over its limit so the
+# caller's transaction rolls back.
+async def check_quota(db: AsyncSession, org_id):
+    row = await _quota_row(db, org_id, for_update=True)
+    if row is not None and row.limit_bytes is not None and row.used_bytes + row.reserved_bytes > row.limit_bytes:
+        raise _exceeded(row)
+
+
+# Reservation held for the length of a request that sends bytes to storage
+# before recording the file in `db`. Taken and released in their own
+# transactions, so the quota row is not locked while the bytes move, and
+# recorded in quota_reservation so reconciliation can account for it.
+# Yields grow(size), which raises the reservation when the bytes turn out to
+# be more than were reserved (413 if they no longer fit).
+@asynccontextmanager
+async def reservation(db: AsyncSession, org_id, size: int):
+    reservation_id = uuid.uuid4()
+    held_size = size
+
+    async def grow(new_size: int):
+        nonlocal held_size
+        if new_size <= held_size:
+            return
+        async with SessionLocal() as own:
+            await reserve(own, org_id, new_size - held_size)
+            await own.execute(update(quota_reservation).where(
+                quota_reservation.reservation_id == reservation_id
+            ).values(size=new_size))
+            await own.commit()
+        held_size = new_size
+
+    async with SessionLocal() as own:
+        await reserve(own, org_id, size)
+        own.add(quota_reservation(
+            reservation_id=reservation_id,
+            org_id=org_id,
+            size=size,
+            expires_at=datetime.utcnow() + timedelta(seconds=QUOTA_RESERVATION_TTL),
+        ))
+        await own.commit()
+    try:
+        yield grow
+    except BaseException:
+        # The caller's transaction may hold the quota row; let it go first.
+        await db.rollback()
+        raise
+    finally:
+        async with SessionLocal() as own:
+            # Quota row first, as reconciliation locks them.
+            await _quota_row(own, org_id, for_update=True)
+            held = (await own.execute(
+                delete(quota_reservation).where(quota_reservation.reservation_id == reservation_id).returning(quota_reservation.size)
+            )).first()
+            # Gone when it outlived its expiry and reconciliation dropped it.
+            if held:
+                await release(own, org_id, held.size)
+            await own.commit()
+
+
+# Limit and usage as the quota sees them; used includes file versions.
+async def get_quota(db: AsyncSession, org_id) -> dict:
+    row = (await db.execute(
+        select(org_quota.limit_bytes, org_quota.used_bytes, org_quota.reserved_bytes).where(org_quota.org_id == org_id)
+    )).first()
+    if row is None:
+        values = await _quota_values(db, org_id)
+        if not values:
+            return {"limit": None, "used": 0, "reserved": 0}
+        return {"limit": values[0]["limit_bytes"], "used": values[0]["used_bytes"], "reserved": values[0]["reserved_bytes"]}
+    return {"limit": row.limit_bytes, "used": row.used_bytes, "reserved": row.reserved_bytes}
@@ -0,0 +1,459 @@
+import base64
+import hashlib
+import hmac
+import mimetypes
+import os
+import secrets
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator
+from urllib.parse import quote, urlencode
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.services.metrics import S3_CALL_ERRORS, S3_CALL_SECONDS
+
+AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
+AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+S3_BUCKET = os.getenv("AWS_S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 50))
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3").lower()
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", "storage")
+PUBLIC_API_URL = os.getenv("PUBLIC_API_URL", "http://localhost:8000").rstrip("/")
+# Signs URLs for objects the API serves itself. Must be shared by all workers,
+# otherwise a URL signed by one worker is rejected by the others.
+OBJECT_URL_SECRET = (os.getenv("OBJECT_URL_SECRET") or secrets.token_hex(32)).encode()
+READ_CHUNK_SIZE = 1024 * 1024
+
+if STORAGE_BACKEND == "s3" and not S3_BUCKET:
+    raise RuntimeError("AWS_S3_BUCKET must be set.")
+
+
+class StorageBackend:
+    # Prefix written into file_data.storage_path so a row keeps pointing at the
+    # backend that holds its bytes even if STORAGE_BACKEND changes later.
+    path_prefix = ""
+    # Whether clients can upload straight to the backend with presigned URLs.
+    supports_presigned_upload = False
+
+    async def put(self, key: str, data: bytes, content_type: str) -> None:
+        raise NotImplementedError
+
+    async def create_multipart(self, key: str, content_type: str) -> str:
+        raise NotImplementedError
+
+    async def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        raise NotImplementedError
+
+    async def complete_multipart(self, key: str, upload_id: str, parts: list[dict]) -> None:
+        raise NotImplementedError
+
+    async def abort_multipart(self, key: str, upload_id: str) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def delete_many(self, keys: list[str]) -> None:
+        for key in keys:
+            await self.delete(key)
+
+    # Returns {"size", "content_type", "etag"} or None when the object is missing.
+    async def head(self, key: str) -> dict | None:
+        raise NotImplementedError
+
+    async def iter_chunks(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+        yield b""
+
+    # Bytes [start, start + length) of the object; shorter at the end of it.
+    async def read_range(self, key: str, start: int, length: int) -> bytes:
+        raise NotImplementedError
+
+    # The same bytes as read_range, streamed in chunks.
+    async def iter_range(self, key: str, start: int, length: int, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        end = start + length
+        while start < end:
+            chunk = await self.read_range(key, start, min(chunk_size, end - start))
+            if not chunk:
+                return
+            start += len(chunk)
+            yield chunk
+
+    async def signed_url(
+        self,
+        key: str,
+        expires_in: int = 60,
+        filename: str | None = None,
+        disposition: str | None = None,
+    ) -> str:
+        raise NotImplementedError
+
+
+def _object_signature(key: str, expires: int, disposition: str, filename: str) -> str:
+    message = "\n".join([key, str(expires), disposition, filename]).encode()
+    digest = hmac.new(OBJECT_URL_SECRET, message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def verify_object_signature(key: str, expires: int, disposition: str, filename: str, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_object_signature(key, expires, disposition, filename), signature)
+
+
+# Backends without native presigning hand out short-lived HMAC-signed links to
+# GET /api/files/objects/{key}, which streams the object back from the backend.
+class _ApiSignedUrlMixin:
+    async def signed_url(self, key, expires_in=60, filename=None, disposition=None) -> str:
+        expires = int(time.time()) + expires_in
+        disposition = disposition or ""
+        filename = filename or ""
+        query = urlencode(
+            {
+                "expires": expires,
+                "disposition": disposition,
+                "filename": filename,
+                "signature": _object_signature(key, expires, disposition, filename),
+            }
+        )
+        return f"{PUBLIC_API_URL}/api/files/objects/{quote(key)}?{query}"
+
+
+class S3Storage(StorageBackend):
+    supports_presigned_upload = True
+
+    def __init__(self, bucket: str):
+        if not AWS_ACCESS_KEY_ID or not AWS_SECRET_ACCESS_KEY:
+            raise HTTPException(status_code=500, detail="AWS credentials not configured")
+        self.bucket = bucket
+        # boto3 clients are thread-safe; one client shares its connection pool
+        # across every request instead of paying a new TLS handshake each time.
+        self.client = boto3.client(
+            "s3",
+            region_name=AWS_REGION,
+            endpoint_url=S3_ENDPOINT_URL,
+            aws_access_key_id=AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+            config=Config(
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                retries={"max_attempts": 3, "mode": "standard"},
+                # SigV4 signs the checksum header of presigned uploads.
+                signature_version="s3v4",
+            ),
+        )
+
+    async def _call(self, operation: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await run_in_threadpool(getattr(self.client, operation), Bucket=self.bucket, **kwargs)
+        except ClientError as e:
+            S3_CALL_ERRORS.labels(operation, e.response.get("Error", {}).get("Code", "Unknown")).inc()
+            raise
+        except Exception as e:
+            S3_CALL_ERRORS.labels(operation, type(e).__name__).inc()
+            raise
+        finally:
+            S3_CALL_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+    async def put(self, key, data, content_type):
+        await self._call("put_object", Key=key, Body=data, ContentType=content_type)
+
+    async def create_multipart(self, key, content_type):
+        res = await self._call("create_multipart_upload", Key=key, ContentType=content_type)
+        return res["UploadId"]
+
+    async def upload_part(self, key, upload_id, part_number, data):
+        res = await self._call("upload_part", Key=key, UploadId=upload_id, PartNumber=part_number, Body=data)
+        return res["ETag"]
+
+    async def complete_multipart(self, key, upload_id, parts):
+        try:
+            await self._call(
+                "complete_multipart_upload",
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except ClientError as exc:
+            # Part lists sent by browsers doing direct uploads can be wrong.
+            if exc.response.get("Error", {}).get("Code") in ("InvalidPart", "InvalidPartOrder", "EntityTooSmall", "NoSuchUpload"):
+                raise HTTPException(status_code=400, detail="Upload parts could not be assembled")
+            raise
+
+    async def abort_multipart(self, key, upload_id):
+        await self._call("abort_multipart_upload", Key=key, UploadId=upload_id)
+
+    async def delete(self, key):
+        await self._call("delete_object", Key=key)
+
+    async def delete_many(self, keys):
+        # DeleteObjects accepts at most 1000 keys per request.
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            await self._call(
+                "delete_objects",
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+
+    async def head(self, key):
+        try:
+            res = await self._call("head_object", Key=key)
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return {"size": res["ContentLength"], "content_type": res.get("ContentType"), "etag": res.get("ETag")}
+
+    async def iter_chunks(self, key, chunk_size=READ_CHUNK_SIZE):
+        res = await self._call("get_object", Key=key)
+        body = res["Body"]
+        try:
+            while chunk := await run_in_threadpool(body.read, chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    async def read_range(self, key, start, length):
+        try:
+            res = await self._call("get_object", Key=key, Range=f"bytes={start}-{start + length - 1}")
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") == "InvalidRange":
+                return b""
+            raise
+        body = res["Body"]
+        try:
+            return await run_in_threadpool(body.read)
+        finally:
+            body.close()
+
+    # One ranged GET, read as it arrives.
+    async def iter_range(self, key, start, length, chunk_size=READ_CHUNK_SIZE):
+        if length <= 0:
+            return
+        try:
+            res = await self._call("get_object", Key=key, Range=f"bytes={start}-{start + length - 1}")
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") == "InvalidRange":
+                return
+            raise
+        body = res["Body"]
+        try:
+            while chunk := await run_in_threadpool(body.read, chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def presigned_put(self, key, content_type, expires_in=3600, checksum_sha256=None) -> tuple[str, dict]:
+        params = {"Bucket": self.bucket, "Key": key, "ContentType": content_type}
+        headers = {"Content-Type": content_type}
+        if checksum_sha256:
+            # S3 rejects the PUT unless the body hashes to this value.
+            params["ChecksumSHA256"] = checksum_sha256
+            headers["x-amz-checksum-sha256"] = checksum_sha256
+        return self.client.generate_presigned_url("put_object", Params=params, ExpiresIn=expires_in), headers
+
+    def presigned_part(self, key, upload_id, part_number, expires_in=3600) -> str:
+        return self.client.generate_presigned_url(
+            "upload_part",
+            Params={"Bucket": self.bucket, "Key": key, "UploadId": upload_id, "PartNumber": part_number},
+            ExpiresIn=expires_in,
+        )
+
+    async def signed_url(self, key, expires_in=60, filename=None, disposition=None):
+        params = {"Bucket": self.bucket, "Key": key}
+        if filename and disposition:
+            params["ResponseContentDisposition"] = f'{disposition}; filename="{filename}"'
+        # Presigning is local computation, no need for the threadpool.
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
+
+
+class LocalStorage(_ApiSignedUrlMixin, StorageBackend):
+    path_prefix = "local/"
+
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key: str) -> Path:
+        path = (self.root / key.removeprefix(self.path_prefix)).resolve()
+        if self.root not in path.parents:
+            raise HTTPException(status_code=400, detail="Invalid storage path")
+        return path
+
+    def _part_dir(self, upload_id: str) -> Path:
+        return self.root / ".multipart" / upload_id
+
+    def _write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    async def put(self, key, data, content_type):
+        await run_in_threadpool(self._write, self.path_for(key), data)
+
+    async def create_multipart(self, key, content_type):
+        upload_id = uuid.uuid4().hex
+        await run_in_threadpool(self._part_dir(upload_id).mkdir, parents=True)
+        return upload_id
+
+    async def upload_part(self, key, upload_id, part_number, data):
+        await run_in_threadpool(self._write, self._part_dir(upload_id) / str(part_number), data)
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+    def _assemble(self, key: str, upload_id: str, parts: list[dict]):
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{upload_id}")
+        with open(tmp, "wb") as out:
+            for part in sorted(parts, key=lambda p: p["PartNumber"]):
+                with open(self._part_dir(upload_id) / str(part["PartNumber"]), "rb") as src:
+                    shutil.copyfileobj(src, out, READ_CHUNK_SIZE)
+        tmp.replace(path)
+        shutil.rmtree(self._part_dir(upload_id), ignore_errors=True)
+
+    async def complete_multipart(self, key, upload_id, parts):
+        await run_in_threadpool(self._assemble, key, upload_id, parts)
+
+    async def abort_multipart(self, key, upload_id):
+        await run_in_threadpool(shutil.rmtree, self._part_dir(upload_id), True)
+
+    async def delete(self, key):
+        await run_in_threadpool(self.path_for(key).unlink, True)
+
+    async def head(self, key):
+        path = self.path_for(key)
+        try:
+            stat = await run_in_threadpool(path.stat)
+        except FileNotFoundError:
+            return None
+        return {
+            "size": stat.st_size,
+            "content_type": mimetypes.guess_type(path.name)[0],
+            "etag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+        }
+
+    async def iter_chunks(self, key, chunk_size=READ_CHUNK_SIZE):
+        path = self.path_for(key)
+        if not path.is_file():
+            raise HTTPException(status_code=404, detail="File is not available in storage")
+        with open(path, "rb") as f:
+            while chunk := await run_in_threadpool(f.read, chunk_size):
+                yield chunk
+
+    def _read_range(self, path: Path, start: int, length: int) -> bytes:
+        with open(path, "rb") as f:
+            f.seek(start)
+            return f.read(length)
+
+    async def read_range(self, key, start, length):
+        path = self.path_for(key)
+        if not path.is_file():
+            raise HTTPException(status_code=404, detail="File is not available in storage")
+        return await run_in_threadpool(self._read_range, path, start, length)
+
+    async def iter_range(self, key, start, length, chunk_size=READ_CHUNK_SIZE):
+        path = self.path_for(key)
+        if not path.is_file():
+            raise HTTPException(status_code=404, detail="File is not available in storage")
+        with open(path, "rb") as f:
+            f.seek(start)
+            while length > 0 and (chunk := await run_in_threadpool(f.read, min(chunk_size, length))):
+                length -= len(chunk)
+                yield chunk
+
+
+# In-process object store for tests and benchmarks; nothing survives a restart.
+class MemoryStorage(_ApiSignedUrlMixin, StorageBackend):
+    path_prefix = "memory/"
+
+    def __init__(self):
+        self.objects: dict[str, tuple[bytes, str]] = {}
+        self._uploads: dict[str, dict] = {}
+
+    async def put(self, key, data, content_type):
+        self.objects[key] = (bytes(data), content_type)
+
+    async def create_multipart(self, key, content_type):
+        upload_id = uuid.uuid4().hex
+        self._uploads[upload_id] = {"content_type": content_type}
+        return upload_id
+
+    async def upload_part(self, key, upload_id, part_number, data):
+        self._uploads[upload_id][part_number] = bytes(data)
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+    async def complete_multipart(self, key, upload_id, parts):
+        upload = self._uploads.pop(upload_id)
+        data = b"".join(upload[p["PartNumber"]] for p in sorted(parts, key=lambda p: p["PartNumber"]))
+        self.objects[key] = (data, upload["content_type"])
+
+    async def abort_multipart(self, key, upload_id):
+        self._uploads.pop(upload_id, None)
+
+    async def delete(self, key):
+        self.objects.pop(key, None)
+
+    async def head(self, key):
+        if key not in self.objects:
+            return None
+        data, content_type = self.objects[key]
+        return {"size": len(data), "content_type": content_type, "etag": f'"{hashlib.md5(data).hexdigest()}"'}
+
+    async def iter_chunks(self, key, chunk_size=READ_CHUNK_SIZE):
+        if key not in self.objects:
+            raise HTTPException(status_code=404, detail="File is not available in storage")
+        data = self.objects[key][0]
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+
+    async def read_range(self, key, start, length):
+        if key not in self.objects:
+            raise HTTPException(status_code=404, detail="File is not available in storage")
+        return self.objects[key][0][start:start + length]
+
+
+_backends: dict[str, StorageBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def _backend(name: str) -> StorageBackend:
+    backend = _backends.get(name)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(name)
+            if backend is None:
+                if name == "local":
+                    backend = LocalStorage(LOCAL_STORAGE_ROOT)
+                elif name == "memory":
+                    backend = MemoryStorage()
+                elif name == "s3":
+                    backend = S3Storage(S3_BUCKET)
+                else:
+                    raise RuntimeError(f"Unknown STORAGE_BACKEND: {name}")
+                _backends[name] = backend
+    return backend
+
+
+# Backend that new uploads are written to.
+def get_storage() -> StorageBackend:
+    return _backend(STORAGE_BACKEND)
+
+
+# Backend holding an existing object, picked from its storage_path prefix.
+def storage_for(storage_path: str) -> StorageBackend:
+    if storage_path.startswith(LocalStorage.path_prefix):
+        return _backend("local")
+    if storage_path.startswith(MemoryStorage.path_prefix):
+        return _backend("memory")
+    return _backend("s3")
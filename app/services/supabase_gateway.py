@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+
+import httpx
+from fastapi import HTTPException
+
+from app.services.metrics import SUPABASE_CALL_ERRORS, SUPABASE_CALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {502, 503, 504}
+
+
+# One long-lived, pooled HTTP client for all Supabase Auth calls.
+# Concurrent refreshes of the same refresh token share a single upstream call,
+# and the result is kept for a short grace period so late requests that still
+# carry the old cookie do not try to reuse a token Supabase already rotated.
+class SupabaseGateway:
+    def __init__(
+        self,
+        base_url: str,
+        anon_key: str,
+        service_role_key: str | None = None,
+        timeout: float = 10.0,
+        max_retries: int = 2,
+        max_connections: int = 100,
+        refresh_grace: float = 10.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.anon_key = anon_key
+        self.service_role_key = service_role_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.refresh_grace = refresh_grace
+        self._client: httpx.AsyncClient | None = None
+        self._inflight_refresh: dict[str, asyncio.Future] = {}
+        self._recent_refresh: dict[str, tuple[float, dict]] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=30.0,
+                ),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # Non-idempotent calls (token grants, user creation) are only retried when
+    # the connection could not be established, i.e. nothing reached Supabase.
+    async def _request(self, method: str, path: str, idempotent: bool = False, **kwargs) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            last_try = attempt == self.max_retries
+            started = time.perf_counter()
+            try:
+                res = await self.client.request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                self._observe(method, path, started, type(e).__name__)
+                if last_try:
+                    raise HTTPException(status_code=503, detail="Authentication service unavailable")
+            except httpx.TransportError as e:
+                self._observe(method, path, started, type(e).__name__)
+                if last_try or not idempotent:
+                    raise HTTPException(status_code=503, detail="Authentication service unavailable")
+            else:
+                self._observe(method, path, started, str(res.status_code) if res.status_code >= 500 else None)
+                if not (idempotent and res.status_code in RETRY_STATUSES) or last_try:
+                    return res
+            await asyncio.sleep(0.1 * 2 ** attempt)
+
+    @staticmethod
+    def _observe(method: str, path: str, started: float, error: str | None):
+        SUPABASE_CALL_SECONDS.labels(method, path).observe(time.perf_counter() - started)
+        if error:
+            SUPABASE_CALL_ERRORS.labels(method, path, error).inc()
+
+    def _anon_headers(self) -> dict:
+        return {"apikey": self.anon_key, "Content-Type": "application/json"}
+
+    async def password_login(self, email: str, password: str) -> dict:
+        res = await self._request(
+            "POST",
+            "/auth/v1/token",
+            params={"grant_type": "password"},
+            headers=self._anon_headers(),
+            json={"email": email, "password": password},
+        )
+        if res.status_code != 200:
+            raise HTTPException(status_code=401, detail="Invalid email or password")
+        return res.json()
+
+    async def _refresh_upstream(self, refresh_token: str) -> dict:
+        res = await self._request(
+            "POST",
+            "/auth/v1/token",
+            params={"grant_type": "refresh_token"},
+            headers=self._anon_headers(),
+            json={"refresh_token": refresh_token},
+        )
+        if res.status_code != 200:
+            raise HTTPException(status_code=401, detail="Session expired")
+        return res.json()
+
+    def _refresh_done(self, refresh_token: str, fut: asyncio.Future):
+        self._inflight_refresh.pop(refresh_token, None)
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        now = time.monotonic()
+        for token, (expires_at, _) in list(self._recent_refresh.items()):
+            if expires_at <= now:
+                del self._recent_refresh[token]
+        self._recent_refresh[refresh_token] = (now + self.refresh_grace, fut.result())
+
+    async def refresh(self, refresh_token: str) -> dict:
+        recent = self._recent_refresh.get(refresh_token)
+        if recent and recent[0] > time.monotonic():
+            return recent[1]
+        fut = self._inflight_refresh.get(refresh_token)
+        if fut is None:
+            fut = asyncio.ensure_future(self._refresh_upstream(refresh_token))
+            self._inflight_refresh[refresh_token] = fut
+            fut.add_done_callback(lambda f: self._refresh_done(refresh_token, f))
+        # Shield so one cancelled request does not cancel the shared refresh.
+        return await asyncio.shield(fut)
+
+    async def get_user(self, access_token: str) -> dict:
+        res = await self._request(
+            "GET",
+            "/auth/v1/user",
+            idempotent=True,
+            headers={"apikey": self.anon_key, "Authorization": f"Bearer {access_token}"},
+        )
+        if res.status_code != 200:
+            raise HTTPException(status_code=401, detail="Invalid session")
+        return res.json()
+
+    async def admin_create_user(self, email: str, password: str) -> dict:
+        if not self.service_role_key:
+            raise HTTPException(status_code=500, detail="SUPABASE_SERVICE_ROLE_KEY is not configured")
+        res = await self._request(
+            "POST",
+            "/auth/v1/admin/users",
+            headers={
+                "apikey": self.service_role_key,
+                "Authorization": f"Bearer {self.service_role_key}",
+                "Content-Type": "application/json",
+            },
+            json={"email": email, "password": password, "email_confirm": True},
+        )
+        if res.status_code not in (200, 201):
+            raise HTTPException(status_code=400, detail="Failed to create user")
+        return res.json()
+
+    async def jwks(self) -> dict:
+        res = await self._request("GET", "/auth/v1/.well-known/jwks.json", idempotent=True)
+        res.raise_for_status()
+        return res.json()
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+import jwt
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownSigningKey(Exception):
+    pass
+
+
+# Verifies Supabase access tokens locally against the project's JWKS.
+# Keys are cached in memory and rotated by a background task; a token signed
+# with a key id we have not seen forces one early refresh before giving up.
+class TokenVerifier:
+    def __init__(
+        self,
+        fetch_jwks: Callable[[], Awaitable[dict]],
+        issuer: str,
+        audience: str = "authenticated",
+        hs256_secret: str | None = None,
+        refresh_interval: int = 600,
+        min_refresh_gap: int = 30,
+    ):
+        self.fetch_jwks = fetch_jwks
+        self.issuer = issuer
+        self.audience = audience
+        self.hs256_secret = hs256_secret
+        self.refresh_interval = refresh_interval
+        self.min_refresh_gap = min_refresh_gap
+        self._keys: dict[str, jwt.PyJWK] = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    async def refresh(self, force: bool = False) -> None:
+        async with self._lock:
+            # Another waiter may have refreshed while we queued on the lock.
+            if force and time.monotonic() - self._fetched_at < self.min_refresh_gap:
+                return
+            data = await self.fetch_jwks()
+            keys = {}
+            for raw in data.get("keys", []):
+                try:
+                    key = jwt.PyJWK.from_dict(raw)
+                except jwt.PyJWKError:
+                    continue
+                if key.key_id:
+                    keys[key.key_id] = key
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+
+    async def _rotate_forever(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("JWKS refresh failed; keeping cached keys")
+
+    async def start(self):
+        try:
+            await self.refresh()
+        except Exception:
+            logger.exception("Initial JWKS fetch failed; will retry on demand")
+        if self._task is None:
+            self._task = asyncio.create_task(self._rotate_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _signing_key(self, token: str):
+        header = jwt.get_unverified_header(token)
+        alg = header.get("alg")
+        if alg == "HS256":
+            if not self.hs256_secret:
+                raise UnknownSigningKey(alg)
+            return self.hs256_secret, alg
+        key = self._keys.get(header.get("kid"))
+        if key is None:
+            raise UnknownSigningKey(header.get("kid"))
+        return key, key.algorithm_name
+
+    def verify_cached(self, token: str) -> dict:
+        key, alg = self._signing_key(token)
+        return jwt.decode(
+            token,
+            key,
+            algorithms=[alg],
+            audience=self.audience,
+            issuer=self.issuer,
+            options={"require": ["exp", "sub"]},
+        )
+
+    # Raises jwt.InvalidTokenError (incl. ExpiredSignatureError) for bad tokens
+    # and UnknownSigningKey when the key id is missing even after a refresh.
+    async def verify(self, token: str) -> dict:
+        try:
+            return self.verify_cached(token)
+        except UnknownSigningKey:
+            try:
+                await self.refresh(force=True)
+            except Exception:
+                logger.exception("JWKS refresh for unknown key id failed")
+            return self.verify_cached(token)
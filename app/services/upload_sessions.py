@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dbConfig.database import SessionLocal
+from database_model.database_model import upload_part, upload_session
+from app.services.quota import release
+from app.services.storage import storage_for
+
+logger = logging.getLogger(__name__)
+
+# Pending uploads untouched for this long are abandoned and cleaned up.
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 24 * 3600))
+UPLOAD_GC_INTERVAL = int(os.getenv("UPLOAD_GC_INTERVAL", 3600))
+
+
+# Drops whatever an unfinished upload left in storage. Content-addressed
+# single-object uploads may share their key with live files, so they stay.
+async def discard_upload(session):
+    storage = storage_for(session.storage_path)
+    if session.upload_id:
+        await storage.abort_multipart(session.storage_path, session.upload_id)
+    elif not session.checksum:
+        await storage.delete(session.storage_path)
+
+
+async def forget_parts(db: AsyncSession, session_ids):
+    await db.execute(delete(upload_part).where(upload_part.session_id.in_(list(session_ids))))
+
+
+# Claims idle sessions with a conditional UPDATE first, so an upload that
+# completes concurrently is never aborted underneath its client.
+async def _claim_expired() -> list:
+    async with SessionLocal() as db:
+        cutoff = datetime.utcnow() - timedelta(seconds=UPLOAD_SESSION_TTL)
+        expired = (await db.execute(
+            update(upload_session).where(
+                upload_session.status == "pending",
+                upload_session.updated_at < cutoff,
+            ).values(status="expired", updated_at=datetime.utcnow()).returning(
+                upload_session.session_id,
+                upload_session.storage_path,
+                upload_session.upload_id,
+                upload_session.checksum,
+                upload_session.org_id,
+                upload_session.file_size,
+            )
+        )).all()
+        await forget_parts(db, [session.session_id for session in expired])
+        released = {}
+        for session in expired:
+            released[session.org_id] = released.get(session.org_id, 0) + session.file_size
+        for org_id, size in sorted(released.items()):
+            await release(db, org_id, size)
+        await db.commit()
+        return expired
+
+
+async def expire_sessions() -> int:
+    expired = await _claim_expired()
+    for session in expired:
+        try:
+            await discard_upload(session)
+        except Exception:
+            logger.exception("Could not clean up upload %s", session.session_id)
+    return len(expired)
+
+
+async def collect_forever(interval: int):
+    while True:
+        try:
+            await expire_sessions()
+        except Exception:
+            logger.exception("Upload session cleanup failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+
+# Per-worker cache of presigned URLs keyed by (storage_path, disposition,
+# filename). A cached URL is only handed out while it still has at least
+# `min_remaining` seconds to live, so clients always get a usable link.
+# URLs for hot keys (reused `hot_hits` times) are re-signed with a doubled
+# lifetime, up to `max_expires_in`, so they stay cached for longer.
+class SignedUrlCache:
+    def __init__(
+        self,
+        expires_in: int = 300,
+        max_expires_in: int = 3600,
+        min_remaining: int = 60,
+        hot_hits: int = 5,
+        max_entries: int = 10000,
+    ):
+        self.expires_in = expires_in
+        self.max_expires_in = max(max_expires_in, expires_in)
+        self.min_remaining = min(min_remaining, expires_in)
+        self.hot_hits = hot_hits
+        self.max_entries = max_entries
+        # key -> [url, expires_at, lifetime, hits]
+        self._entries: OrderedDict[tuple, list] = OrderedDict()
+        self._by_path: dict[str, set[tuple]] = {}
+
+    def _forget(self, key: tuple):
+        self._entries.pop(key, None)
+        keys = self._by_path.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_path[key[0]]
+
+    def _next_lifetime(self, previous: list | None) -> int:
+        if previous is None:
+            return self.expires_in
+        lifetime = previous[2]
+        if previous[3] >= self.hot_hits:
+            return min(lifetime * 2, self.max_expires_in)
+        return max(lifetime // 2, self.expires_in)
+
+    async def get_or_sign(
+        self,
+        storage_path: str,
+        disposition: str,
+        filename: str,
+        sign: Callable[[int], Awaitable[str]],
+    ) -> str:
+        key = (storage_path, disposition, filename)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] - now >= self.min_remaining:
+            entry[3] += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+        lifetime = self._next_lifetime(entry)
+        url = await sign(lifetime)
+        self._forget(key)
+        self._entries[key] = [url, now + lifetime, lifetime, 0]
+        self._by_path.setdefault(storage_path, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._forget(next(iter(self._entries)))
+        return url
+
+    def invalidate(self, storage_path: str):
+        for key in list(self._by_path.get(storage_path, ())):
+            self._forget(key)
@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from database_model.database_model import embedded_data as embed_data
+from database_model.database_model import file_info as file_data
+
+logger = logging.getLogger(__name__)
+
+# Indexes with at least this many vectors are searched through an inverted
+# file (IVF) of k-means clusters and keep int8 codes instead of float32.
+VECTOR_IVF_MIN_ROWS = int(os.getenv("VECTOR_IVF_MIN_ROWS", 50000))
+# Clusters scanned per query in IVF mode; more is slower but misses less.
+VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", 8))
+# Other workers may have added or deleted embeddings; reload after this long.
+VECTOR_INDEX_TTL = int(os.getenv("VECTOR_INDEX_TTL", 300))
+VECTOR_INDEX_MAX_ORGS = int(os.getenv("VECTOR_INDEX_MAX_ORGS", 64))
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_ROWS = 65536
+
+
+def encode_vector(values) -> bytes:
+    return np.asarray(values, dtype="<f4").tobytes()
+
+
+def decode_vector(blob: bytes | None, vector_data) -> np.ndarray:
+    if blob:
+        return np.frombuffer(blob, dtype="<f4")
+    # Rows written before vector_f32 existed only have the JSON copy.
+    values = vector_data.get("embedding") if isinstance(vector_data, dict) else vector_data
+    return np.asarray(values or [], dtype=np.float32)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+# Unit-normalized embeddings of one org and model in a contiguous matrix, so
+# cosine similarity against every file is one matrix-vector product. Row i
+# belongs to file_ids[i]; removal moves the last row into the gap.
+class VectorIndex:
+    def __init__(self, dims: int, capacity: int = 1024):
+        self.dims = dims
+        self.file_ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._vectors = np.empty((capacity, dims), dtype=np.float32)
+        self._clusters = np.empty(capacity, dtype=np.int32)
+        self.centroids: np.ndarray | None = None
+        # Per-dimension int8 step, set when the index is first trained.
+        self._scale: np.ndarray | None = None
+        self.trained_rows = 0
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.file_ids)
+
+    @property
+    def quantized(self) -> bool:
+        return self._scale is not None
+
+    def _encode(self, unit: np.ndarray) -> np.ndarray:
+        if self.quantized:
+            return np.clip(np.rint(unit / self._scale), -127, 127).astype(np.int8)
+        return unit
+
+    def _decoded(self, rows) -> np.ndarray:
+        vectors = self._vectors[rows]
+        return vectors.astype(np.float32) * self._scale if self.quantized else vectors
+
+    def _reserve(self, size: int):
+        if size <= len(self._vectors):
+            return
+        capacity = max(size, len(self._vectors) * 2)
+        vectors = np.empty((capacity, self.dims), dtype=self._vectors.dtype)
+        vectors[:len(self)] = self._vectors[:len(self)]
+        clusters = np.empty(capacity, dtype=np.int32)
+        clusters[:len(self)] = self._clusters[:len(self)]
+        self._vectors, self._clusters = vectors, clusters
+
+    def add(self, file_ids: list[str], matrix: np.ndarray):
+        unit = _normalize(np.asarray(matrix, dtype=np.float32).reshape(len(file_ids), self.dims))
+        self._reserve(len(self) + len(file_ids))
+        for file_id, vector in zip(file_ids, unit):
+            row = self._rows.get(file_id)
+            if row is None:
+                row = self._rows[file_id] = len(self.file_ids)
+                self.file_ids.append(file_id)
+            self._vectors[row] = self._encode(vector)
+            if self.centroids is not None:
+                self._clusters[row] = int(np.argmax(self.centroids @ vector))
+
+    def remove(self, file_ids):
+        for file_id in file_ids:
+            row = self._rows.pop(file_id, None)
+            if row is None:
+                continue
+            last = len(self.file_ids) - 1
+            if row != last:
+                moved = self.file_ids[last]
+                self.file_ids[row] = moved
+                self._rows[moved] = row
+                self._vectors[row] = self._vectors[last]
+                self._clusters[row] = self._clusters[last]
+            self.file_ids.pop()
+
+    @property
+    def needs_training(self) -> bool:
+        return len(self) >= VECTOR_IVF_MIN_ROWS and (self.centroids is None or len(self) >= 2 * self.trained_rows)
+
+    # k-means over a sample of the vectors, then every row is assigned to its
+    # nearest centroid and (the first time) re-encoded as int8.
+    def train(self, seed: int = 0):
+        size = len(self)
+        rng = np.random.default_rng(seed)
+        sample_rows = rng.choice(size, min(size, KMEANS_SAMPLE_ROWS), replace=False)
+        sample = self._decoded(sample_rows)
+        n_clusters = max(1, int(math.sqrt(size)))
+        centroids = sample[rng.choice(len(sample), n_clusters, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            empty = np.bincount(nearest, minlength=n_clusters) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        quantize = not self.quantized
+        if quantize:
+            # Unit vectors use a small part of [-1, 1] per dimension; scale
+            # each dimension to its own range so int8 keeps the precision.
+            scale = np.abs(sample).max(axis=0) / 127
+            scale[scale == 0] = 1
+            vectors = np.empty_like(self._vectors, dtype=np.int8)
+        for start in range(0, size, 8192):
+            chunk = self._decoded(slice(start, start + 8192))
+            self._clusters[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+            if quantize:
+                vectors[start:start + len(chunk)] = np.clip(np.rint(chunk / scale), -127, 127)
+        if quantize:
+            self._vectors, self._scale = vectors, scale.astype(np.float32)
+        self.centroids = centroids
+        self.trained_rows = size
+
+    def search(self, query, k: int) -> list[tuple[str, float]]:
+        if not len(self):
+            return []
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        if self.centroids is not None:
+            nprobe = min(VECTOR_IVF_NPROBE, len(self.centroids))
+            probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            rows = np.flatnonzero(np.isin(self._clusters[:len(self)], probe))
+            scores = self._vectors[rows].astype(np.float32) @ (query * self._scale)
+        else:
+            rows = None
+            scores = self._vectors[:len(self)] @ query
+        k = min(k, len(scores))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        if rows is not None:
+            return [(self.file_ids[rows[i]], float(scores[i])) for i in top]
+        return [(self.file_ids[i], float(scores[i])) for i in top]
+
+
+# The index takes the dimension most rows have; an org with no embeddings
+# yet gets the dimension of the first query.
+def _build(rows, default_dims: int) -> VectorIndex:
+    decoded = [(row, decode_vector(row.vector_f32, row.vector_data)) for row in rows]
+    dims = Counter(len(vector) for _, vector in decoded).most_common(1)[0][0] if decoded else default_dims
+    index = VectorIndex(dims, capacity=max(1024, len(decoded)))
+    file_ids = []
+    vectors = []
+    for row, vector in decoded:
+        if len(vector) != dims:
+            logger.warning("Skipping embedding %s: %s dims, index has %s", row.embed_id, len(vector), dims)
+            continue
+        file_ids.append(str(row.file_id))
+        vectors.append(vector)
+    if vectors:
+        index.add(file_ids, np.stack(vectors))
+    if index.needs_training:
+        index.train()
+    return index
+
+
+# Per-worker cache of VectorIndex by (org_id, model_used), loaded from
+# embedd_index on first search, kept current by add/remove_files, and
+# reloaded after VECTOR_INDEX_TTL to pick up other workers' changes.
+class VectorIndexRegistry:
+    def __init__(self, ttl: int = VECTOR_INDEX_TTL, max_orgs: int = VECTOR_INDEX_MAX_ORGS):
+        self.ttl = ttl
+        self.max_orgs = max_orgs
+        self._indexes: OrderedDict[tuple, VectorIndex] = OrderedDict()
+        self._loading: dict[tuple, asyncio.Lock] = {}
+
+    def _fresh(self, key: tuple) -> VectorIndex | None:
+        index = self._indexes.get(key)
+        if index is None or time.monotonic() - index.loaded_at > self.ttl or index.needs_training:
+            return None
+        self._indexes.move_to_end(key)
+        return index
+
+    async def get(self, db: AsyncSession, org_id, model: str, dims: int) -> VectorIndex:
+        key = (str(org_id), model)
+        index = self._fresh(key)
+        if index is not None:
+            return index
+        lock = self._loading.setdefault(key, asyncio.Lock())
+        async with lock:
+            index = self._fresh(key)
+            if index is None:
+                rows = (await db.execute(
+                    select(embed_data.embed_id, embed_data.file_id, embed_data.vector_f32, embed_data.vector_data)
+                    .join(file_data, file_data.file_id == embed_data.file_id)
+                    .where(
+                        file_data.org_id == org_id,
+                        file_data.is_deleted == False,
+                        embed_data.model_used == model,
+                    )
+                    .order_by(embed_data.created_at)
+                )).all()
+                index = await run_in_threadpool(_build, rows, dims)
+                self._indexes[key] = index
+                self._indexes.move_to_end(key)
+                while len(self._indexes) > self.max_orgs:
+                    evicted, _ = self._indexes.popitem(last=False)
+                    self._loading.pop(evicted, None)
+        return index
+
+    async def search(self, db: AsyncSession, org_id, model: str, query: list[float], k: int) -> list[tuple[str, float]]:
+        index = await self.get(db, org_id, model, len(query))
+        if index.dims != len(query):
+            raise ValueError(f"{model} embeddings have {index.dims} dimensions, got {len(query)}")
+
+        def run():
+            with index.lock:
+                return index.search(query, k)
+
+        return await run_in_threadpool(run)
+
+    def add(self, org_id, model: str, file_id, vector: list[float]):
+        index = self._indexes.get((str(org_id), model))
+        if index is None:
+            return
+        if index.dims != len(vector):
+            self._indexes.pop((str(org_id), model), None)
+            return
+        with index.lock:
+            index.add([str(file_id)], np.asarray(vector, dtype=np.float32))
+
+    def remove_files(self, org_id, file_ids):
+        file_ids = [str(file_id) for file_id in file_ids]
+        for (index_org, _), index in list(self._indexes.items()):
+            if index_org == str(org_id):
+                with index.lock:
+                    index.remove(file_ids)
+
+
+vector_index = VectorIndexRegistry()
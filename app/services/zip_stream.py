@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import struct
+import zlib
+from datetime import datetime
+from typing import AsyncIterator
+
+from app.services.storage import READ_CHUNK_SIZE, storage_for
+
+logger = logging.getLogger(__name__)
+
+# Objects whose first READ_CHUNK_SIZE bytes are fetched ahead of the one
+# being written. Small files arrive whole, so thousands of them are not
+# fetched one round trip at a time, and memory stays bounded at about this
+# many chunks.
+ARCHIVE_PREFETCH = int(os.getenv("ARCHIVE_PREFETCH", 8))
+
+# Deflate level for objects larger than one read; 1 keeps the CPU cost low
+# on content that is mostly compressed already.
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", 1))
+
+# ZIP archive written front to back, readable by streaming unzippers too.
+# Objects read whole ahead of time are stored, with their CRC and sizes in
+# the local header. Larger ones are deflated, which marks its own end, and
+# followed by a data descriptor with the CRC and sizes, so they need no
+# seeking back; the descriptor is ZIP64 only when a size needs it. The
+# central directory always uses ZIP64 extras, so archives and members may
+# exceed 4 GB.
+_VERSION = 45
+# Names are UTF-8 (bit 11); sizes and CRC follow the data (bit 3).
+_UTF8 = 0x0800
+_DESCRIPTOR = 0x0008
+_STORED = 0
+_DEFLATED = 8
+_UNIX_FILE = 0o100644 << 16
+_MAX32 = 0xFFFFFFFF
+_MAX16 = 0xFFFF
+_TO_END = 2 ** 62
+
+
+def _dos_datetime(modified: datetime | None) -> tuple[int, int]:
+    modified = max(modified or datetime(1980, 1, 1), datetime(1980, 1, 1))
+    return (
+        modified.hour << 11 | modified.minute << 5 | modified.second // 2,
+        (modified.year - 1980) << 9 | modified.month << 5 | modified.day,
+    )
+
+
+def _local_header(name: bytes, flags: int, method: int, dos_time: int, dos_date: int, crc: int = 0, size: int = 0) -> bytes:
+    return struct.pack(
+        "<IHHHHHIIIHH", 0x04034B50, _VERSION, flags, method, dos_time, dos_date, crc, size, size, len(name), 0
+    ) + name
+
+
+def _descriptor(crc: int, compressed: int, size: int) -> bytes:
+    if compressed >= _MAX32 or size >= _MAX32:
+        return struct.pack("<IIQQ", 0x08074B50, crc, compressed, size)
+    return struct.pack("<IIII", 0x08074B50, crc, compressed, size)
+
+
+def _central_header(name: bytes, flags: int, method: int, dos_time: int, dos_date: int, crc: int, compressed: int, size: int, offset: int) -> bytes:
+    extra = struct.pack("<HHQQQ", 1, 24, size, compressed, offset)
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII",
+        0x02014B50, 3 << 8 | _VERSION, _VERSION, flags, method, dos_time, dos_date, crc,
+        _MAX32, _MAX32, len(name), len(extra), 0, 0, 0, _UNIX_FILE, _MAX32,
+    ) + name + extra
+
+
+def _end_records(count: int, directory_offset: int, directory_size: int) -> bytes:
+    end_offset = directory_offset + directory_size
+    return (
+        struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 3 << 8 | _VERSION, _VERSION, 0, 0, count, count, directory_size, directory_offset)
+        + struct.pack("<IIQI", 0x07064B50, 0, end_offset, 1)
+        + struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, _MAX16, _MAX16, _MAX32, _MAX32, 0)
+    )
+
+
+# First chunk of an object, or None when it cannot be read; fetched ahead.
+async def _read_first(storage_path: str) -> bytes | None:
+    try:
+        return await storage_for(storage_path).read_range(storage_path, 0, READ_CHUNK_SIZE)
+    except Exception:
+        logger.exception("Reading %s for an archive failed", storage_path)
+        return None
+
+
+# "MISSING.txt", or "MISSING (n).txt" for the first n no entry is named
+# (compared case-insensitively, like the entry names themselves).
+def _note_name(names: list[str]) -> str:
+    taken = {name.lower() for name in names}
+    candidate = "MISSING.txt"
+    n = 0
+    while candidate.lower() in taken:
+        n += 1
+        candidate = f"MISSING ({n}).txt"
+    return candidate
+
+
+# Streams a ZIP of `entries` ([(name, storage_path, modified)], names
+# unique). Objects that turn out to be missing are left out and listed in a
+# final "MISSING.txt" entry (numbered if a file has that name), since the
+# response has started by then.
+async def zip_stream(entries: list[tuple[str, str, datetime | None]]) -> AsyncIterator[bytes]:
+    prefetched: dict[int, asyncio.Task] = {}
+
+    def prefetch(upto: int):
+        for i in range(upto, min(upto + ARCHIVE_PREFETCH, len(entries))):
+            if i not in prefetched:
+                prefetched[i] = asyncio.create_task(_read_first(entries[i][1]))
+
+    offset = 0
+    directory = []
+    missing = []
+
+    def stored(name: bytes, data: bytes, modified: datetime | None) -> bytes:
+        nonlocal offset
+        dos_time, dos_date = _dos_datetime(modified)
+        crc = zlib.crc32(data)
+        entry = _local_header(name, _UTF8, _STORED, dos_time, dos_date, crc, len(data)) + data
+        directory.append(_central_header(name, _UTF8, _STORED, dos_time, dos_date, crc, len(data), len(data), offset))
+        offset += len(entry)
+        return entry
+
+    try:
+        for i, (name, storage_path, modified) in enumerate(entries):
+            prefetch(i)
+            first = await prefetched.pop(i)
+            if first is None:
+                missing.append(name)
+                continue
+            encoded = name.encode()
+            if len(first) < READ_CHUNK_SIZE:
+                # The whole object is here: its CRC goes in the header.
+                yield stored(encoded, first, modified)
+                continue
+
+            flags = _UTF8 | _DESCRIPTOR
+            dos_time, dos_date = _dos_datetime(modified)
+            header = _local_header(encoded, flags, _DEFLATED, dos_time, dos_date)
+            yield header
+            compressor = zlib.compressobj(ARCHIVE_COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+            crc = zlib.crc32(first)
+            size = len(first)
+            compressed = 0
+            data = await asyncio.to_thread(compressor.compress, first)
+            compressed += len(data)
+            yield data
+            # The rest of the object, however long it is.
+            async for chunk in storage_for(storage_path).iter_range(storage_path, size, _TO_END):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                data = await asyncio.to_thread(compressor.compress, chunk)
+                compressed += len(data)
+                if data:
+                    yield data
+            data = compressor.flush()
+            compressed += len(data)
+            descriptor = _descriptor(crc, compressed, size)
+            yield data + descriptor
+            directory.append(_central_header(encoded, flags, _DEFLATED, dos_time, dos_date, crc, compressed, size, offset))
+            offset += len(header) + compressed + len(descriptor)
+
+        if missing:
+            note = ("These files could not be read from storage:\n" + "".join(f"{name}\n" for name in missing)).encode()
+            yield stored(_note_name([entry[0] for entry in entries]).encode(), note, datetime.utcnow())
+
+        central = b"".join(directory)
+        yield central + _end_records(len(directory), offset, len(central))
+    finally:
+        for task in prefetched.values():
+            task.cancel()
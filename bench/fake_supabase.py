@@ -0,0 +1,152 @@
+# Minimal stand-in for Supabase Auth, used to test and benchmark the backend
+# without a real project. It speaks the subset of the GoTrue API FileTracker
+# uses: password/refresh token grants, /user, admin user creation and JWKS.
+#
+#   uvicorn bench.fake_supabase:app --port 9999
+#
+# Then point the backend at it with SUPABASE_URL=http://127.0.0.1:9999.
+# Users can be seeded with FAKE_SUPABASE_USERS="a@x.com:pw,b@x.com:pw".
+# GET /__stats returns per-endpoint call counts (handy for checking that
+# concurrent refreshes are coalesced); POST /__stats/reset clears them.
+import asyncio
+import json
+import os
+import secrets
+import time
+import uuid
+from collections import Counter
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import FastAPI, Header, HTTPException, Request
+
+KEY_ID = "fake-supabase-key"
+TOKEN_TTL = int(os.getenv("FAKE_SUPABASE_TOKEN_TTL", 3600))
+LATENCY_MS = float(os.getenv("FAKE_SUPABASE_LATENCY_MS", 0))
+SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "fake-service-role-key")
+
+app = FastAPI(title="Fake Supabase Auth")
+
+_signing_key = ec.generate_private_key(ec.SECP256R1())
+_users: dict[str, dict] = {}
+_refresh_tokens: dict[str, str] = {}
+calls: Counter = Counter()
+
+
+def add_user(email: str, password: str, user_id: str | None = None) -> dict:
+    user = {"id": user_id or str(uuid.uuid4()), "email": email, "password": password}
+    _users[email] = user
+    return user
+
+
+for _entry in filter(None, os.getenv("FAKE_SUPABASE_USERS", "").split(",")):
+    _email, _, _password = _entry.partition(":")
+    add_user(_email.strip(), _password.strip())
+
+
+def _public_user(user: dict) -> dict:
+    return {"id": user["id"], "email": user["email"], "aud": "authenticated", "role": "authenticated"}
+
+
+def _issuer(request: Request) -> str:
+    return str(request.base_url).rstrip("/") + "/auth/v1"
+
+
+def _session(request: Request, user: dict) -> dict:
+    now = int(time.time())
+    access_token = jwt.encode(
+        {
+            "sub": user["id"],
+            "email": user["email"],
+            "aud": "authenticated",
+            "role": "authenticated",
+            "iss": _issuer(request),
+            "iat": now,
+            "exp": now + TOKEN_TTL,
+        },
+        _signing_key,
+        algorithm="ES256",
+        headers={"kid": KEY_ID},
+    )
+    refresh_token = secrets.token_urlsafe(24)
+    _refresh_tokens[refresh_token] = user["email"]
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": TOKEN_TTL,
+        "refresh_token": refresh_token,
+        "user": _public_user(user),
+    }
+
+
+@app.middleware("http")
+async def count_and_delay(request: Request, call_next):
+    if not request.url.path.startswith("/__stats"):
+        calls[f"{request.method} {request.url.path}"] += 1
+        if LATENCY_MS:
+            await asyncio.sleep(LATENCY_MS / 1000)
+    return await call_next(request)
+
+
+@app.get("/auth/v1/.well-known/jwks.json")
+async def jwks():
+    key = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(_signing_key.public_key()))
+    key.update({"kid": KEY_ID, "alg": "ES256", "use": "sig"})
+    return {"keys": [key]}
+
+
+@app.post("/auth/v1/token")
+async def token(request: Request, grant_type: str):
+    body = await request.json()
+    if grant_type == "password":
+        user = _users.get(body.get("email"))
+        if not user or user["password"] != body.get("password"):
+            raise HTTPException(status_code=400, detail="Invalid login credentials")
+        return _session(request, user)
+    if grant_type == "refresh_token":
+        # Refresh tokens are single use, as in Supabase.
+        email = _refresh_tokens.pop(body.get("refresh_token"), None)
+        if email is None:
+            raise HTTPException(status_code=400, detail="Invalid Refresh Token")
+        return _session(request, _users[email])
+    raise HTTPException(status_code=400, detail="Unsupported grant type")
+
+
+@app.get("/auth/v1/user")
+async def get_user(request: Request, authorization: str = Header(default="")):
+    token = authorization.removeprefix("Bearer ").strip()
+    try:
+        claims = jwt.decode(
+            token,
+            _signing_key.public_key(),
+            algorithms=["ES256"],
+            audience="authenticated",
+            issuer=_issuer(request),
+        )
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid JWT")
+    user = _users.get(claims.get("email"))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return _public_user(user)
+
+
+@app.post("/auth/v1/admin/users")
+async def admin_create_user(request: Request, authorization: str = Header(default="")):
+    if authorization != f"Bearer {SERVICE_ROLE_KEY}":
+        raise HTTPException(status_code=401, detail="Invalid service role key")
+    body = await request.json()
+    if body.get("email") in _users:
+        raise HTTPException(status_code=422, detail="User already registered")
+    return _public_user(add_user(body["email"], body["password"]))
+
+
+@app.get("/__stats")
+async def stats():
+    return dict(calls)
+
+
+@app.post("/__stats/reset")
+async def reset_stats():
+    calls.clear()
+    return {"message": "reset"}
@@ -0,0 +1,330 @@
+# Load-test harness for the FileTracker API.
+#
+#   python -m bench.run --database-url postgresql://postgres:pw@localhost/bench \
+#       --duration 60 --concurrency 32 --output bench/results.json
+#
+# Starts bench.fake_supabase and app.main:app with uvicorn, using an
+# in-memory object store (or moto, with --storage moto) and the given
+# Postgres, seeds an org with files, then replays the request mix from
+# bench/workload.py. Results (throughput, p50/p95/p99 latency per
+# operation, peak RSS of the API process) are written as JSON. With
+# --baseline the run is compared to a saved result and exits with status 1
+# on a regression. See bench/README.md.
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from bench.workload import Workload, parse_mix
+
+ROOT = Path(__file__).resolve().parent.parent
+# Operations with fewer samples than this are too noisy to compare.
+MIN_COMPARE_SAMPLES = 20
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_process(args: list[str], env: dict, log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen([sys.executable, "-m", *args], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+# Peak resident set size of a process, from the kernel's high-water mark.
+# Linux only; None elsewhere.
+def peak_rss(pid: int) -> int | None:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def prepare_database(database_url: str):
+    os.environ["DATABASE_URL"] = database_url
+    from sqlalchemy import text
+    from dbConfig.database import engine
+    from database_model.database_model import Base
+
+    async def create():
+        async with engine.begin() as conn:
+            try:
+                async with conn.begin_nested():
+                    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            except Exception as e:
+                print(f"warning: pg_trgm unavailable, search will fail ({e.__class__.__name__})", file=sys.stderr)
+            await conn.run_sync(Base.metadata.create_all)
+        await engine.dispose()
+
+    asyncio.run(create())
+
+
+def start_moto(env: dict, log_dir: Path) -> subprocess.Popen:
+    try:
+        import boto3
+        import moto  # noqa: F401
+    except ImportError:
+        raise SystemExit("--storage moto needs moto[server]: pip install 'moto[server]'")
+    port = free_port()
+    process = start_process(["moto.server", "-p", str(port)], env, log_dir / "moto.log")
+    endpoint = f"http://127.0.0.1:{port}"
+    wait_ready(endpoint, process)
+    env.update(
+        STORAGE_BACKEND="s3",
+        AWS_S3_ENDPOINT_URL=endpoint,
+        AWS_S3_BUCKET="filetracker-bench",
+        AWS_ACCESS_KEY_ID="bench",
+        AWS_SECRET_ACCESS_KEY="bench",
+        AWS_REGION="us-east-1",
+    )
+    boto3.client(
+        "s3", endpoint_url=endpoint, region_name="us-east-1",
+        aws_access_key_id="bench", aws_secret_access_key="bench",
+    ).create_bucket(Bucket="filetracker-bench")
+    return process
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: list[tuple[float, bool]], duration: float) -> dict:
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throughput_rps": round(len(samples) / duration, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round((latencies[-1] if latencies else 0) * 1000, 2),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def drive(base_url: str, args, mix: dict[str, float]) -> tuple[dict, float, int]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+        res = await client.post("/api/auth/register", json={
+            "email": email, "password": "bench-password", "user_name": "Bench", "org_name": f"bench{uuid.uuid4().hex[:8]}",
+        })
+        res.raise_for_status()
+
+        workload = Workload(client, mix, args.seed)
+        seed_rng = random.Random(args.seed)
+        pending = set()
+        for _ in range(args.seed_files):
+            pending.add(asyncio.create_task(workload.upload(random.Random(seed_rng.random()))))
+            if len(pending) >= args.concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        await asyncio.gather(*pending)
+        seeded_bytes = workload.uploaded_bytes
+
+        samples: dict[str, list] = {}
+        start = time.perf_counter()
+        record_after = start + args.warmup
+        deadline = record_after + args.duration
+        await asyncio.gather(*(
+            workload.worker(index, deadline, record_after, samples) for index in range(args.concurrency)
+        ))
+        measured = time.perf_counter() - record_after
+        return samples, measured, workload.uploaded_bytes - seeded_bytes
+
+
+def run(args) -> dict:
+    mix = parse_mix(args.mix)
+    log_dir = Path(args.log_dir)
+    log_dir.mkdir(parents=True, exist_ok=True)
+    prepare_database(args.database_url)
+
+    supabase_port, api_port = free_port(), free_port()
+    supabase_url = f"http://127.0.0.1:{supabase_port}"
+    base_url = f"http://127.0.0.1:{api_port}"
+    env = dict(
+        os.environ,
+        DATABASE_URL=args.database_url,
+        SUPABASE_URL=supabase_url,
+        SUPABASE_ANON_KEY="bench-anon-key",
+        SUPABASE_SERVICE_ROLE_KEY="bench-service-role-key",
+        STORAGE_BACKEND="memory",
+        PUBLIC_API_URL=base_url,
+        COOKIE_SECURE="false",
+    )
+    processes = []
+    try:
+        if args.storage == "moto":
+            processes.append(start_moto(env, log_dir))
+        supabase = start_process(
+            ["uvicorn", "bench.fake_supabase:app", "--port", str(supabase_port), "--no-access-log"],
+            env, log_dir / "fake_supabase.log",
+        )
+        processes.append(supabase)
+        wait_ready(f"{supabase_url}/auth/v1/.well-known/jwks.json", supabase)
+        api = start_process(
+            ["uvicorn", "app.main:app", "--port", str(api_port), "--no-access-log"],
+            env, log_dir / "api.log",
+        )
+        processes.append(api)
+        wait_ready(f"{base_url}/docs", api)
+
+        samples, measured, uploaded_bytes = asyncio.run(drive(base_url, args, mix))
+        rss = peak_rss(api.pid)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    every = [sample for op_samples in samples.values() for sample in op_samples]
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": args.storage,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "seed": args.seed,
+            "seed_files": args.seed_files,
+            "mix": mix,
+        },
+        "summary": summarize(every, measured),
+        "operations": {name: summarize(op_samples, measured) for name, op_samples in sorted(samples.items())},
+        "upload_mb_per_s": round(uploaded_bytes / measured / (1024 * 1024), 2),
+        "peak_rss_bytes": rss,
+    }
+
+
+# Lists the ways `current` is worse than `baseline` by more than `tolerance`
+# (a fraction): slower p95/p99, lower throughput, more errors, more memory.
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+
+    def check(label: str, now, before, higher_is_worse: bool = True):
+        if not before or now is None:
+            return
+        change = (now - before) / before
+        if (change if higher_is_worse else -change) > tolerance:
+            regressions.append(f"{label}: {before} -> {now} ({change:+.1%})")
+
+    ops = {"summary": (current["summary"], baseline.get("summary", {}))}
+    for name, stats in current["operations"].items():
+        if name in baseline.get("operations", {}):
+            ops[name] = (stats, baseline["operations"][name])
+    for name, (now, before) in ops.items():
+        if now["requests"] < MIN_COMPARE_SAMPLES or before.get("requests", 0) < MIN_COMPARE_SAMPLES:
+            continue
+        check(f"{name} p95_ms", now["p95_ms"], before.get("p95_ms"))
+        check(f"{name} p99_ms", now["p99_ms"], before.get("p99_ms"))
+        check(f"{name} throughput_rps", now["throughput_rps"], before.get("throughput_rps"), higher_is_worse=False)
+        if now["error_rate"] > before.get("error_rate", 0) + 0.01:
+            regressions.append(f"{name} error_rate: {before.get('error_rate', 0)} -> {now['error_rate']}")
+    check("peak_rss_bytes", current.get("peak_rss_bytes"), baseline.get("peak_rss_bytes"))
+    return regressions
+
+
+def print_report(result: dict):
+    print(f"{'operation':<10} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}", file=sys.stderr)
+    for name, stats in [*result["operations"].items(), ("total", result["summary"])]:
+        print(
+            f"{name:<10} {stats['requests']:>9} {stats['errors']:>7} {stats['throughput_rps']:>9} "
+            f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}",
+            file=sys.stderr,
+        )
+    rss = result["peak_rss_bytes"]
+    print(f"uploads {result['upload_mb_per_s']} MiB/s, peak RSS {rss // (1024 * 1024) if rss else '?'} MiB", file=sys.stderr)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the FileTracker API.")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="Postgres to benchmark against (default: $BENCH_DATABASE_URL). Tables are created if missing.")
+    parser.add_argument("--storage", choices=["memory", "moto"], default="memory")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before measuring")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--seed-files", type=int, default=200, help="files uploaded before the run")
+    parser.add_argument("--mix", help="override operation weights, e.g. 'upload=5,search=0'")
+    parser.add_argument("--output", help="write the JSON result here (default: stdout)")
+    parser.add_argument("--baseline", help="compare with this saved result; exit 1 on regression")
+    parser.add_argument("--save-baseline", help="also write the result here as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression (default 0.15)")
+    parser.add_argument("--log-dir", default=str(ROOT / "bench" / "logs"))
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error("--database-url or BENCH_DATABASE_URL is required")
+
+    result = run(args)
+    print_report(result)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(output + "\n")
+
+    if args.baseline:
+        regressions = compare(result, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("no regressions against baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
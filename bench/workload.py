@@ -0,0 +1,144 @@
+# Request mix replayed by bench/run.py against a running FileTracker API.
+# Each worker owns a seeded Random, so a run with the same --seed, mix and
+# concurrency issues the same sequence of operations.
+import random
+import time
+
+import httpx
+
+KIB = 1024
+MIB = 1024 * KIB
+
+# Relative weights of each operation in the default mix.
+DEFAULT_MIX = {
+    "upload": 10,
+    "list": 35,
+    "search": 15,
+    "open": 15,
+    "download": 15,
+    "stats": 10,
+}
+
+# (size in bytes, weight) of uploaded files: mostly documents and images,
+# a few larger media files that exercise the multipart path.
+UPLOAD_SIZES = [
+    (4 * KIB, 40),
+    (64 * KIB, 30),
+    (512 * KIB, 15),
+    (2 * MIB, 10),
+    (12 * MIB, 5),
+]
+UPLOAD_TYPES = [
+    ("pdf", "application/pdf"),
+    ("png", "image/png"),
+    ("docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    ("csv", "text/csv"),
+    ("mp4", "video/mp4"),
+]
+# Share of uploads that repeat content already stored (deduplicated by checksum).
+DUPLICATE_UPLOAD_RATE = 0.1
+# Chance that a listing follows next_cursor instead of starting over.
+NEXT_PAGE_RATE = 0.6
+PAGE_SIZE = 50
+
+WORDS = [
+    "invoice", "report", "contract", "budget", "roadmap", "design", "meeting",
+    "notes", "summary", "quarterly", "onboarding", "policy", "proposal", "draft",
+]
+
+
+def parse_mix(spec: str | None) -> dict[str, float]:
+    mix = dict(DEFAULT_MIX)
+    for item in filter(None, (spec or "").split(",")):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation in mix: {name}")
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def make_filename(rng: random.Random) -> tuple[str, str]:
+    ext, content_type = rng.choice(UPLOAD_TYPES)
+    name = "-".join(rng.sample(WORDS, 2))
+    return f"{name}-{rng.randrange(100000)}.{ext}", content_type
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, mix: dict[str, float], seed: int):
+        self.client = client
+        self.mix = mix
+        self.seed = seed
+        self.file_ids: list[str] = []
+        self.contents: list[bytes] = []
+        self.uploaded_bytes = 0
+
+    async def upload(self, rng: random.Random) -> None:
+        if self.contents and rng.random() < DUPLICATE_UPLOAD_RATE:
+            data = rng.choice(self.contents)
+        else:
+            size = rng.choices([s for s, _ in UPLOAD_SIZES], [w for _, w in UPLOAD_SIZES])[0]
+            data = rng.randbytes(size)
+            if size <= 64 * KIB:
+                self.contents.append(data)
+        filename, content_type = make_filename(rng)
+        res = await self.client.post("/api/files/upload", files={"file": (filename, data, content_type)})
+        res.raise_for_status()
+        self.file_ids.append(res.json()["file_id"])
+        self.uploaded_bytes += len(data)
+
+    async def list(self, rng: random.Random, state: dict) -> None:
+        params = {"limit": PAGE_SIZE}
+        if state.get("cursor") and rng.random() < NEXT_PAGE_RATE:
+            params["cursor"] = state["cursor"]
+        res = await self.client.get("/api/files", params=params)
+        res.raise_for_status()
+        state["cursor"] = res.json()["next_cursor"]
+
+    async def search(self, rng: random.Random) -> None:
+        res = await self.client.get("/api/files", params={"search": rng.choice(WORDS), "limit": PAGE_SIZE})
+        res.raise_for_status()
+
+    async def open(self, rng: random.Random) -> None:
+        res = await self.client.get(f"/api/files/{rng.choice(self.file_ids)}/open")
+        res.raise_for_status()
+        if "signed_url" not in res.json():
+            raise RuntimeError(res.text)
+
+    # Signed URL plus the object bytes, as a browser download would fetch them.
+    async def download(self, rng: random.Random) -> None:
+        res = await self.client.get(f"/api/files/{rng.choice(self.file_ids)}/download")
+        res.raise_for_status()
+        async with self.client.stream("GET", res.json()["signed_url"]) as body:
+            body.raise_for_status()
+            async for _ in body.aiter_bytes():
+                pass
+
+    async def stats(self, rng: random.Random) -> None:
+        res = await self.client.get("/api/stats")
+        res.raise_for_status()
+
+    async def run_op(self, name: str, rng: random.Random, state: dict) -> None:
+        if name == "list":
+            await self.list(rng, state)
+        else:
+            await getattr(self, name)(rng)
+
+    # Runs until `deadline` (perf_counter); samples before `record_after` are
+    # warmup and are not reported.
+    async def worker(self, index: int, deadline: float, record_after: float, samples: dict[str, list]):
+        rng = random.Random(self.seed * 1000 + index)
+        names, weights = list(self.mix), list(self.mix.values())
+        state: dict = {}
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            if name in ("open", "download") and not self.file_ids:
+                name = "upload"
+            started = time.perf_counter()
+            try:
+                await self.run_op(name, rng, state)
+                ok = True
+            except (httpx.HTTPError, RuntimeError, KeyError, ValueError):
+                ok = False
+            if started >= record_after:
+                samples.setdefault(name, []).append((time.perf_counter() - started, ok))
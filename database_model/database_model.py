@@ -1,6 +1,6 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, String, Text, JSON, Integer, DateTime, Boolean, ForeignKey, DECIMAL as Decimal
-from sqlalchemy.dialects.postgresql import UUID, ARRAY as Array
+from sqlalchemy import Column, String, Text, JSON, Integer, BigInteger, LargeBinary, DateTime, Boolean, ForeignKey, DECIMAL as Decimal, func
+from sqlalchemy.dialects.postgresql import UUID, ARRAY as Array, TSVECTOR
 import uuid
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -25,7 +25,7 @@ class file_info(Base):
     storage_path = Column(Text, nullable=False)
     file_type = Column(Text, nullable=False)
     file_size = Column(Integer, nullable=False)
-    checksum = Column(Text, nullable=False)
+    checksum = Column(Text)
     uploaded_at = Column(DateTime, nullable=False,default=datetime.utcnow)
     is_deleted = Column(Boolean, nullable=False)
 
@@ -38,7 +38,7 @@ class user(Base):
     user_name= Column(Text, nullable=False)
     user_email= Column("user_email", Text, nullable=False)
     u_role= Column(Text, nullable=False, default='admin')
-    joined_at= Column(DateTime, nullable=False, default='now()')
+    joined_at= Column(DateTime, nullable=False, default=func.now())
     is_active= Column(Boolean,nullable=False, default=True)
     usernfo = relationship("file_info", back_populates="fileinfo")
     userlogdetail = relationship("activity_log", back_populates="userlog")
@@ -53,7 +53,7 @@ class organization(Base):
     org_name = Column(String, nullable=False)
     domain_name=Column(String, nullable=False,default='@abc.org')
     plan_id=Column(UUID)
-    created_at=Column(DateTime, nullable=False, default='now()')
+    created_at=Column(DateTime, nullable=False, default=func.now())
     storage_limit=Column(String, nullable=False) #10GB default limit
     orginfo = relationship("subscription", back_populates="orgidinfo")
     webhook = relationship("webhook_logs", back_populates="webhoookid")
@@ -78,7 +78,7 @@ class subscription(Base):
     orgidinfo = relationship("organization", back_populates="orginfo")
     plan_id= Column(UUID, ForeignKey("plan.plan_id"), nullable=False)
     planidinfo = relationship("plan", back_populates="planinfo")
-    start_date= Column(DateTime, nullable=False, default='now()')
+    start_date= Column(DateTime, nullable=False, default=func.now())
     end_date= Column(DateTime, nullable=False)
     status= Column(Text, nullable=False)
 
@@ -104,20 +104,46 @@ class file_metadata(Base):
     filemetadata=relationship("file_info", back_populates="filemd")
     ver_no =Column(Integer, nullable=False, default=1)
     storage_path=Column(Text, nullable=False) 
-    created_at =Column(DateTime, nullable=False, default='now()')
+    created_at =Column(DateTime, nullable=False, default=func.now())
     changelog=Column(Text, nullable=False)
+    # chunked versions: [[sha256, size], ...] in file order, and their total size
+    chunks=Column(JSON)
+    file_size=Column(BigInteger)
+
+#define model for text extracted from file content
+class content_metadata(Base):
+    __tablename__ = 'metadata'
+
+    meta_id=Column(UUID, primary_key=True , nullable=False,default=uuid.uuid4)
+    file_id=Column(UUID, ForeignKey("file_data.file_id"), nullable=False, unique=True)
+    # copied from file_data so content search can be scoped by the GIN index
+    org_id=Column(UUID)
+    summary=Column(Text)
+    keywords=Column(Array(Text))
+    lang=Column(Text)
+    content_type=Column(Text, nullable=False)
+    indexed_at=Column(DateTime, nullable=False, default=func.now())
+    # checksum of the content the row was extracted from
+    checksum=Column(Text)
+    # processing, retry, done, skipped or failed
+    status=Column(Text, nullable=False, default='processing')
+    # extractions that ended in a storage error or a crashed worker
+    attempts=Column(Integer, nullable=False, default=0)
+    content=Column(Text)
+    search_vector=Column(TSVECTOR)
 
 #define file analytics model
 class file_analytics(Base):
     __tablename__ = 'file_analytics'
 
     anly_id=Column(UUID, primary_key=True , nullable=False,default=uuid.uuid4)
-    file_id =Column(UUID, ForeignKey("file_data.file_id"), nullable=False)
+    file_id =Column(UUID, ForeignKey("file_data.file_id"), nullable=False, unique=True)
     fileAnlyId =relationship("file_info" , back_populates="fileanalytics")
     view_count=Column(Integer , nullable=False)
     download_count=Column(Integer , nullable=False)
     last_accesed=Column(DateTime)
     unique_users=Column(Integer)
+    hll_sketch=Column(LargeBinary)
 
 #define file access model
 class file_access(Base):
@@ -141,6 +167,8 @@ class embedded_data(Base):
     file_id=Column(UUID, ForeignKey("file_data.file_id"), nullable=False)
     fileindexid =relationship("file_info", back_populates="fileaccessindex")
     vector_data=Column(JSON, nullable=False)
+    # float32 little-endian copy of the embedding, loaded by the vector index
+    vector_f32=Column(LargeBinary)
     model_used=Column(Text, nullable=False)
     created_at=Column(DateTime, nullable=False)
 
@@ -166,3 +194,85 @@ class webhook_logs(Base):
     secret_token=Column(Text, nullable=False)
     is_active=Column(DateTime, nullable=False)
 
+#define model for per-org storage counters (one row per org and file type)
+class org_storage_stats(Base):
+    __tablename__ = 'org_storage_stats'
+    org_id=Column(UUID, primary_key=True, nullable=False)
+    file_type=Column(Text, primary_key=True, nullable=False, default='')
+    file_count=Column(BigInteger, nullable=False, default=0)
+    total_bytes=Column(BigInteger, nullable=False, default=0)
+    updated_at=Column(DateTime, nullable=False, default=datetime.utcnow)
+
+#define model for per-org storage quota (limit parsed to bytes, maintained usage)
+class org_quota(Base):
+    __tablename__ = 'org_quota'
+    org_id=Column(UUID, ForeignKey("org.org_id"), primary_key=True, nullable=False)
+    # null means unlimited
+    limit_bytes=Column(BigInteger)
+    # live files and versions
+    used_bytes=Column(BigInteger, nullable=False, default=0)
+    # pending uploads that have not been recorded yet
+    reserved_bytes=Column(BigInteger, nullable=False, default=0)
+    updated_at=Column(DateTime, nullable=False, default=datetime.utcnow)
+
+#define model for quota held by proxied uploads while their bytes move to storage
+class quota_reservation(Base):
+    __tablename__ = 'quota_reservation'
+    reservation_id=Column(UUID, primary_key=True, nullable=False, default=uuid.uuid4)
+    org_id=Column(UUID, ForeignKey("org.org_id"), nullable=False)
+    size=Column(BigInteger, nullable=False)
+    # a worker that died mid-upload never releases; the reconciler drops it then
+    expires_at=Column(DateTime, nullable=False)
+
+#define model for upload sessions (direct-to-storage and resumable uploads)
+class upload_session(Base):
+    __tablename__ = 'upload_session'
+    session_id=Column(UUID, primary_key=True, nullable=False, default=uuid.uuid4)
+    org_id=Column(UUID, nullable=False)
+    owner_id=Column(UUID, ForeignKey("user_data.user_id"), nullable=False)
+    filename=Column(Text, nullable=False)
+    file_type=Column(Text, nullable=False)
+    file_size=Column(BigInteger, nullable=False)
+    checksum=Column(Text)
+    storage_path=Column(Text, nullable=False)
+    upload_id=Column(Text)
+    part_size=Column(BigInteger)
+    status=Column(Text, nullable=False, default='pending')
+    created_at=Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at=Column(DateTime, nullable=False, default=datetime.utcnow)
+
+#define model for the parts of a resumable upload that reached storage
+class upload_part(Base):
+    __tablename__ = 'upload_part'
+    session_id=Column(UUID, ForeignKey("upload_session.session_id"), primary_key=True, nullable=False)
+    part_number=Column(Integer, primary_key=True, nullable=False)
+    etag=Column(Text, nullable=False)
+    part_size=Column(BigInteger, nullable=False)
+
+#define model for the content-defined chunks that make up file versions
+class file_chunk(Base):
+    __tablename__ = 'file_chunk'
+    org_id=Column(UUID, primary_key=True, nullable=False)
+    chunk_hash=Column(Text, primary_key=True, nullable=False)
+    storage_path=Column(Text, nullable=False)
+    chunk_size=Column(Integer, nullable=False)
+    # references from file_md manifests; unreferenced chunks are collected
+    ref_count=Column(Integer, nullable=False, default=0)
+    updated_at=Column(DateTime, nullable=False, default=datetime.utcnow)
+
+#define model for thumbnails and previews derived from file content
+class derived_asset(Base):
+    __tablename__ = 'derived_asset'
+    org_id=Column(UUID, primary_key=True, nullable=False)
+    checksum=Column(Text, primary_key=True, nullable=False)
+    # longest side in pixels
+    size=Column(Integer, primary_key=True, nullable=False)
+    # processing, retry, done, skipped or failed
+    status=Column(Text, nullable=False, default='processing')
+    # renders that ended in a storage error or a crashed worker
+    attempts=Column(Integer, nullable=False, default=0)
+    storage_path=Column(Text)
+    content_type=Column(Text)
+    width=Column(Integer)
+    height=Column(Integer)
+    updated_at=Column(DateTime, nullable=False, default=datetime.utcnow)
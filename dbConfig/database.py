@@ -1,30 +1,49 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from fastapi import Request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 import os
 from dotenv import load_dotenv
 
+from app.services.metrics import InstrumentedPool, instrument_engine
+
 load_dotenv()
 
 
 db_url = os.getenv("DATABASE_URL")
-if db_url and db_url.startswith("postgres://"):
-    db_url = db_url.replace("postgres://", "postgresql://", 1)
-
-
-engine = create_engine(
-    db_url, 
+if db_url:
+    url = make_url(db_url.replace("postgres://", "postgresql://", 1))
+    # asyncpg spells libpq's sslmode as ssl.
+    query = dict(url.query)
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+    db_url = url.set(drivername="postgresql+asyncpg", query=query)
+
+
+engine = create_async_engine(
+    db_url,
+    poolclass=InstrumentedPool,
     pool_pre_ping=True,
     pool_size=10,
     max_overflow=20
 )
+instrument_engine(engine)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay loaded after commit; async sessions cannot lazy-load on access.
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+# One session per request, opened on first use and closed by
+# db_session_middleware in app/main.py once the response is sent.
+async def get_db(request: Request) -> AsyncSession:
+    db = getattr(request.state, "db", None)
+    if db is None:
+        db = request.state.db = SessionLocal()
+    return db
+
+
+async def close_request_db(request: Request):
+    db = getattr(request.state, "db", None)
+    if db is not None:
+        await db.close()
@@ -99,3 +99,324 @@ export function apiUploadFile<T>(
         xhr.send(body);
     });
 }
+
+export interface FilePreview {
+    url: string;
+    content_type: string;
+    width: number | null;
+    height: number | null;
+}
+
+export interface PreviewsResponse {
+    previews: Record<string, FilePreview>;
+    pending: string[];
+    unavailable: string[];
+}
+
+// The server takes up to this many file ids per request.
+const PREVIEW_BATCH_SIZE = 1000;
+
+// Thumbnail (256) or preview (1024) URLs for a page of files. Files whose
+// preview is still being generated come back in `pending`.
+export async function apiFetchPreviews(fileIds: string[], size: 256 | 1024 = 256): Promise<PreviewsResponse> {
+    const merged: PreviewsResponse = { previews: {}, pending: [], unavailable: [] };
+    for (let start = 0; start < fileIds.length; start += PREVIEW_BATCH_SIZE) {
+        const page = await apiFetch<PreviewsResponse>('/api/files/batch/previews', {
+            method: 'POST',
+            body: JSON.stringify({ file_ids: fileIds.slice(start, start + PREVIEW_BATCH_SIZE), size })
+        });
+        Object.assign(merged.previews, page.previews);
+        merged.pending.push(...page.pending);
+        merged.unavailable.push(...page.unavailable);
+    }
+    return merged;
+}
+
+// URL that streams a file through the API with the session cookie. Usable
+// directly as a <video>/<audio> src: the server answers Range requests, so
+// seeking and resumed downloads fetch only the bytes they need.
+export function fileContentUrl(fileId: string, disposition: 'inline' | 'attachment' = 'inline'): string {
+    return `${API_BASE_URL}/api/files/${encodeURIComponent(fileId)}/content?disposition=${disposition}`;
+}
+
+// URL of a ZIP of the given files, of those matching a filename search, or
+// with neither of every file in the org. The server streams the archive, so
+// a plain link downloads even very large exports.
+export function archiveUrl(options: { fileIds?: string[]; search?: string } = {}): string {
+    const params = new URLSearchParams();
+    options.fileIds?.forEach((fileId) => params.append('file_ids', fileId));
+    if (options.search) params.set('search', options.search);
+    const query = params.toString();
+    return `${API_BASE_URL}/api/files/archive${query ? `?${query}` : ''}`;
+}
+
+// Files up to this size are hashed in the browser so the server can skip
+// duplicates and let S3 verify the bytes. Matches the server's part size.
+const DIRECT_UPLOAD_HASH_LIMIT = 8 * 1024 * 1024;
+const DIRECT_UPLOAD_CONCURRENCY = 4;
+
+type UploadInitiateResponse<T> =
+    | { status: 'completed'; file: T }
+    | { status: 'proxy'; upload_url: string; resumable_url: string }
+    | { status: 'pending'; session_id: string; mode: 'single'; url: string; headers: Record<string, string> }
+    | {
+        status: 'pending';
+        session_id: string;
+        mode: 'multipart';
+        part_size: number;
+        parts: { part_number: number; url: string }[];
+    };
+
+async function digestHex(data: BufferSource): Promise<string> {
+    const digest = await crypto.subtle.digest('SHA-256', data);
+    return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function sha256Hex(file: File): Promise<string | undefined> {
+    if (file.size > DIRECT_UPLOAD_HASH_LIMIT || !globalThis.crypto?.subtle) return undefined;
+    return digestHex(await file.arrayBuffer());
+}
+
+interface SendOptions {
+    headers?: Record<string, string>;
+    withCredentials?: boolean;
+    onProgress?: (loaded: number) => void;
+}
+
+function sendWithProgress(method: string, url: string, body: Blob, options: SendOptions = {}): Promise<XMLHttpRequest> {
+    return new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        xhr.open(method, url);
+        xhr.withCredentials = Boolean(options.withCredentials);
+        Object.entries(options.headers || {}).forEach(([name, value]) => xhr.setRequestHeader(name, value));
+
+        xhr.upload.onprogress = (event) => options.onProgress?.(event.loaded);
+
+        xhr.onload = () => {
+            if (xhr.status >= 200 && xhr.status < 300) {
+                options.onProgress?.(body.size);
+                resolve(xhr);
+                return;
+            }
+            reject(new Error(getErrorMessageFromBody(xhr.responseText, xhr.status)));
+        };
+
+        xhr.onerror = () => reject(new Error('Network error during upload'));
+        xhr.send(body);
+    });
+}
+
+// PUTs straight to a presigned storage URL and resolves with the ETag.
+async function putToStorage(
+    url: string,
+    body: Blob,
+    headers: Record<string, string>,
+    onProgress: (loaded: number) => void
+): Promise<string> {
+    const xhr = await sendWithProgress('PUT', url, body, { headers, onProgress });
+    return xhr.getResponseHeader('ETag') || '';
+}
+
+const RESUMABLE_MAX_RETRIES = 5;
+
+async function getUploadOffset(uploadUrl: string): Promise<number> {
+    const res = await fetch(`${API_BASE_URL}${uploadUrl}`, { method: 'HEAD', credentials: 'include' });
+    if (!res.ok) throw new Error(`Could not resume upload: ${res.status}`);
+    return Number(res.headers.get('Upload-Offset') || 0);
+}
+
+// Streams the file through the API in a resumable session: after a dropped
+// connection it asks the server how much arrived and sends only the rest.
+export async function apiResumableUpload<T>(path: string, file: File, options: UploadFileOptions = {}): Promise<T> {
+    const report = (loaded: number) => options.onProgress?.(Math.min(loaded, file.size), file.size);
+    const created = await apiFetch<{ status: 'pending'; upload_url: string } | { status: 'completed'; file: T }>(path, {
+        method: 'POST',
+        body: JSON.stringify({ filename: file.name, content_type: file.type || 'application/octet-stream', size: file.size })
+    });
+    if (created.status === 'completed') {
+        report(file.size);
+        return created.file;
+    }
+
+    let offset = 0;
+    let failures = 0;
+    for (;;) {
+        try {
+            const start = offset;
+            const xhr = await sendWithProgress('PATCH', `${API_BASE_URL}${created.upload_url}`, file.slice(start), {
+                headers: { 'Upload-Offset': String(start), 'Content-Type': 'application/offset+octet-stream' },
+                withCredentials: true,
+                onProgress: (loaded) => report(start + loaded)
+            });
+            if (xhr.status === 200) return JSON.parse(xhr.responseText) as T;
+            offset = Number(xhr.getResponseHeader('Upload-Offset') || start);
+            failures = 0;
+        } catch (error) {
+            failures += 1;
+            if (failures > RESUMABLE_MAX_RETRIES) throw error;
+            await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** failures));
+            offset = await getUploadOffset(created.upload_url).catch(() => offset);
+        }
+    }
+}
+
+// Uploads a file straight to storage: the API only hands out presigned URLs
+// and records the file once the bytes have landed. Falls back to posting the
+// file through the API when the storage backend cannot accept direct uploads.
+export async function apiDirectUpload<T>(file: File, options: UploadFileOptions = {}): Promise<T> {
+    const report = (loaded: number) => options.onProgress?.(Math.min(loaded, file.size), file.size);
+    const initiated = await apiFetch<UploadInitiateResponse<T>>('/api/files/uploads/initiate', {
+        method: 'POST',
+        body: JSON.stringify({
+            filename: file.name,
+            content_type: file.type || 'application/octet-stream',
+            size: file.size,
+            sha256: await sha256Hex(file)
+        })
+    });
+
+    if (initiated.status === 'completed') {
+        report(file.size);
+        return initiated.file;
+    }
+    if (initiated.status === 'proxy') {
+        if (file.size > DIRECT_UPLOAD_HASH_LIMIT) {
+            return apiResumableUpload<T>(initiated.resumable_url, file, options);
+        }
+        const formData = new FormData();
+        formData.append('file', file);
+        return apiUploadFile<T>(initiated.upload_url, formData, options);
+    }
+
+    const sessionPath = `/api/files/uploads/${initiated.session_id}`;
+    try {
+        if (initiated.mode === 'single') {
+            await putToStorage(initiated.url, file, initiated.headers, report);
+            return await apiFetch<T>(`${sessionPath}/complete`, { method: 'POST', body: '{}' });
+        }
+
+        const { part_size: partSize } = initiated;
+        const loadedByPart = new Map<number, number>();
+        const uploaded: { part_number: number; etag: string }[] = [];
+        const queue = [...initiated.parts];
+        const worker = async () => {
+            for (let part = queue.shift(); part; part = queue.shift()) {
+                const { part_number: partNumber, url } = part;
+                const start = (partNumber - 1) * partSize;
+                const onProgress = (loaded: number) => {
+                    loadedByPart.set(partNumber, loaded);
+                    report(Array.from(loadedByPart.values()).reduce((sum, n) => sum + n, 0));
+                };
+                // A dropped part is retried on its own; finished parts are kept.
+                for (let attempt = 0; ; attempt++) {
+                    try {
+                        const etag = await putToStorage(url, file.slice(start, start + partSize), {}, onProgress);
+                        uploaded.push({ part_number: partNumber, etag });
+                        break;
+                    } catch (error) {
+                        if (attempt >= RESUMABLE_MAX_RETRIES) throw error;
+                        await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** attempt));
+                    }
+                }
+            }
+        };
+        await Promise.all(Array.from({ length: DIRECT_UPLOAD_CONCURRENCY }, worker));
+
+        return await apiFetch<T>(`${sessionPath}/complete`, {
+            method: 'POST',
+            body: JSON.stringify({ parts: uploaded })
+        });
+    } catch (error) {
+        await apiFetch(sessionPath, { method: 'DELETE' }).catch(() => undefined);
+        throw error;
+    }
+}
+
+// Content-defined chunking for file versions, cutting at exactly the same
+// offsets as app/services/chunking.py: a chunk ends after a byte where the
+// gear rolling hash has its top 20 bits clear, between 256 KB and 4 MB long.
+const CHUNK_MIN_SIZE = 256 * 1024;
+const CHUNK_MAX_SIZE = 4 * 1024 * 1024;
+const CHUNK_MASK = 0xfffff000;
+const CHUNK_READ_SIZE = 16 * 1024 * 1024;
+
+function mix32(value: number): number {
+    value ^= value >>> 16;
+    value = Math.imul(value, 0x85ebca6b);
+    value ^= value >>> 13;
+    value = Math.imul(value, 0xc2b2ae35);
+    return (value ^ (value >>> 16)) >>> 0;
+}
+
+const GEAR = Uint32Array.from({ length: 256 }, (_, i) => mix32(i + 1));
+
+// [start, end) byte offsets of each chunk of the file.
+async function chunkBoundaries(file: Blob): Promise<[number, number][]> {
+    const chunks: [number, number][] = [];
+    let hash = 0;
+    let start = 0;
+    for (let offset = 0; offset < file.size; offset += CHUNK_READ_SIZE) {
+        const bytes = new Uint8Array(await file.slice(offset, offset + CHUNK_READ_SIZE).arrayBuffer());
+        for (let i = 0; i < bytes.length; i++) {
+            hash = ((hash << 1) + GEAR[bytes[i]]) >>> 0;
+            const end = offset + i + 1;
+            if ((end - start >= CHUNK_MIN_SIZE && (hash & CHUNK_MASK) === 0) || end - start >= CHUNK_MAX_SIZE) {
+                chunks.push([start, end]);
+                start = end;
+            }
+        }
+    }
+    if (start < file.size) chunks.push([start, file.size]);
+    return chunks;
+}
+
+export interface FileVersion {
+    ver_no: number;
+    file_size: number | null;
+    created_at: string | null;
+    changelog: string | null;
+}
+
+// Uploads a new version of a file. Only the chunks the server does not
+// already store are sent, so an edit to a large file costs about the size of
+// the edit; progress is reported against those bytes.
+export async function apiUploadVersion(
+    fileId: string,
+    file: File,
+    changelog = '',
+    options: UploadFileOptions = {}
+): Promise<FileVersion> {
+    const basePath = `/api/files/${fileId}/versions`;
+    const chunks = await chunkBoundaries(file);
+    const hashes: string[] = [];
+    for (const [start, end] of chunks) {
+        hashes.push(await digestHex(await file.slice(start, end).arrayBuffer()));
+    }
+
+    const { missing } = chunks.length
+        ? await apiFetch<{ missing: string[] }>(`${basePath}/chunks/missing`, {
+            method: 'POST',
+            body: JSON.stringify({ chunks: hashes })
+        })
+        : { missing: [] };
+    const wanted = new Set(missing);
+    const pending = new Map<string, [number, number]>();
+    chunks.forEach((range, i) => {
+        if (wanted.has(hashes[i])) pending.set(hashes[i], range);
+    });
+    const total = Array.from(pending.values()).reduce((sum, [start, end]) => sum + end - start, 0);
+    let sent = 0;
+    for (const [hash, [start, end]] of pending) {
+        await sendWithProgress('PUT', `${API_BASE_URL}${basePath}/chunks/${hash}`, file.slice(start, end), {
+            headers: { 'Content-Type': 'application/octet-stream' },
+            withCredentials: true,
+            onProgress: (loaded) => options.onProgress?.(sent + loaded, total)
+        });
+        sent += end - start;
+    }
+
+    return apiFetch<FileVersion>(basePath, {
+        method: 'POST',
+        body: JSON.stringify({ chunks: hashes, changelog })
+    });
+}
@@ -1,9 +1,9 @@
-import React, { useState, useEffect, useRef, useCallback, useMemo } from 'react';
+import React, { useState, useEffect, useRef, useCallback } from 'react';
 import FileList, { type FileData } from './FileList';
 import FileModal from './FileModal';
 import type { UserData } from './Auth';
-import { Loader2 } from 'lucide-react';
-import { apiFetch, apiUploadFile } from '../api/client';
+import { Download, Loader2 } from 'lucide-react';
+import { apiDirectUpload, apiFetch, archiveUrl } from '../api/client';
 import DashboardHeader from './DashboardHeader';
 import DashboardSidebar from './DashboardSidebar';
 import UploadArea from './UploadArea';
@@ -18,6 +18,7 @@ interface DashboardProps {
 // Constants
 const MOBILE_BREAKPOINT = 1024;
 const STORAGE_LIMIT_BYTES = 1 * 1024 * 1024 * 1024;
+const FILES_PAGE_SIZE = 500;
 
 // Utility functions
 const formatFileSize = (bytes: number): string => {
@@ -39,6 +40,10 @@ const mapFileType = (filename: string, mimeType?: string): string => {
 
 const clampProgress = (value: number): number => Math.min(100, Math.max(0, value));
 
+// Listing order: newest first, ties broken by id, as the API pages them.
+const isOlder = (file: FileData, than: FileData): boolean =>
+    file.uploaded_at < than.uploaded_at || (file.uploaded_at === than.uploaded_at && file.id < than.id);
+
 export default function Dashboard({ user, onLogout }: DashboardProps) {
     // State management
     const [sidebarOpen, setSidebarOpen] = useState(false);
@@ -46,7 +51,10 @@ export default function Dashboard({ user, onLogout }: DashboardProps) {
     const [isMobile, setIsMobile] = useState(false);
     const [selectedFile, setSelectedFile] = useState<FileData | null>(null);
     const [files, setFiles] = useState<FileData[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
+    const [usage, setUsage] = useState<{ used: number; limit: number }>({ used: 0, limit: STORAGE_LIMIT_BYTES });
     const [uploading, setUploading] = useState(false);
     const [uploadProgress, setUploadProgress] = useState(0);
     const [dragActive, setDragActive] = useState(false);
@@ -56,6 +64,8 @@ export default function Dashboard({ user, onLogout }: DashboardProps) {
     const fileInputRef = useRef<HTMLInputElement>(null);
     const sidebarRef = useRef<HTMLDivElement>(null);
     const hasLoadedRef = useRef(false);
+    // Set once "Load more" has been used; refreshes then keep the older pages.
+    const loadedMoreRef = useRef(false);
     // Check viewport size
     const checkMobile = useCallback(() => {
         const mobile = window.innerWidth < MOBILE_BREAKPOINT;
@@ -82,11 +92,6 @@ export default function Dashboard({ user, onLogout }: DashboardProps) {
         }));
     }, []);
 
-    const totalUsedBytes = useMemo(
-        () => files.reduce((sum, f: any) => sum + (typeof f.raw_size === 'number' ? f.raw_size : 0), 0),
-        [files]
-    );
-
     // Fetch files from database
     const fetchFiles = useCallback(async (silent: boolean = false) => {
         try {
@@ -94,9 +99,23 @@ export default function Dashboard({ user, onLogout }: DashboardProps) {
                 setLoading(true);
             }
 
-            const data = await apiFetch<any[]>(`/api/files`);
-            const safeData = Array.isArray(data) ? data : [];
-            setFiles(transformFileData(safeData));
+            // Only the first page is (re)loaded here; older pages come from
+            // "Load more" and are kept, so a refresh costs one request.
+            const [page, stats] = await Promise.all([
+                apiFetch<{ files?: any[]; next_cursor?: string | null }>(`/api/files?limit=${FILES_PAGE_SIZE}`),
+                apiFetch<{ storage_used?: number; quota?: { limit: number | null } }>('/api/stats').catch(() => null),
+            ]);
+            const firstPage = transformFileData(Array.isArray(page?.files) ? page.files : []);
+            const last = firstPage[firstPage.length - 1];
+            if (loadedMoreRef.current && last) {
+                setFiles(prev => [...firstPage, ...prev.filter(f => isOlder(f, last))]);
+            } else {
+                setFiles(firstPage);
+                setNextCursor(page?.next_cursor ?? null);
+            }
+            if (stats) {
+                setUsage({ used: stats.storage_used ?? 0, limit: stats.quota?.limit ?? STORAGE_LIMIT_BYTES });
+            }
             hasLoadedRef.current = true;
         } catch (error) {
             console.error('Error fetching files:', error);
@@ -110,6 +129,28 @@ export default function Dashboard({ user, onLogout }: DashboardProps) {
         }
     }, [user.org_id, transformFileData]);
 
+    const loadMore = useCallback(async () => {
+        if (!nextCursor) return;
+        try {
+            setLoadingMore(true);
+            const page = await apiFetch<{ files?: any[]; next_cursor?: string | null }>(
+                `/api/files?limit=${FILES_PAGE_SIZE}&cursor=${encodeURIComponent(nextCursor)}`
+            );
+            const more = transformFileData(Array.isArray(page?.files) ? page.files : []);
+            loadedMoreRef.current = true;
+            setFiles(prev => {
+                const seen = new Set(prev.map(f => f.id));
+                return [...prev, ...more.filter(f => !seen.has(f.id))];
+            });
+            setNextCursor(page?.next_cursor ?? null);
+        } catch (error) {
+            console.error('Error loading more files:', error);
+            setToast({ message: 'Failed to load more files', type: 'error' });
+        } finally {
+            setLoadingMore(false);
+        }
+    }, [nextCursor, transformFileData]);
+
     // Initial load and realtime setup
     useEffect(() => {
         fetchFiles();
@@ -187,9 +228,7 @@ export default function Dashboard({ user, onLogout }: DashboardProps) {
                 const fileWeight = totalBytes > 0 ? file.size : 1;
                 let currentFileLoaded = 0;
 
-                const formData = new FormData();
-                formData.append('file', file);
-                await apiUploadFile(`/api/files/upload`, formData, {
+                await apiDirectUpload(file, {
                     onProgress: (loaded) => {
                         currentFileLoaded = Math.min(loaded, fileWeight);
                         const aggregateLoaded = uploadedBytesSoFar + currentFileLoaded;
@@ -396,8 +435,8 @@ export default function Dashboard({ user, onLogout }: DashboardProps) {
                 sidebarCollapsed={sidebarCollapsed}
                 sidebarRef={sidebarRef}
                 setSidebarOpen={setSidebarOpen}
-                usedBytes={totalUsedBytes}
-                limitBytes={STORAGE_LIMIT_BYTES}
+                usedBytes={usage.used}
+                limitBytes={usage.limit}
                 formatBytes={formatFileSize}
             />
 
@@ -452,6 +491,13 @@ export default function Dashboard({ user, onLogout }: DashboardProps) {
                         <div className="px-4 sm:px-6 py-3 sm:py-4 border-b border-slate-100 flex items-center justify-between">
                             <h2 className="font-semibold text-slate-800 text-sm sm:text-base">My Files</h2>
                             <div className="flex gap-1 sm:gap-2">
+                                <a
+                                    href={archiveUrl()}
+                                    title="Download all files as ZIP"
+                                    className="p-1.5 sm:p-2 text-slate-400 hover:text-slate-600 hover:bg-slate-50 rounded-lg transition-colors"
+                                >
+                                    <Download className="w-4 h-4 sm:w-5 sm:h-5" />
+                                </a>
                                 <button className="p-1.5 sm:p-2 text-slate-400 hover:text-slate-600 hover:bg-slate-50 rounded-lg transition-colors">
                                     <svg className="w-4 h-4 sm:w-5 sm:h-5" fill="none" viewBox="0 0 24 24" stroke="currentColor">
                                         <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M4 6h16M4 12h16M4 18h16" />
@@ -480,6 +526,18 @@ export default function Dashboard({ user, onLogout }: DashboardProps) {
                                 openingFile={openingFile}
                             />
                         )}
+                        {!loading && nextCursor && (
+                            <div className="px-4 sm:px-6 py-3 border-t border-slate-100 text-center">
+                                <button
+                                    onClick={loadMore}
+                                    disabled={loadingMore}
+                                    className="inline-flex items-center gap-2 px-4 py-2 text-sm font-medium text-slate-600 hover:text-slate-800 hover:bg-slate-50 disabled:text-slate-400 rounded-lg transition-colors"
+                                >
+                                    {loadingMore && <Loader2 className="w-4 h-4 animate-spin" />}
+                                    {loadingMore ? 'Loading...' : 'Load more'}
+                                </button>
+                            </div>
+                        )}
                     </div>
                 </div>
                 <AppFooter />
@@ -1,4 +1,4 @@
-import React, { useCallback } from 'react';
+import React, { useCallback, useEffect, useState } from 'react';
 import {
     Image,
     FileText,
@@ -10,6 +10,7 @@ import {
     Loader2,
     Trash2
 } from 'lucide-react';
+import { apiFetchPreviews, type FilePreview } from '../api/client';
 
 export interface FileData {
     id: string;
@@ -41,6 +42,10 @@ const FILE_ICONS = {
 } as const;
 
 
+// Thumbnails still being generated are asked for again a few times.
+const PREVIEW_RETRY_DELAY_MS = 3000;
+const PREVIEW_MAX_RETRIES = 5;
+
 const getFileIconConfig = (type: string) => {
     return FILE_ICONS[type as keyof typeof FILE_ICONS] || FILE_ICONS.default;
 };
@@ -61,7 +66,28 @@ export default function FileList({
     onFileDelete,
     openingFile
 }: FileListProps) {
-    
+    const [previews, setPreviews] = useState<Record<string, FilePreview>>({});
+
+    // One batched request for the thumbnails of every file on the page.
+    useEffect(() => {
+        let cancelled = false;
+        let timer: ReturnType<typeof setTimeout> | undefined;
+        const load = async (fileIds: string[], attempt: number) => {
+            if (fileIds.length === 0) return;
+            const result = await apiFetchPreviews(fileIds).catch(() => null);
+            if (cancelled || !result) return;
+            setPreviews((prev) => ({ ...prev, ...result.previews }));
+            if (result.pending.length > 0 && attempt < PREVIEW_MAX_RETRIES) {
+                timer = setTimeout(() => load(result.pending, attempt + 1), PREVIEW_RETRY_DELAY_MS);
+            }
+        };
+        load(files.map((file) => file.id), 0);
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
+    }, [files]);
+
     const handleRowClick = useCallback((file: FileData) => {
         if (onFileOpen) {
             onFileOpen(file);
@@ -102,14 +128,18 @@ export default function FileList({
     }, [onFileDelete]);
 
     
-    const renderFileIcon = useCallback((type: string, isLoading: boolean) => {
+    const renderFileIcon = useCallback((file: FileData, isLoading: boolean) => {
         if (isLoading) {
             return <Loader2 className="w-5 h-5 animate-spin text-slate-600" />;
         }
-        const config = getFileIconConfig(type);
+        const preview = previews[file.id];
+        if (preview) {
+            return <img src={preview.url} alt="" loading="lazy" className="w-full h-full object-cover rounded-xl" />;
+        }
+        const config = getFileIconConfig(file.type);
         const IconComponent = config.icon;
         return <IconComponent className={`w-4 h-4 sm:w-5 sm:h-5 ${config.color}`} />;
-    }, []);
+    }, [previews]);
 
     
     const getFileBgClass = useCallback((type: string) => {
@@ -172,8 +202,8 @@ export default function FileList({
                                 >
                                     <div className="col-span-6 lg:col-span-5">
                                         <div className="flex items-center gap-3 lg:gap-4">
-                                            <div className={`w-10 h-10 lg:w-12 lg:h-12 rounded-xl flex items-center justify-center shadow-sm shrink-0 ${fileBgClass} group-hover:scale-110 group-hover:shadow-md transition-all duration-300`}>
-                                                {renderFileIcon(file.type, isLoading)}
+                                            <div className={`w-10 h-10 lg:w-12 lg:h-12 rounded-xl flex items-center justify-center overflow-hidden shadow-sm shrink-0 ${fileBgClass} group-hover:scale-110 group-hover:shadow-md transition-all duration-300`}>
+                                                {renderFileIcon(file, isLoading)}
                                             </div>
                                             <div className="min-w-0 flex-1">
                                                 <p className="font-semibold text-slate-800 group-hover:text-slate-900 transition-colors truncate text-sm lg:text-base">
@@ -250,8 +280,8 @@ export default function FileList({
                                     onClick={() => handleRowClick(file)}
                                 >
                                     <div className="flex items-start gap-3">
-                                        <div className={`w-12 h-12 rounded-xl flex items-center justify-center shadow-sm shrink-0 ${fileBgClass}`}>
-                                            {renderFileIcon(file.type, isLoading)}
+                                        <div className={`w-12 h-12 rounded-xl flex items-center justify-center overflow-hidden shadow-sm shrink-0 ${fileBgClass}`}>
+                                            {renderFileIcon(file, isLoading)}
                                         </div>
                                         <div className="flex-1 min-w-0">
                                             <div className="flex items-start justify-between gap-2">
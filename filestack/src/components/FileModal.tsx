@@ -1,5 +1,7 @@
 import { X, FileText, Image, FileSpreadsheet, File, User, Calendar, HardDrive } from 'lucide-react';
+import { useEffect, useState } from 'react';
 import type { FileData } from './FileList';
+import { apiFetchPreviews, type FilePreview } from '../api/client';
 
 interface FileModalProps {
     file: FileData & {
@@ -9,6 +11,21 @@ interface FileModalProps {
 }
 
 export default function FileModal({ file, onClose }: FileModalProps) {
+    const [preview, setPreview] = useState<FilePreview | null>(null);
+
+    useEffect(() => {
+        let cancelled = false;
+        setPreview(null);
+        apiFetchPreviews([file.id], 1024)
+            .then((result) => {
+                if (!cancelled) setPreview(result.previews[file.id] ?? null);
+            })
+            .catch(() => {});
+        return () => {
+            cancelled = true;
+        };
+    }, [file.id]);
+
     const formatUploadedAt = (dateString: string): string => {
         const date = new Date(dateString);
         if (Number.isNaN(date.getTime())) return dateString;
@@ -66,9 +83,19 @@ export default function FileModal({ file, onClose }: FileModalProps) {
               
                 <div className="p-8 flex flex-col items-center text-center">
 
-                    <div className={`w-20 h-20 ${getFileBg()} rounded-2xl flex items-center justify-center mb-6`}>
-                        {getFileIcon()}
-                    </div>
+                    {preview ? (
+                        <img
+                            src={preview.url}
+                            alt={file.filename}
+                            width={preview.width ?? undefined}
+                            height={preview.height ?? undefined}
+                            className="max-h-64 w-auto rounded-2xl border border-slate-100 mb-6"
+                        />
+                    ) : (
+                        <div className={`w-20 h-20 ${getFileBg()} rounded-2xl flex items-center justify-center mb-6`}>
+                            {getFileIcon()}
+                        </div>
+                    )}
 
                     <h3 className="text-xl font-bold text-slate-800 mb-6 break-all">
                         {file.filename}
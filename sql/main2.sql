@@ -234,3 +234,187 @@ create table webhookstable (
 );
 
 
+
+--index for keyset pagination of the file list (GET /api/files)
+
+create index if not exists file_data_org_uploaded_idx
+	on file_data (org_id, uploaded_at desc, file_id desc)
+	where is_deleted = false;
+
+--trigram index for filename search (substring + typo tolerant matching)
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+create index if not exists file_data_filename_trgm_idx
+	on file_data using gin (filename gin_trgm_ops)
+	where is_deleted = false;
+
+--creating per-org storage counters, kept in step with file_data by the API
+--and rebuilt periodically by the reconciliation job
+
+create table org_storage_stats (
+
+	org_id uuid NOT NULL,
+	foreign key (org_id) references org(org_id),
+	file_type text NOT NULL default '',
+	primary key (org_id, file_type),
+	file_count bigint NOT NULL default 0,
+	total_bytes bigint NOT NULL default 0,
+	updated_at timestamp default current_timestamp NOT NULL
+);
+
+--indexes for content-addressed storage: dedup lookup by checksum and
+--reference counting by storage path
+
+create index if not exists file_data_org_checksum_idx
+	on file_data (org_id, checksum)
+	where is_deleted = false;
+
+create index if not exists file_data_storage_path_idx
+	on file_data (storage_path)
+	where is_deleted = false;
+
+--creating upload session table for direct-to-storage uploads
+
+create table upload_session (
+
+	session_id uuid NOT NULL,
+	primary key (session_id),
+	org_id uuid NOT NULL,
+	foreign key (org_id) references org(org_id),
+	owner_id uuid NOT NULL,
+	foreign key (owner_id) references user_data(user_id),
+	filename text NOT NULL,
+	file_type text NOT NULL,
+	file_size bigint NOT NULL,
+	checksum text ,
+	storage_path text NOT NULL,
+	upload_id text ,
+	part_size bigint ,
+	status text NOT NULL default 'pending',
+	created_at timestamp default current_timestamp NOT NULL,
+	updated_at timestamp default current_timestamp NOT NULL
+);
+
+--creating upload part table for resumable uploads
+
+create table upload_part (
+
+	session_id uuid NOT NULL,
+	foreign key (session_id) references upload_session(session_id),
+	part_number integer NOT NULL,
+	primary key (session_id, part_number),
+	etag text NOT NULL,
+	part_size bigint NOT NULL
+);
+
+--index for expiring idle upload sessions
+
+create index upload_session_pending_idx on upload_session (updated_at) where status = 'pending';
+
+--file analytics: one row per file, aggregated in memory and merged on an interval
+
+alter table file_analytics add column hll_sketch bytea;
+create unique index file_analytics_file_id_idx on file_analytics (file_id);
+
+--embeddings: binary float32 copy for the in-memory vector index
+
+alter table embedd_index add column vector_f32 bytea;
+create index embedd_index_file_id_idx on embedd_index (file_id);
+
+--content extraction: one metadata row per file, claimed and filled by the extraction workers
+
+alter table metadata add column checksum text;
+alter table metadata add column status text NOT NULL default 'done';
+alter table metadata add column content text;
+create unique index metadata_file_id_idx on metadata (file_id);
+create index if not exists file_data_uploaded_idx on file_data (uploaded_at);
+
+--content search: weighted tsvector over keywords, summary and extracted text, scoped by org
+
+create extension if not exists btree_gin;
+alter table metadata add column org_id uuid;
+alter table metadata add column search_vector tsvector;
+update metadata m set org_id = f.org_id from file_data f where f.file_id = m.file_id;
+create index if not exists metadata_org_search_idx on metadata using gin (org_id, search_vector);
+
+--file versions: chunk manifests in file_md and a per-org content-defined chunk store
+
+alter table file_md add column chunks json;
+alter table file_md add column file_size bigint;
+create unique index if not exists file_md_file_ver_idx on file_md (file_id, ver_no) where chunks is not null;
+
+create table file_chunk (
+
+	org_id uuid NOT NULL,
+	foreign key (org_id) references org(org_id),
+	chunk_hash text NOT NULL,
+	primary key (org_id, chunk_hash),
+	storage_path text NOT NULL,
+	chunk_size integer NOT NULL,
+	ref_count integer NOT NULL default 0,
+	updated_at timestamp default current_timestamp NOT NULL
+);
+
+create index if not exists file_chunk_unreferenced_idx on file_chunk (updated_at) where ref_count <= 0;
+
+--thumbnails and previews: one row per org, content checksum and size, filled by the preview workers
+
+create table derived_asset (
+
+	org_id uuid NOT NULL,
+	foreign key (org_id) references org(org_id),
+	checksum text NOT NULL,
+	size integer NOT NULL,
+	primary key (org_id, checksum, size),
+	status text NOT NULL default 'processing',
+	storage_path text ,
+	content_type text ,
+	width integer ,
+	height integer ,
+	updated_at timestamp default current_timestamp NOT NULL
+);
+
+--storage quota: one row per org with the limit in bytes and counters kept in step by uploads and deletes
+
+create table org_quota (
+
+	org_id uuid NOT NULL,
+	foreign key (org_id) references org(org_id),
+	primary key (org_id),
+	limit_bytes bigint ,
+	used_bytes bigint NOT NULL default 0,
+	reserved_bytes bigint NOT NULL default 0,
+	updated_at timestamp default current_timestamp NOT NULL
+);
+
+--file_data.checksum holds a verified sha256 of the content or null; values
+--that were S3 ETags or other stand-ins are cleared so they are not matched
+
+alter table file_data alter column checksum drop not null;
+update file_data set checksum = null where checksum !~ '^[0-9a-f]{64}$';
+update metadata set checksum = null where checksum !~ '^[0-9a-f]{64}$';
+
+--quota held by proxied uploads while their bytes move to storage; rows of
+--workers that died mid-upload expire and are dropped by the reconciler
+
+create table quota_reservation (
+
+	reservation_id uuid NOT NULL,
+	primary key (reservation_id),
+	org_id uuid NOT NULL,
+	foreign key (org_id) references org(org_id),
+	size bigint NOT NULL,
+	expires_at timestamp NOT NULL
+);
+
+create index if not exists quota_reservation_org_idx on quota_reservation (org_id, expires_at);
+
+--extractions that hit a storage error or a crashed worker are retried a few times
+
+alter table metadata add column attempts integer NOT NULL default 0;
+create index if not exists metadata_retry_idx on metadata (indexed_at) where status = 'retry';
+
+--previews that hit a storage error or a crashed worker are retried a few times
+
+alter table derived_asset add column attempts integer NOT NULL default 0;